@@ -0,0 +1,156 @@
+"""
+Time taken by DecompressionMiddleware to process uncompressed pages (which
+is what it gets most of the time), before and after recognising the formats
+by their magic number, and to extract the compressed samples of
+scrapy/tests/sample_data/compressed.
+
+The old middleware is copied here: it tried to open every response as a tar,
+zip, gzip and bzip2 file in turn.
+"""
+
+import os
+import bz2
+import gzip
+import time
+import zipfile
+import tarfile
+from cStringIO import StringIO
+from tempfile import mktemp
+from optparse import OptionParser
+
+from scrapy.http import Response, HtmlResponse
+from scrapy.spider import BaseSpider
+from scrapy.core.downloader.responsetypes import responsetypes
+from scrapy.contrib_exp.downloadermiddleware.decompression import \
+    DecompressionMiddleware
+
+SAMPLE_DATA = os.path.join(os.path.dirname(os.path.abspath(__file__)), \
+    os.pardir, os.pardir, 'scrapy', 'tests', 'sample_data')
+
+
+class OldDecompressionMiddleware(object):
+
+    def __init__(self):
+        self._formats = {
+            'tar': self._is_tar,
+            'zip': self._is_zip,
+            'gz': self._is_gzip,
+            'bz2': self._is_bzip2
+        }
+
+    def _is_tar(self, response):
+        archive = StringIO(response.body)
+        try:
+            tar_file = tarfile.open(name=mktemp(), fileobj=archive)
+        except tarfile.ReadError:
+            return
+        body = tar_file.extractfile(tar_file.members[0]).read()
+        respcls = responsetypes.from_args(filename=tar_file.members[0].name, body=body)
+        return response.replace(body=body, cls=respcls)
+
+    def _is_zip(self, response):
+        archive = StringIO(response.body)
+        try:
+            zip_file = zipfile.ZipFile(archive)
+        except zipfile.BadZipfile:
+            return
+        namelist = zip_file.namelist()
+        body = zip_file.read(namelist[0])
+        respcls = responsetypes.from_args(filename=namelist[0], body=body)
+        return response.replace(body=body, cls=respcls)
+
+    def _is_gzip(self, response):
+        archive = StringIO(response.body)
+        try:
+            body = gzip.GzipFile(fileobj=archive).read()
+        except IOError:
+            return
+        respcls = responsetypes.from_args(body=body)
+        return response.replace(body=body, cls=respcls)
+
+    def _is_bzip2(self, response):
+        try:
+            body = bz2.decompress(response.body)
+        except IOError:
+            return
+        respcls = responsetypes.from_args(body=body)
+        return response.replace(body=body, cls=respcls)
+
+    def process_response(self, request, response, spider):
+        if not response.body:
+            return response
+        for fmt, func in self._formats.iteritems():
+            new_response = func(response)
+            if new_response:
+                return new_response
+        return response
+
+
+def html_pages(size):
+    pages = []
+    for dirpath, _, filenames in os.walk(SAMPLE_DATA):
+        for fn in sorted(filenames):
+            if fn.endswith('.html'):
+                body = open(os.path.join(dirpath, fn), 'rb').read()
+                pages.append(HtmlResponse('http://www.example.com/%s' % fn, \
+                    body=body))
+    body = '<html><body>%s</body></html>' % ''.join('<p>Paragraph %d</p>\n' \
+        % n for n in xrange(size // 20))
+    pages.append(HtmlResponse('http://www.example.com/big.html', body=body))
+    return pages
+
+def compressed_samples():
+    samples = []
+    for ext in ['tar', 'zip', 'xml.gz', 'xml.bz2']:
+        fn = os.path.join(SAMPLE_DATA, 'compressed', 'feed-sample1.' + ext)
+        samples.append(Response('http://www.example.com/feed.' + ext, \
+            body=open(fn, 'rb').read()))
+    return samples
+
+def runtest(name, mw, responses, rounds):
+    spider = BaseSpider('example.com')
+    t = time.time()
+    for _ in xrange(rounds):
+        for response in responses:
+            # access the body, as the spider would
+            mw.process_response(None, response, spider).body
+    t = time.time() - t
+    n = rounds * len(responses)
+    print "%-32s %6.2fs (%7d responses/s)" % (name, t, n / t)
+
+def main():
+    o = OptionParser()
+    o.add_option('-s', '--size', type='int', default=500000,
+        metavar='BYTES', help='size of the big uncompressed page')
+    o.add_option('-r', '--rounds', type='int', default=10000,
+        metavar='NUMBER', help='number of times the responses are processed')
+    opts, _ = o.parse_args()
+
+    pages = html_pages(opts.size)
+    samples = compressed_samples()
+    print "== %d uncompressed pages, %d rounds ==" % (len(pages), opts.rounds)
+    runtest('old (try every format)', OldDecompressionMiddleware(), pages, \
+        opts.rounds)
+    runtest('new (magic number)', DecompressionMiddleware(), pages, \
+        opts.rounds)
+    print "== %d compressed samples, %d rounds ==" % (len(samples), opts.rounds)
+    runtest('old (try every format)', OldDecompressionMiddleware(), samples, \
+        opts.rounds)
+    runtest('new (magic number)', DecompressionMiddleware(), samples, \
+        opts.rounds)
+
+if __name__ == '__main__':
+    main()
+
+# Results (on a single core of a 2.x GHz x86-64 box, python 2.7). Each failed
+# attempt of the old middleware is cheap (they fail at the file header), but
+# together they cost ~70us per response, while reading the magic number costs
+# ~3us. Extracting the compressed samples takes about the same time, most of
+# it going to building the new responses:
+#
+# == 8 uncompressed pages, 10000 rounds ==
+# old (try every format)             5.69s (  14060 responses/s)
+# new (magic number)                 0.24s ( 331978 responses/s)
+# == 4 compressed samples, 10000 rounds ==
+# old (try every format)             9.02s (   4435 responses/s)
+# new (magic number)                 8.54s (   4684 responses/s)
@@ -0,0 +1,85 @@
+"""
+Memory usage and throughput of the dupefilter classes.
+
+Each test runs in a forked process which checks N new requests (and then the
+same N requests again) and reports the time taken and the memory (RSS) used by
+the dupefilter.
+"""
+
+import os
+import sys
+import time
+import resource
+from optparse import OptionParser
+
+from scrapy.conf import settings
+from scrapy.http import Request
+from scrapy.spider import BaseSpider
+from scrapy.utils.misc import load_object
+
+TESTCASES = (
+    'scrapy.contrib.dupefilter.RequestFingerprintDupeFilter',
+    'scrapy.contrib.dupefilter.CompactRequestFingerprintDupeFilter',
+    'scrapy.contrib.dupefilter.BloomRequestFingerprintDupeFilter',
+    'scrapy.contrib.dupefilter.DiskRequestFingerprintDupeFilter',
+)
+
+
+def maxrss():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+
+def runtest(clspath, count):
+    spider = BaseSpider('test')
+    df = load_object(clspath)()
+    df.open_spider(spider)
+    rss = maxrss()
+    t = time.time()
+    for n in xrange(count):
+        df.request_seen(spider, Request('http://www.example.com/page/%d' % n))
+    tnew = time.time() - t
+    t = time.time()
+    dupes = 0
+    for n in xrange(count):
+        dupes += df.request_seen(spider, Request('http://www.example.com/page/%d' % n))
+    tseen = time.time() - t
+    used = maxrss() - rss
+    print "%-36s new: %6.1fs (%6d/s)  seen: %6.1fs (%6d/s)  " \
+        "memory: %6.1f MB (%5.1f bytes/request)" % (clspath.split('.')[-1], \
+        tnew, count / tnew, tseen, count / tseen, used, used * 1024 * 1024 / count)
+    assert dupes == count
+    sys.stdout.flush()
+    df.close_spider(spider)
+
+
+def main():
+    o = OptionParser()
+    o.add_option('-n', '--count', type='int', default=1000*1000,
+        metavar='NUMBER', help='number of requests')
+    o.add_option('-e', '--error-rate', type='float', default=None,
+        metavar='RATE', help='false positive rate of the bloom filter')
+    opts, _ = o.parse_args()
+    if opts.error_rate:
+        settings.overrides['DUPEFILTER_BLOOM_ERROR_RATE'] = opts.error_rate
+
+    print "== %d requests ==" % opts.count
+    for clspath in TESTCASES:
+        # fork to measure the memory used by each dupefilter separately
+        pid = os.fork()
+        if pid == 0:
+            runtest(clspath, opts.count)
+            os._exit(0)
+        os.waitpid(pid, 0)
+
+if __name__ == '__main__':
+    main()
+
+# Results (on a single core of a 2.x GHz x86-64 box, python 2.7). Most of the
+# time is spent computing the request fingerprints (canonicalize_url + sha1),
+# which is the same for all dupefilters. Memory includes the transient peak
+# of resizing the hash table / merging a batch.
+#
+# == 1000000 requests ==
+# RequestFingerprintDupeFilter         new: 30.5s (32765/s)  seen: 32.3s (30926/s)  memory: 109.3 MB (114.7 bytes/request)
+# CompactRequestFingerprintDupeFilter  new: 34.3s (29193/s)  seen: 31.3s (31988/s)  memory:  24.3 MB ( 25.5 bytes/request)
+# BloomRequestFingerprintDupeFilter    new: 60.3s (16587/s)  seen: 58.0s (17234/s)  memory:   3.8 MB (  4.0 bytes/request)
+# DiskRequestFingerprintDupeFilter     new: 43.8s (22813/s)  seen: 36.8s (27164/s)  memory:  17.1 MB ( 17.9 bytes/request)
@@ -0,0 +1,113 @@
+"""
+Time taken by SgmlLinkExtractor and LxmlLinkExtractor to extract the links of
+the same pages, with and without restrict_xpaths.
+
+The pages are the ones in scrapy/tests/sample_data plus a generated listing
+page with N items (the sample pages are only a few hundred bytes each). A new
+response is built for each extraction, so the time includes parsing the page,
+except in the "shared tree" runs, where the page was already parsed by the
+selectors of the spider callback (as it happens in CrawlSpider) before the
+extraction is timed.
+"""
+
+import os
+import time
+from optparse import OptionParser
+
+from scrapy.http import HtmlResponse
+from scrapy.selector.lxmlsel import HtmlXPathSelector
+from scrapy.contrib.linkextractors.sgml import SgmlLinkExtractor
+from scrapy.contrib.linkextractors.lxmlparser import LxmlLinkExtractor
+
+SAMPLE_DATA = os.path.join(os.path.dirname(os.path.abspath(__file__)), \
+    os.pardir, os.pardir, 'scrapy', 'tests', 'sample_data')
+
+ITEM = """<div class="item">
+<h2><a href="/item/%(n)d?ref=list&amp;page=1">Item <b>%(n)d</b></a></h2>
+<a href="/item/%(n)d"><img src="/img/%(n)d.jpg"></a>
+<p class="description">Description of item %(n)d, see
+<a href="http://other%(m)d.example.com/review/%(n)d">the review</a>.</p>
+<a href="/cart/add/%(n)d" rel="nofollow">Add to cart</a>
+</div>"""
+
+PAGE = """<html><head><title>Items</title></head><body>
+<div id="menu">%(menu)s</div>
+<div id="items">%(items)s</div>
+</body></html>"""
+
+def sample_pages():
+    for dirpath, _, filenames in os.walk(SAMPLE_DATA):
+        for fn in sorted(filenames):
+            if fn.endswith('.html'):
+                url = 'http://www.example.com/%s' % fn
+                yield url, open(os.path.join(dirpath, fn), 'rb').read()
+
+def listing_page(items):
+    menu = "\n".join('<a href="/category/%d">Category %d</a>' % (n, n) \
+        for n in xrange(50))
+    items = "\n".join(ITEM % {'n': n, 'm': n % 10} for n in xrange(items))
+    return 'http://www.example.com/list', PAGE % {'menu': menu, 'items': items}
+
+def runtest(name, lx, pages, rounds, shared_tree=False):
+    t = 0
+    count = 0
+    for _ in xrange(rounds):
+        for url, body in pages:
+            response = HtmlResponse(url, body=body)
+            if shared_tree:
+                HtmlXPathSelector(response).select('//title')
+            t0 = time.time()
+            count += len(lx.extract_links(response))
+            t += time.time() - t0
+    print "%-32s %6.2fs (%7d links/s)" % (name, t, count / t)
+
+def check(kwargs, pages):
+    for url, body in pages:
+        response = HtmlResponse(url, body=body)
+        assert SgmlLinkExtractor(**kwargs).extract_links(response) == \
+            LxmlLinkExtractor(**kwargs).extract_links(response), url
+
+def main():
+    o = OptionParser()
+    o.add_option('-n', '--items', type='int', default=500,
+        metavar='NUMBER', help='number of items in the listing page')
+    o.add_option('-r', '--rounds', type='int', default=20,
+        metavar='NUMBER', help='number of times the links are extracted')
+    opts, _ = o.parse_args()
+
+    samples = list(sample_pages())
+    tests = [
+        ('sample_data pages', samples, opts.rounds * 500, {}),
+        ('listing page', [listing_page(opts.items)], opts.rounds, {}),
+        ('listing page, restrict_xpaths', [listing_page(opts.items)], \
+            opts.rounds, {'restrict_xpaths': '//div[@class="item"]/h2'}),
+    ]
+    for title, pages, rounds, kwargs in tests:
+        check(kwargs, pages)
+        print "== %s (%d pages, %d rounds) ==" % (title, len(pages), rounds)
+        runtest('SgmlLinkExtractor', SgmlLinkExtractor(**kwargs), pages, rounds)
+        runtest('LxmlLinkExtractor', LxmlLinkExtractor(**kwargs), pages, rounds)
+        runtest('LxmlLinkExtractor, shared tree', LxmlLinkExtractor(**kwargs), \
+            pages, rounds, shared_tree=True)
+
+if __name__ == '__main__':
+    main()
+
+# Results (on a single core of a 2.x GHz x86-64 box, python 2.7, lxml 4.6).
+# Both extractors give the same links (checked before timing). Once the page
+# is parsed, most of the time of LxmlLinkExtractor goes to joining and
+# canonicalizing the urls (the same code SgmlLinkExtractor runs), and only
+# ~10% to walking the tree:
+#
+# == sample_data pages (7 pages, 10000 rounds) ==
+# SgmlLinkExtractor                 15.57s (   8347 links/s)
+# LxmlLinkExtractor                 10.53s (  12348 links/s)
+# LxmlLinkExtractor, shared tree     6.46s (  20120 links/s)
+# == listing page (1 pages, 20 rounds) ==
+# SgmlLinkExtractor                  2.03s (  20215 links/s)
+# LxmlLinkExtractor                  1.60s (  25690 links/s)
+# LxmlLinkExtractor, shared tree     1.11s (  36925 links/s)
+# == listing page, restrict_xpaths (1 pages, 20 rounds) ==
+# SgmlLinkExtractor                  0.81s (  12372 links/s)
+# LxmlLinkExtractor                  0.46s (  21793 links/s)
+# LxmlLinkExtractor, shared tree     0.35s (  28492 links/s)
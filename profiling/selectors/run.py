@@ -0,0 +1,88 @@
+"""
+Time taken by the lxml selectors to run the same XPath expressions over many
+nodes, with and without the compiled XPath cache.
+
+A page with N items is parsed once, and then each of the expressions is
+selected from every item (like a spider extracting the fields of the items
+in a listing page).
+"""
+
+import time
+from optparse import OptionParser
+
+from lxml import etree
+
+from scrapy.http import HtmlResponse
+from scrapy.selector import lxmlsel
+
+EXPRESSIONS = (
+    './/h2/text()',
+    './/h2/a/@href',
+    './/p[@class="price"]/text()',
+    './/p[@class="description"]//text()',
+    './/img/@src',
+    './/ul/li[1]/text()',
+    './/ul/li[last()]/text()',
+    './/span[contains(@class, "rating")]/@title',
+    'count(.//ul/li)',
+    './/a[starts-with(@href, "/cart")]/@href',
+)
+
+ITEM = """<div class="item">
+<h2><a href="/item/%(n)d">Item %(n)d</a></h2>
+<img src="/img/%(n)d.jpg">
+<p class="price">%(n)d.99</p>
+<p class="description">Description of <b>item</b> %(n)d</p>
+<span class="rating stars" title="%(n)d stars"></span>
+<ul><li>one</li><li>two</li><li>three</li></ul>
+<a href="/cart/add/%(n)d">Add to cart</a>
+</div>"""
+
+
+def evaluator_per_select(xpath, namespaces=None):
+    """The XPathSelector.select behaviour before the compiled XPath cache"""
+    return lambda root: etree.XPathEvaluator(root, namespaces=namespaces)(xpath)
+
+def runtest(name, items, rounds):
+    t = time.time()
+    count = 0
+    for _ in xrange(rounds):
+        for item in items:
+            for xpath in EXPRESSIONS:
+                item.select(xpath)
+                count += 1
+    t = time.time() - t
+    print "%-24s %6.2fs (%7d selects/s)" % (name, t, count / t)
+
+def main():
+    o = OptionParser()
+    o.add_option('-n', '--items', type='int', default=1000,
+        metavar='NUMBER', help='number of items in the page')
+    o.add_option('-r', '--rounds', type='int', default=20,
+        metavar='NUMBER', help='number of times the items are extracted')
+    opts, _ = o.parse_args()
+
+    body = "<html><body>%s</body></html>" % "\n".join(ITEM % {'n': n} \
+        for n in xrange(opts.items))
+    hxs = lxmlsel.HtmlXPathSelector(HtmlResponse('http://www.example.com', \
+        body=body))
+    items = hxs.select('//div[@class="item"]')
+
+    print "== %d items, %d expressions, %d rounds ==" % (opts.items, \
+        len(EXPRESSIONS), opts.rounds)
+    compile_xpath = lxmlsel.compile_xpath
+    lxmlsel.compile_xpath = evaluator_per_select
+    runtest('evaluator per select', items, opts.rounds)
+    lxmlsel.compile_xpath = compile_xpath
+    runtest('compiled xpath cache', items, opts.rounds)
+
+if __name__ == '__main__':
+    main()
+
+# Results (on a single core of a 2.x GHz x86-64 box, python 2.7, lxml 4.6).
+# Compiling the expression took most of the time of each select, as the
+# nodes are small:
+#
+# == 1000 items, 10 expressions, 20 rounds ==
+# evaluator per select       4.04s (  49474 selects/s)
+# compiled xpath cache       1.49s ( 133793 selects/s)
@@ -0,0 +1,105 @@
+"""
+Time taken to normalize the urls of the links extracted from a crawl, with
+and without the caches and the canonical url shortcut of scrapy.utils.url.
+
+The corpus simulates the links found in the pages of a site: each page has
+the same navigation links plus links to items (the popular items are linked
+from many pages), with their query arguments in any order. Each link is
+joined with the url of its page, made safe and canonicalized (as done by
+SgmlLinkExtractor), and then canonicalized again to get the fingerprint of
+its request.
+"""
+
+import cgi
+import random
+import time
+import urllib
+import urlparse
+from optparse import OptionParser
+
+from scrapy.utils import url as url_module
+from scrapy.utils.python import unicode_to_str
+from scrapy.utils.datatypes import LruCache
+
+def old_urljoin_rfc(base, ref, encoding='utf-8'):
+    return urlparse.urljoin(unicode_to_str(base, encoding), \
+        unicode_to_str(ref, encoding))
+
+def old_canonicalize_url(url, keep_blank_values=True, keep_fragments=False, \
+        encoding=None):
+    url = unicode_to_str(url, encoding)
+    scheme, netloc, path, params, query, fragment = urlparse.urlparse(url)
+    keyvals = cgi.parse_qsl(query, keep_blank_values)
+    keyvals.sort()
+    query = urllib.urlencode(keyvals)
+    path = urllib.quote(urllib.unquote(path))
+    fragment = '' if not keep_fragments else fragment
+    return urlparse.urlunparse((scheme, netloc.lower(), path, params, query, \
+        fragment))
+
+def corpus(size, items, links_per_page=50):
+    random.seed(0)
+    nav = ['/category/%d/' % n for n in xrange(links_per_page // 2)]
+    links = []
+    page = 0
+    while len(links) < size:
+        page += 1
+        base = 'http://www.example.com/category/%d/page%d.html' % \
+            (page % 20, page)
+        for ref in nav:
+            links.append((base, ref))
+        for _ in xrange(links_per_page - len(nav)):
+            item = int(items * random.random() ** 3)
+            args = ['id=%d' % item, 'ref=list', 'page=%d' % (page % 10)]
+            random.shuffle(args)
+            links.append((base, '../../item?%s' % '&'.join(args)))
+    return links[:size]
+
+def runtest(name, links, urljoin_rfc, canonicalize_url):
+    safe_url_string = url_module.safe_url_string
+    t = time.time()
+    for base, ref in links:
+        url = canonicalize_url(safe_url_string(urljoin_rfc(base, ref)))
+        canonicalize_url(url)
+    t = time.time() - t
+    print "%-20s %6.2fs (%7d links/s)" % (name, t, len(links) / t)
+
+def main():
+    o = OptionParser()
+    o.add_option('-n', '--links', type='int', default=1000000,
+        metavar='NUMBER', help='number of links in the corpus')
+    o.add_option('-i', '--items', type='int', default=100000,
+        metavar='NUMBER', help='number of different items linked')
+    opts, _ = o.parse_args()
+
+    links = corpus(opts.links, opts.items)
+    print "== %d links, %d different urls ==" % (len(links), \
+        len(set(old_urljoin_rfc(b, r) for b, r in links)))
+    runtest('before', links, old_urljoin_rfc, old_canonicalize_url)
+    caches = url_module._urljoin_cache, url_module._canonicalize_cache
+    url_module._urljoin_cache = url_module._canonicalize_cache = LruCache(2)
+    runtest('canonical shortcut', links, url_module.urljoin_rfc, \
+        url_module.canonicalize_url)
+    url_module._urljoin_cache, url_module._canonicalize_cache = caches
+    runtest('shortcut and caches', links, url_module.urljoin_rfc, \
+        url_module.canonicalize_url)
+
+if __name__ == '__main__':
+    main()
+
+# Results (on a single core of a 2.x GHz x86-64 box, python 2.7). With these
+# many different urls most of the remaining time goes to the urls seen for the
+# first time (and those with arguments out of order), but the canonicalization
+# for the fingerprint is always skipped:
+#
+# == 1000000 links, 408499 different urls ==
+# before                31.10s (  32153 links/s)
+# canonical shortcut    24.93s (  40117 links/s)
+# shortcut and caches   20.93s (  47783 links/s)
+#
+# And with -i 10000:
+#
+# == 1000000 links, 255825 different urls ==
+# before                32.28s (  30981 links/s)
+# canonical shortcut    25.75s (  38828 links/s)
+# shortcut and caches   19.94s (  50159 links/s)
@@ -0,0 +1,87 @@
+from scrapy.command import ScrapyCommand
+from scrapy.conf import settings
+from scrapy.contrib.downloadermiddleware.httpcache import FilesystemCacheStorage
+from scrapy.exceptions import UsageError
+from scrapy.spider import BaseSpider
+from scrapy.stats import stats
+from scrapy.utils.misc import load_object
+
+class Command(ScrapyCommand):
+
+    requires_project = True
+    default_settings = {'LOG_ENABLED': False}
+
+    def syntax(self):
+        return "<migrate|report|prune|compact> [spider ...]"
+
+    def short_desc(self):
+        return "Manage the HTTP cache"
+
+    def long_desc(self):
+        return "Manage the HTTP cache of the given spiders (or all of them). " \
+            "The migrate subcommand copies the entries from the file system " \
+            "cache storage into the storage set in HTTPCACHE_STORAGE. The " \
+            "report subcommand prints the number of entries and size of the " \
+            "cache, prune removes the entries expired (according to " \
+            "HTTPCACHE_EXPIRATION_SECS) or over HTTPCACHE_MAXSIZE, and " \
+            "compact returns the space freed by them to the file system."
+
+    def run(self, args, opts):
+        if not args:
+            raise UsageError()
+        cmd, names = args[0], args[1:]
+        if cmd == 'migrate':
+            source = FilesystemCacheStorage(settings)
+            target = self._get_storage('store_record')
+            self._run(names or source.list_spiders(), self._migrate, source, \
+                target)
+        elif cmd in ('report', 'prune', 'compact'):
+            storage = self._get_storage(cmd)
+            self._run(names or storage.list_spiders(), \
+                getattr(self, '_' + cmd), storage)
+        else:
+            raise UsageError()
+
+    def _get_storage(self, method):
+        storage = load_object(settings['HTTPCACHE_STORAGE'])(settings)
+        if not hasattr(storage, method):
+            raise UsageError("HTTPCACHE_STORAGE doesn't support this " \
+                "subcommand: %s" % settings['HTTPCACHE_STORAGE'], \
+                print_help=False)
+        return storage
+
+    def _run(self, names, function, *args):
+        for name in names:
+            spider = BaseSpider(name)
+            stats.open_spider(spider)
+            try:
+                print "%s: %s" % (name, function(spider, *args))
+            finally:
+                stats.close_spider(spider, 'finished')
+
+    def _migrate(self, spider, source, target):
+        target.open_spider(spider)
+        count = 0
+        for record in source.iter_records(spider):
+            target.store_record(spider, record)
+            count += 1
+        target.close_spider(spider)
+        return "%d entries migrated" % count
+
+    def _report(self, spider, storage):
+        report = storage.report(spider)
+        msg = "%(entries)d entries (%(expired)d expired), %(size)d bytes" % report
+        if 'file_size' in report:
+            msg += " (%d bytes on disk)" % report['file_size']
+        storage.close_spider(spider)
+        return msg
+
+    def _prune(self, spider, storage):
+        removed = storage.prune(spider)
+        storage.close_spider(spider)
+        return "%d entries removed" % removed
+
+    def _compact(self, spider, storage):
+        before, after = storage.compact(spider)
+        storage.close_spider(spider)
+        return "%d bytes on disk (%d before compacting)" % (after, before)
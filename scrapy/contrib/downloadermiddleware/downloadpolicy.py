@@ -0,0 +1,75 @@
+"""
+Download policy middleware
+
+See documentation in docs/topics/downloader-middleware.rst
+"""
+
+from fnmatch import fnmatch
+
+from scrapy.exceptions import NotConfigured, IgnoreRequest
+from scrapy.utils.python import WeakKeyCache
+
+
+class DownloadPolicyMiddleware(object):
+    """Abort downloads, right after receiving the response headers, when
+    the response is too big or its status or Content-Type are not wanted.
+    Responses without Content-Length are aborted by the downloader once
+    their body grows over the download_maxsize request meta key, which this
+    middleware sets from DOWNLOAD_MAXSIZE."""
+
+    def __init__(self):
+        self._cache = WeakKeyCache(self._spider_policy)
+
+    @classmethod
+    def from_settings(cls, settings):
+        # checking the headers of every response has a cost, so policies set
+        # only by some spiders must be enabled in the project settings too
+        if not (settings.getint('DOWNLOAD_MAXSIZE') or \
+                settings.getlist('DOWNLOAD_MIMETYPES_ALLOWED') or \
+                settings.getlist('DOWNLOAD_MIMETYPES_DENIED') or \
+                settings.getlist('DOWNLOAD_STATUS_DENIED') or \
+                settings.getbool('DOWNLOAD_POLICY_ENABLED')):
+            raise NotConfigured
+        return cls()
+
+    def _spider_policy(self, spider):
+        s = spider.settings
+        return (s.getint('DOWNLOAD_MAXSIZE'),
+            [x.lower() for x in s.getlist('DOWNLOAD_MIMETYPES_ALLOWED')],
+            [x.lower() for x in s.getlist('DOWNLOAD_MIMETYPES_DENIED')],
+            [int(x) for x in s.getlist('DOWNLOAD_STATUS_DENIED')])
+
+    def process_request(self, request, spider):
+        maxsize = self._cache[spider][0]
+        if maxsize:
+            request.meta.setdefault('download_maxsize', maxsize)
+
+    def process_headers(self, request, response, spider):
+        maxsize, allowed, denied, status_denied = self._cache[spider]
+        maxsize = request.meta.get('download_maxsize', maxsize)
+        if response.status in status_denied:
+            raise IgnoreRequest("Aborted download of %s: status %d denied" % \
+                (request, response.status))
+        if maxsize:
+            try:
+                length = int(response.headers.get('Content-Length'))
+            except (TypeError, ValueError):
+                length = None
+            if length > maxsize:
+                raise IgnoreRequest("Aborted download of %s: size (%d) " \
+                    "larger than download max size (%d)" % (request, length, \
+                    maxsize))
+        if allowed or denied:
+            mimetype = response.headers.get('Content-Type', '').split(';')[0]
+            mimetype = mimetype.strip().lower()
+            if (allowed and not _match(mimetype, allowed)) or \
+                    _match(mimetype, denied):
+                raise IgnoreRequest("Aborted download of %s: Content-Type " \
+                    "%r not allowed" % (request, mimetype))
+
+
+def _match(mimetype, patterns):
+    for pattern in patterns:
+        if fnmatch(mimetype, pattern):
+            return True
+    return False
@@ -1,12 +1,24 @@
 from __future__ import with_statement
 
 import os
-from os.path import join, exists
+import zlib
+import shutil
+import errno
+import hashlib
+import sqlite3
+import threading
+from collections import deque
+from os.path import join, exists, isdir
 from time import time
+from rfc822 import parsedate_tz, mktime_tz
+from email.Utils import formatdate
 import cPickle as pickle
 
+from twisted.internet import reactor, defer
+from twisted.python.threadpool import ThreadPool
+
 from scrapy.xlib.pydispatch import dispatcher
-from scrapy import signals
+from scrapy import signals, log
 from scrapy.http import Headers
 from scrapy.exceptions import NotConfigured, IgnoreRequest
 from scrapy.core.downloader.responsetypes import responsetypes
@@ -14,7 +26,9 @@ from scrapy.utils.request import request_fingerprint
 from scrapy.utils.http import headers_dict_to_raw, headers_raw_to_dict
 from scrapy.utils.httpobj import urlparse_cached
 from scrapy.utils.misc import load_object
+from scrapy.utils.defer import defer_to_threadpool
 from scrapy.utils.project import data_path
+from scrapy.stats import stats
 from scrapy import conf
 
 
@@ -24,39 +38,237 @@ class HttpCacheMiddleware(object):
         if not settings.getbool('HTTPCACHE_ENABLED'):
             raise NotConfigured
         self.storage = load_object(settings['HTTPCACHE_STORAGE'])(settings)
+        if settings.getint('HTTPCACHE_THREADS'):
+            self.storage = ThreadedCacheStorage(self.storage, settings)
+        self.policy = load_object(settings['HTTPCACHE_POLICY'])(settings)
         self.ignore_missing = settings.getbool('HTTPCACHE_IGNORE_MISSING')
-        self.ignore_schemes = settings.getlist('HTTPCACHE_IGNORE_SCHEMES')
-        self.ignore_http_codes = map(int, settings.getlist('HTTPCACHE_IGNORE_HTTP_CODES'))
         dispatcher.connect(self.spider_opened, signal=signals.spider_opened)
         dispatcher.connect(self.spider_closed, signal=signals.spider_closed)
+        if hasattr(self.storage, 'prefetch_response'):
+            dispatcher.connect(self.request_scheduled, \
+                signal=signals.request_scheduled)
 
     def spider_opened(self, spider):
-        self.storage.open_spider(spider)
+        return self.storage.open_spider(spider)
 
     def spider_closed(self, spider):
-        self.storage.close_spider(spider)
+        return self.storage.close_spider(spider)
+
+    def request_scheduled(self, request, spider):
+        if self.is_cacheable(request):
+            self.storage.prefetch_response(spider, request)
 
     def process_request(self, request, spider):
         if not self.is_cacheable(request):
             return
+        # storages may return a deferred, to avoid blocking the reactor
         response = self.storage.retrieve_response(spider, request)
-        if response and self.is_cacheable_response(response):
-            response.flags.append('cached')
+        if isinstance(response, defer.Deferred):
+            return response.addCallback(self._process_cached_response, \
+                request, spider)
+        return self._process_cached_response(response, request, spider)
+
+    def _process_cached_response(self, response, request, spider):
+        if response is None or not self.is_cacheable_response(response):
+            if self.ignore_missing:
+                raise IgnoreRequest("Ignored request not in cache: %s" % request)
+            return
+        response.flags.append('cached')
+        if self.policy.is_cached_response_fresh(response, request):
             return response
-        elif self.ignore_missing:
-            raise IgnoreRequest("Ignored request not in cache: %s" % request)
+        # download it again, keeping the cached response in case the server
+        # says it's still valid
+        self.policy.set_conditional_validators(request, response)
+        request.meta['cached_response'] = response
 
     def process_response(self, request, response, spider):
-        if self.is_cacheable(request) and self.is_cacheable_response(response):
-            self.storage.store_response(spider, request, response)
+        if 'cached' in response.flags: # returned by process_request
+            return response
+        cachedresponse = request.meta.pop('cached_response', None)
+        if cachedresponse is not None and \
+                self.policy.is_cached_response_valid(cachedresponse, response, request):
+            cachedresponse = self.policy.refresh_cached_response(cachedresponse, \
+                response, request)
+            self._store_response(spider, request, cachedresponse)
+            return cachedresponse
+        if self.is_cacheable(request) and self.is_cacheable_response(response, request):
+            self._store_response(spider, request, response)
         return response
 
-    def is_cacheable_response(self, response):
-        return response.status not in self.ignore_http_codes
+    def process_exception(self, request, exception, spider):
+        # the request may have been ignored by a previous middleware, before
+        # retrieving the response read ahead for it
+        if hasattr(self.storage, 'discard_prefetched'):
+            self.storage.discard_prefetched(spider, request)
+
+    def _store_response(self, spider, request, response):
+        dfd = self.storage.store_response(spider, request, response)
+        if isinstance(dfd, defer.Deferred):
+            # the response goes on without waiting for it to be stored
+            dfd.addErrback(log.err, "Error storing response in HTTP cache", \
+                spider=spider)
+
+    def is_cacheable_response(self, response, request=None):
+        return self.policy.should_cache_response(response, request)
 
     def is_cacheable(self, request):
+        return self.policy.should_cache_request(request)
+
+
+class DummyPolicy(object):
+    """Cache all responses, except the ones ignored through the
+    HTTPCACHE_IGNORE_* settings, and use them for as long as the storage
+    returns them (see HTTPCACHE_EXPIRATION_SECS). This is the default policy.
+    """
+
+    def __init__(self, settings=conf.settings):
+        self.ignore_schemes = settings.getlist('HTTPCACHE_IGNORE_SCHEMES')
+        self.ignore_http_codes = map(int, settings.getlist('HTTPCACHE_IGNORE_HTTP_CODES'))
+
+    def should_cache_request(self, request):
         return urlparse_cached(request).scheme not in self.ignore_schemes
 
+    def should_cache_response(self, response, request):
+        return response.status not in self.ignore_http_codes
+
+    def is_cached_response_fresh(self, cachedresponse, request):
+        return True
+
+    def set_conditional_validators(self, request, cachedresponse):
+        pass
+
+    def is_cached_response_valid(self, cachedresponse, response, request):
+        return True
+
+    def refresh_cached_response(self, cachedresponse, response, request):
+        return cachedresponse
+
+
+class RFC2616Policy(DummyPolicy):
+    """Cache policy following the HTTP/1.1 caching rules (RFC 2616, section
+    13), as a private cache: responses are only cached and reused as allowed
+    by their Cache-Control, Expires, Last-Modified and ETag headers, and stale
+    responses are revalidated with conditional requests. A 304 (Not Modified)
+    response refreshes the cached one, which is returned instead.
+    """
+
+    # freshness lifetime of permanent redirects without explicit expiration
+    MAXAGE = 3600 * 24 * 365
+
+    def should_cache_request(self, request):
+        if not super(RFC2616Policy, self).should_cache_request(request):
+            return False
+        return 'no-store' not in _parse_cachecontrol(request)
+
+    def should_cache_response(self, response, request):
+        if not super(RFC2616Policy, self).should_cache_response(response, request):
+            return False
+        cc = _parse_cachecontrol(response)
+        if 'no-store' in cc or response.status == 304:
+            return False
+        if 'max-age' in cc or 'Expires' in response.headers:
+            return True
+        if response.status in (300, 301):
+            return True # fresh for MAXAGE
+        # other responses are only worth caching if they can be revalidated
+        if response.status in (200, 203, 401):
+            return 'Last-Modified' in response.headers or \
+                'ETag' in response.headers
+        return False
+
+    def is_cached_response_fresh(self, cachedresponse, request):
+        cc = _parse_cachecontrol(cachedresponse)
+        ccreq = _parse_cachecontrol(request)
+        if 'no-cache' in cc or 'no-cache' in ccreq:
+            return False
+        now = time()
+        lifetime = self._compute_freshness_lifetime(cachedresponse, now)
+        reqmaxage = _get_max_age(ccreq)
+        if reqmaxage is not None:
+            lifetime = min(lifetime, reqmaxage)
+        return self._compute_current_age(cachedresponse, now) < lifetime
+
+    def set_conditional_validators(self, request, cachedresponse):
+        if 'Last-Modified' in cachedresponse.headers:
+            request.headers['If-Modified-Since'] = \
+                cachedresponse.headers['Last-Modified']
+        if 'ETag' in cachedresponse.headers:
+            request.headers['If-None-Match'] = cachedresponse.headers['ETag']
+
+    def is_cached_response_valid(self, cachedresponse, response, request):
+        return response.status == 304
+
+    def refresh_cached_response(self, cachedresponse, response, request):
+        # the headers of a 304 response update the cached ones (section
+        # 10.3.5), which renews its freshness through the Date, Expires and
+        # Cache-Control headers
+        headers = cachedresponse.headers.copy()
+        for name in response.headers:
+            if name.lower() not in ('content-length', 'content-encoding', \
+                    'transfer-encoding'):
+                headers.setlist(name, response.headers.getlist(name))
+        if 'Date' not in response.headers:
+            headers['Date'] = formatdate(usegmt=True)
+        return cachedresponse.replace(headers=headers)
+
+    def _compute_freshness_lifetime(self, response, now):
+        # section 13.2.4
+        maxage = _get_max_age(_parse_cachecontrol(response))
+        if maxage is not None:
+            return maxage
+        date = _parse_date(response.headers.get('Date')) or now
+        if 'Expires' in response.headers:
+            # invalid dates (like "0") mean already expired
+            expires = _parse_date(response.headers['Expires']) or 0
+            return max(0, expires - date)
+        # heuristic expiration (section 13.2.4): 10% of the time since the
+        # last modification
+        lastmodified = _parse_date(response.headers.get('Last-Modified'))
+        if lastmodified and lastmodified <= date:
+            return (date - lastmodified) / 10
+        if response.status in (300, 301):
+            return self.MAXAGE
+        return 0
+
+    def _compute_current_age(self, response, now):
+        # section 13.2.3, simplified as the request and response times aren't
+        # stored
+        age = 0
+        date = _parse_date(response.headers.get('Date')) or now
+        if now > date:
+            age = now - date
+        try:
+            age = max(age, int(response.headers.get('Age', 0)))
+        except ValueError:
+            pass
+        return age
+
+
+def _parse_cachecontrol(r):
+    """Return a dict with the directives of the Cache-Control header of the
+    given request or response"""
+    directives = {}
+    for directive in r.headers.getlist('Cache-Control'):
+        for d in directive.split(','):
+            key, _, value = d.strip().partition('=')
+            if key:
+                directives[key.lower()] = value.strip('"') or None
+    return directives
+
+def _get_max_age(cc):
+    try:
+        return max(0, int(cc['max-age']))
+    except (KeyError, TypeError, ValueError):
+        return None
+
+def _parse_date(date):
+    """Return the given HTTP date as seconds since the epoch, or None if it's
+    missing or invalid"""
+    try:
+        return mktime_tz(parsedate_tz(date))
+    except (TypeError, ValueError, OverflowError):
+        return None
+
 
 class FilesystemCacheStorage(object):
 
@@ -92,7 +304,12 @@ class FilesystemCacheStorage(object):
         """Store the given response in the cache."""
         rpath = self._get_request_path(spider, request)
         if not exists(rpath):
-            os.makedirs(rpath)
+            try:
+                os.makedirs(rpath)
+            except OSError, e:
+                # created meanwhile by another thread or process
+                if e.errno != errno.EEXIST:
+                    raise
         metadata = {
             'url': request.url,
             'method': request.method,
@@ -107,12 +324,78 @@ class FilesystemCacheStorage(object):
         with open(join(rpath, 'response_headers'), 'wb') as f:
             f.write(headers_dict_to_raw(response.headers))
         with open(join(rpath, 'response_body'), 'wb') as f:
-            f.write(response.body)
+            for chunk in response.iter_body():
+                f.write(chunk)
         with open(join(rpath, 'request_headers'), 'wb') as f:
             f.write(headers_dict_to_raw(request.headers))
         with open(join(rpath, 'request_body'), 'wb') as f:
             f.write(request.body)
 
+    def iter_records(self, spider):
+        """Iterate over all the cached entries of the given spider, as dicts
+        with the fields accepted by SqliteCacheStorage.store_record()"""
+        for rpath in self._iter_entry_paths(spider):
+            with open(join(rpath, 'pickled_meta'), 'rb') as f:
+                metadata = pickle.load(f)
+            record = {
+                'fingerprint': os.path.basename(rpath),
+                'timestamp': metadata.get('timestamp') or \
+                    os.stat(rpath).st_mtime,
+                'url': metadata['url'],
+                'method': metadata.get('method', 'GET'),
+                'status': metadata['status'],
+                'response_url': metadata.get('response_url') or \
+                    metadata['url'],
+            }
+            for name in ('response_headers', 'response_body', \
+                    'request_headers', 'request_body'):
+                with open(join(rpath, name), 'rb') as f:
+                    record[name] = f.read()
+            yield record
+
+    def list_spiders(self):
+        """Return the names of the spiders with a cache"""
+        if not isdir(self.cachedir):
+            return []
+        return sorted(x for x in os.listdir(self.cachedir) \
+            if isdir(join(self.cachedir, x)))
+
+    def report(self, spider):
+        """Return a dict with the number of entries (and how many of them are
+        expired) and bytes used by the cache of the given spider. This walks
+        the whole spider cache directory."""
+        entries = expired = size = 0
+        for rpath in self._iter_entry_paths(spider):
+            entries += 1
+            if self._is_expired(rpath):
+                expired += 1
+            size += sum(os.path.getsize(join(rpath, x)) for x in os.listdir(rpath))
+        return {'entries': entries, 'expired': expired, 'size': size}
+
+    def prune(self, spider):
+        """Remove the expired entries of the given spider. Return the number
+        of entries removed."""
+        removed = 0
+        for rpath in list(self._iter_entry_paths(spider)):
+            if self._is_expired(rpath):
+                shutil.rmtree(rpath)
+                removed += 1
+                try:
+                    os.rmdir(os.path.dirname(rpath))
+                except OSError:
+                    pass # not empty
+        return removed
+
+    def _iter_entry_paths(self, spider):
+        spiderdir = join(self.cachedir, spider.name)
+        if not isdir(spiderdir):
+            return
+        for prefix in sorted(os.listdir(spiderdir)):
+            for key in sorted(os.listdir(join(spiderdir, prefix))):
+                rpath = join(spiderdir, prefix, key)
+                if exists(join(rpath, 'pickled_meta')): # skip incomplete entries
+                    yield rpath
+
     def _get_request_path(self, spider, request):
         key = request_fingerprint(request)
         return join(self.cachedir, spider.name, key[0:2], key)
@@ -122,8 +405,452 @@ class FilesystemCacheStorage(object):
         metapath = join(rpath, 'pickled_meta')
         if not exists(metapath):
             return # not found
-        mtime = os.stat(rpath).st_mtime
-        if 0 < self.expiration_secs < time() - mtime:
+        if self._is_expired(rpath):
             return # expired
         with open(metapath, 'rb') as f:
             return pickle.load(f)
+
+    def _is_expired(self, rpath):
+        return 0 < self.expiration_secs < time() - os.stat(rpath).st_mtime
+
+
+class SqliteCacheStorage(object):
+    """Cache storage which keeps all the entries of each spider in a single
+    SQLite database (named after the spider) inside HTTPCACHE_DIR, instead of
+    one directory (with six files) per entry.
+
+    Bodies are stored apart from the entries, compressed and addressed by
+    their SHA1 hash, so identical bodies (like error pages) are only stored
+    once.
+
+    The database uses write-ahead logging, so the cache can be read by other
+    processes (for example, other crawls of the same spider) while it's being
+    written. Within a process, it can be used from several threads (see
+    ThreadedCacheStorage), which share one connection per spider.
+
+    If HTTPCACHE_MAXSIZE is set, the least recently used entries are evicted
+    while crawling, to keep the size of each spider cache below it. The size
+    is kept up to date in the database itself (in the meta table), changed
+    within the same transactions as the entries, so it's right even with
+    several processes writing. The access times used for that are written
+    in batches, not to turn every cache hit into a write.
+    """
+
+    # number of access times kept before writing them
+    accessed_batch = 100
+
+    fields = ('fingerprint', 'timestamp', 'url', 'method', 'status', \
+        'response_url', 'response_headers', 'response_body', \
+        'request_headers', 'request_body')
+
+    def __init__(self, settings=conf.settings):
+        self.cachedir = data_path(settings['HTTPCACHE_DIR'])
+        self.expiration_secs = settings.getint('HTTPCACHE_EXPIRATION_SECS')
+        self.compression_level = settings.getint('HTTPCACHE_COMPRESSION_LEVEL')
+        self.maxsize = settings.getint('HTTPCACHE_MAXSIZE')
+        self.dbs = {}
+        self.accessed = {} # spider -> {fingerprint: access time} not written
+        self.lock = threading.RLock()
+
+    def open_spider(self, spider):
+        with self.lock:
+            self._get_db(spider)
+
+    def close_spider(self, spider):
+        with self.lock:
+            conn = self.dbs.pop(spider, None)
+            if conn is not None:
+                self._try_write_accessed(conn, spider)
+                conn.close()
+            self.accessed.pop(spider, None)
+        total = stats.get_value('httpcache/body_bytes', spider=spider)
+        if total:
+            new = stats.get_value('httpcache/new_body_bytes', 0, spider=spider)
+            stored = stats.get_value('httpcache/stored_body_bytes', 0, \
+                spider=spider)
+            stats.set_value('httpcache/dedup_ratio', \
+                round(float(total) / max(new, 1), 2), spider=spider)
+            stats.set_value('httpcache/compression_ratio', \
+                round(float(new) / max(stored, 1), 2), spider=spider)
+
+    def retrieve_response(self, spider, request):
+        """Return response if present in cache, or None otherwise."""
+        key = request_fingerprint(request)
+        with self.lock:
+            conn = self._get_db(spider)
+            row = conn.execute("select timestamp, status, response_url, " \
+                "response_headers, bodies.data, bodies.compressed " \
+                "from responses join bodies on response_body=bodies.hash " \
+                "where fingerprint=?", (key,)).fetchone()
+            if row is None:
+                return # not cached
+            timestamp, status, url, rawheaders, data, compressed = row
+            if 0 < self.expiration_secs < time() - timestamp:
+                return # expired
+            if self.maxsize:
+                # only needed for evicting the least recently used entries
+                accessed = self.accessed.setdefault(spider, {})
+                accessed[key] = time()
+                if len(accessed) >= self.accessed_batch:
+                    self._try_write_accessed(conn, spider)
+        body = zlib.decompress(data) if compressed else str(data)
+        headers = Headers(headers_raw_to_dict(str(rawheaders)))
+        respcls = responsetypes.from_args(headers=headers, url=url)
+        return respcls(url=url, headers=headers, status=status, body=body)
+
+    def store_response(self, spider, request, response):
+        """Store the given response in the cache."""
+        body = ''.join(response.iter_body())
+        record = {
+            'fingerprint': request_fingerprint(request),
+            'timestamp': time(),
+            'url': request.url,
+            'method': request.method,
+            'status': response.status,
+            'response_url': response.url,
+            'response_headers': headers_dict_to_raw(response.headers),
+            'response_body': body,
+            'request_headers': headers_dict_to_raw(request.headers),
+            'request_body': request.body,
+        }
+        # the stats are updated while locked too, as this may be called from
+        # several threads
+        with self.lock:
+            stored = self.store_record(spider, record)
+            stats.inc_value('httpcache/body_bytes', len(body), spider=spider)
+            if stored is not None:
+                stats.inc_value('httpcache/new_body_bytes', len(body), \
+                    spider=spider)
+                stats.inc_value('httpcache/stored_body_bytes', stored, \
+                    spider=spider)
+
+    def store_record(self, spider, record):
+        """Store a cache entry given as a dict with the values of all fields
+        (see FilesystemCacheStorage.iter_records). Return the number of bytes
+        used to store the response body, or None if it was already stored.
+        """
+        record = record.copy()
+        record['response_headers'] = buffer(record['response_headers'])
+        record['request_headers'] = buffer(record['request_headers'])
+        fields = self.fields + ('accessed',)
+        record['accessed'] = record['timestamp']
+        with self.lock:
+            conn = self._get_db(spider)
+            # committed (or rolled back, on errors) by the with statement
+            self._begin(conn, spider)
+            with conn:
+                old = conn.execute("select response_body, request_body from " \
+                    "responses where fingerprint=?", (record['fingerprint'],)).fetchone()
+                if old:
+                    self._delete_entries(conn, [record['fingerprint']], \
+                        collect=False)
+                record['response_body'], stored = self._store_body(conn, \
+                    record['response_body'])
+                record['request_body'], _ = self._store_body(conn, \
+                    record['request_body'])
+                conn.execute("insert into responses (%s) values (%s)" % \
+                    (', '.join(fields), ', '.join('?' * len(fields))), \
+                    [record[x] for x in fields])
+                self._add_size(conn, len(record['response_headers']) + \
+                    len(record['request_headers']))
+                if old:
+                    # the replaced entry bodies may not be used anymore
+                    self._delete_unused_bodies(conn, old)
+                if self.maxsize and self._get_size(conn) > self.maxsize:
+                    self._evict(conn, spider, self.maxsize)
+        return stored
+
+    def list_spiders(self):
+        """Return the names of the spiders with a cache"""
+        if not isdir(self.cachedir):
+            return []
+        return sorted(x[:-3] for x in os.listdir(self.cachedir) \
+            if x.endswith('.db'))
+
+    def report(self, spider):
+        """Return a dict with the number of entries (and how many of them are
+        expired) and bytes used by the cache of the given spider"""
+        with self.lock:
+            conn = self._get_db(spider)
+            entries, = conn.execute("select count(*) from responses").fetchone()
+            expired = 0
+            if self.expiration_secs:
+                expired, = conn.execute("select count(*) from responses " \
+                    "where timestamp < ?", (time() - self.expiration_secs,)).fetchone()
+            return {'entries': entries, 'expired': expired, \
+                'size': self._get_size(conn), 'file_size': self._get_file_size(spider)}
+
+    def prune(self, spider):
+        """Remove the expired entries of the given spider, and the least
+        recently used ones over HTTPCACHE_MAXSIZE. Return the number of
+        entries removed."""
+        with self.lock:
+            conn = self._get_db(spider)
+            self._begin(conn, spider)
+            with conn:
+                removed = 0
+                if self.expiration_secs:
+                    keys = [x for x, in conn.execute("select fingerprint from " \
+                        "responses where timestamp < ?", \
+                        (time() - self.expiration_secs,))]
+                    removed += self._delete_entries(conn, keys)
+                if self.maxsize and self._get_size(conn) > self.maxsize:
+                    removed += self._evict(conn, spider, self.maxsize)
+            return removed
+
+    def compact(self, spider):
+        """Rebuild the database of the given spider, to return the space of
+        the removed entries to the file system. Return the database file size
+        before and after"""
+        with self.lock:
+            conn = self._get_db(spider)
+            before = self._get_file_size(spider)
+            conn.execute("vacuum")
+            conn.execute("pragma wal_checkpoint(truncate)")
+            return before, self._get_file_size(spider)
+
+    def _begin(self, conn, spider):
+        """Start a write transaction, locking the database for other
+        processes until it's committed, and write the pending access times
+        in it"""
+        conn.execute("begin immediate")
+        try:
+            self._write_accessed(conn, spider)
+        except:
+            conn.rollback()
+            raise
+
+    def _write_accessed(self, conn, spider):
+        accessed = self.accessed.get(spider)
+        if accessed:
+            conn.executemany("update responses set accessed=? where " \
+                "fingerprint=?", [(t, k) for k, t in accessed.iteritems()])
+            accessed.clear()
+
+    def _try_write_accessed(self, conn, spider):
+        """Write the pending access times, unless another process is writing
+        to the database. They're written later (with the next stored
+        response) then, as they're not worth failing a request."""
+        try:
+            self._write_accessed(conn, spider)
+            conn.commit()
+        except sqlite3.OperationalError:
+            conn.rollback()
+            accessed = self.accessed.get(spider)
+            if accessed and len(accessed) > 10 * self.accessed_batch:
+                accessed.clear()
+
+    def _get_size(self, conn):
+        return conn.execute("select value from meta where name='size'").fetchone()[0]
+
+    def _add_size(self, conn, delta):
+        """Change the cache size, in the current transaction, so that other
+        processes writing to the database don't lose their changes"""
+        if delta:
+            conn.execute("update meta set value=value+? where name='size'", \
+                (delta,))
+
+    def _evict(self, conn, spider, maxsize):
+        """Remove the least recently used entries, until the cache size is
+        under 90% of the given size (so it's not done again on every store).
+        Return the number of entries removed."""
+        removed, target = 0, maxsize * 0.9
+        while self._get_size(conn) > target:
+            keys = [x for x, in conn.execute("select fingerprint from " \
+                "responses order by accessed limit 100")]
+            if not keys:
+                break
+            for key in keys:
+                removed += self._delete_entries(conn, [key])
+                if self._get_size(conn) <= target:
+                    break
+        if removed:
+            stats.inc_value('httpcache/evicted_entries', removed, spider=spider)
+        return removed
+
+    def _delete_entries(self, conn, keys, collect=True):
+        """Delete the entries with the given fingerprints and, unless collect
+        is False, the bodies not used by other entries. Return the number of
+        entries deleted."""
+        bodies, deleted = set(), 0
+        for key in keys:
+            row = conn.execute("select length(response_headers) + " \
+                "length(request_headers), response_body, request_body " \
+                "from responses where fingerprint=?", (key,)).fetchone()
+            if row is None:
+                continue
+            conn.execute("delete from responses where fingerprint=?", (key,))
+            self._add_size(conn, -row[0])
+            bodies.update(row[1:])
+            deleted += 1
+        if collect:
+            self._delete_unused_bodies(conn, bodies)
+        return deleted
+
+    def _delete_unused_bodies(self, conn, hashes):
+        for key in set(hashes):
+            if conn.execute("select 1 from responses where response_body=? " \
+                    "union all select 1 from responses where request_body=? " \
+                    "limit 1", (key, key)).fetchone():
+                continue
+            row = conn.execute("select length(data) from bodies where hash=?", \
+                (key,)).fetchone()
+            if row:
+                conn.execute("delete from bodies where hash=?", (key,))
+                self._add_size(conn, -row[0])
+
+    def _get_file_size(self, spider):
+        path = self._get_db_path(spider)
+        return sum(os.path.getsize(x) for x in (path, path + '-wal') \
+            if exists(x))
+
+    def _store_body(self, conn, body):
+        """Store the given body, unless it's already stored. Return its hash
+        and the number of bytes stored (None if it was already there)"""
+        key = hashlib.sha1(body).hexdigest()
+        if conn.execute("select 1 from bodies where hash=?", (key,)).fetchone():
+            return key, None
+        data, compressed = body, False
+        if self.compression_level and body:
+            zdata = zlib.compress(body, self.compression_level)
+            # not worth it for small or already compressed bodies
+            if len(zdata) < len(body):
+                data, compressed = zdata, True
+        conn.execute("insert into bodies (hash, data, compressed) " \
+            "values (?, ?, ?)", (key, buffer(data), compressed))
+        self._add_size(conn, len(data))
+        return key, len(data)
+
+    def _get_db(self, spider):
+        conn = self.dbs.get(spider)
+        if conn is not None:
+            return conn
+        if not exists(self.cachedir):
+            os.makedirs(self.cachedir)
+        conn = sqlite3.connect(self._get_db_path(spider), \
+            check_same_thread=False)
+        conn.text_factory = str
+        conn.execute("pragma journal_mode=wal")
+        conn.execute("pragma synchronous=normal")
+        # bodies are referenced by their hash
+        conn.execute("create table if not exists responses (" \
+            "fingerprint text primary key, timestamp real, url text, " \
+            "method text, status integer, response_url text, " \
+            "response_headers blob, response_body text, " \
+            "request_headers blob, request_body text, accessed real)")
+        conn.execute("create table if not exists bodies (" \
+            "hash text primary key, data blob, compressed integer)")
+        conn.execute("create table if not exists meta (" \
+            "name text primary key, value)")
+        for column in ('accessed', 'response_body', 'request_body'):
+            conn.execute("create index if not exists responses_%s " \
+                "on responses (%s)" % (column, column))
+        if conn.execute("select 1 from meta where name='size'").fetchone() \
+                is None:
+            # the cache size is computed once (only needed for caches
+            # created before the meta table), and then kept up to date
+            conn.execute("insert or ignore into meta (name, value) select " \
+                "'size', (select coalesce(sum(length(response_headers) + " \
+                "length(request_headers)), 0) from responses) + (select " \
+                "coalesce(sum(length(data)), 0) from bodies)")
+        conn.commit()
+        self.dbs[spider] = conn
+        return conn
+
+    def _get_db_path(self, spider):
+        return join(self.cachedir, '%s.db' % spider.name)
+
+
+class ThreadedCacheStorage(object):
+    """Wrapper which calls the methods of another cache storage in a bounded
+    pool of threads (of HTTPCACHE_THREADS size) and returns deferreds, so
+    reading and writing the cache doesn't block the reactor (and the other
+    downloads). It's used by the middleware when HTTPCACHE_THREADS is set.
+
+    The responses of the requests queued by the scheduler are read ahead,
+    while they wait there, keeping up to HTTPCACHE_READAHEAD of them. When
+    full, the oldest ones are dropped, as some are never retrieved (their
+    requests may be ignored before reaching the cache, for example).
+
+    Closing a spider waits for the reads and writes of that spider to finish.
+    """
+
+    def __init__(self, storage, settings=conf.settings):
+        self.storage = storage
+        self.maxthreads = settings.getint('HTTPCACHE_THREADS')
+        self.readahead = settings.getint('HTTPCACHE_READAHEAD')
+        self.threadpool = None
+        self.pending = {} # spider -> deferreds of the calls in progress
+        self.prefetched = {} # (spider, fingerprint) -> deferred
+        self.prefetch_order = deque()
+
+    def open_spider(self, spider):
+        if self.threadpool is None:
+            self._start_threadpool()
+        self.pending[spider] = set()
+        return self._call(spider, self.storage.open_spider, spider)
+
+    def close_spider(self, spider):
+        for key in [k for k in self.prefetched if k[0] is spider]:
+            del self.prefetched[key]
+        dfd = defer.DeferredList(list(self.pending.pop(spider)))
+        dfd.addBoth(lambda _: self.storage.close_spider(spider))
+        dfd.addBoth(self._stop_threadpool_if_unused)
+        return dfd
+
+    def retrieve_response(self, spider, request):
+        dfd = self.prefetched.pop((spider, request_fingerprint(request)), None)
+        if dfd is None:
+            dfd = self._call(spider, self.storage.retrieve_response, spider, \
+                request)
+        return dfd
+
+    def store_response(self, spider, request, response):
+        return self._call(spider, self.storage.store_response, spider, \
+            request, response)
+
+    def prefetch_response(self, spider, request):
+        key = (spider, request_fingerprint(request))
+        if not self.readahead or key in self.prefetched or \
+                spider not in self.pending:
+            return
+        while len(self.prefetched) >= self.readahead:
+            oldest = self.prefetch_order.popleft()
+            if self.prefetched.pop(oldest, None) is not None:
+                stats.inc_value('httpcache/readahead_dropped', spider=oldest[0])
+        dfd = self._call(spider, self.storage.retrieve_response, spider, request)
+        # a failed read ahead counts as a cache miss
+        dfd.addErrback(log.err, "Error reading ahead from HTTP cache", \
+            spider=spider)
+        self.prefetched[key] = dfd
+        self.prefetch_order.append(key)
+        if len(self.prefetch_order) > 2 * self.readahead:
+            # drop the keys already consumed
+            self.prefetch_order = deque(k for k in self.prefetch_order \
+                if k in self.prefetched)
+
+    def discard_prefetched(self, spider, request):
+        """Drop the response read ahead for the given request, if any"""
+        self.prefetched.pop((spider, request_fingerprint(request)), None)
+
+    def _call(self, spider, function, *args):
+        dfd = defer_to_threadpool(self.threadpool, function, *args)
+        pending = self.pending[spider]
+        pending.add(dfd)
+        def _finished(result):
+            pending.discard(dfd)
+            return result
+        return dfd.addBoth(_finished)
+
+    def _start_threadpool(self):
+        self.threadpool = ThreadPool(0, self.maxthreads)
+        self.threadpool.start()
+        self._shutdown_trigger = reactor.addSystemEventTrigger('during', \
+            'shutdown', self.threadpool.stop)
+
+    def _stop_threadpool_if_unused(self, _):
+        if not self.pending and self.threadpool is not None:
+            reactor.removeSystemEventTrigger(self._shutdown_trigger)
+            self.threadpool.stop()
+            self.threadpool = None
+        return _
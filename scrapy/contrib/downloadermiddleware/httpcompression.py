@@ -1,15 +1,36 @@
-import zlib
-from gzip import GzipFile
-from cStringIO import StringIO
+from twisted.internet import task
 
+from scrapy.xlib.pydispatch import dispatcher
+from scrapy import signals
 from scrapy.http import Response, TextResponse
+from scrapy.http.body import Spool, spool_threshold
+from scrapy.exceptions import IgnoreRequest
+from scrapy.utils.gz import gunzip_file, inflate_file
 from scrapy.core.downloader.responsetypes import responsetypes
+from scrapy.stats import stats
+from scrapy import conf
 
 
 class HttpCompressionMiddleware(object):
     """This middleware allows compressed (gzip, deflate) traffic to be
     sent/received from web sites"""
 
+    _decoders = {
+        'gzip': gunzip_file,
+        'deflate': inflate_file,
+    }
+
+    # bodies are decompressed in chunks of chunk_size bytes. Once sync_chunks
+    # chunks were decompressed, the rest are decompressed cooperatively (see
+    # twisted.internet.task.coiterate), not to block the reactor
+    chunk_size = 65536
+    sync_chunks = 16
+
+    def __init__(self, settings=conf.settings):
+        self.maxsize = settings.getint('HTTPCOMPRESSION_MAXSIZE')
+        self.spool_threshold = settings.getint('DOWNLOAD_SPOOL_THRESHOLD')
+        dispatcher.connect(self.spider_closed, signal=signals.spider_closed)
+
     def process_request(self, request, spider):
         request.headers.setdefault('Accept-Encoding', 'gzip,deflate')
 
@@ -18,33 +39,73 @@ class HttpCompressionMiddleware(object):
             content_encoding = response.headers.getlist('Content-Encoding')
             if content_encoding:
                 encoding = content_encoding.pop()
-                decoded_body = self._decode(response.body, encoding.lower())
-                respcls = responsetypes.from_args(headers=response.headers, \
-                    url=response.url)
-                kwargs = dict(cls=respcls, body=decoded_body)
-                if issubclass(respcls, TextResponse):
-                    # force recalculating the encoding until we make sure the
-                    # responsetypes guessing is reliable
-                    kwargs['encoding'] = None
-                response = response.replace(**kwargs)
-                if not content_encoding:
-                    del response.headers['Content-Encoding']
+                decoder = self._decoders.get(encoding.lower())
+                if decoder is None:
+                    return self._decoded(response, content_encoding)
+                body = Spool(spool_threshold(request, self.spool_threshold))
+                decoding = self._decode(request, response, spider, decoder, \
+                    body)
+                for n, _ in enumerate(decoding):
+                    if n >= self.sync_chunks:
+                        d = task.coiterate(decoding)
+                        return d.addCallback(lambda _: self._decoded(response, \
+                            content_encoding, body.getvalue()))
+                return self._decoded(response, content_encoding, \
+                    body.getvalue())
 
         return response
 
-    def _decode(self, body, encoding):
-        if encoding == 'gzip':
-            body = GzipFile(fileobj=StringIO(body)).read()
-
-        if encoding == 'deflate':
-            try:
-                body = zlib.decompress(body)
-            except zlib.error:
-                # ugly hack to work with raw deflate content that may
-                # be sent by microsoft servers. For more information, see:
-                # http://carsten.codimi.de/gzip.yaws/
-                # http://www.port80software.com/200ok/archive/2005/10/31/868.aspx
-                # http://www.gzip.org/zlib/zlib_faq.html#faq38
-                body = zlib.decompress(body, -15)
-        return body
+    def _decode(self, request, response, spider, decoder, body):
+        """Decompress the response body into body (a Spool), yielding after
+        each chunk"""
+        f = decoder(response.open_body())
+        while True:
+            chunk = f.read(self.chunk_size)
+            if not chunk:
+                break
+            body.write(chunk)
+            if self.maxsize and body.size > self.maxsize:
+                body.close()
+                stats.inc_value('httpcompression/response_aborted_count', \
+                    spider=spider)
+                raise IgnoreRequest("Aborted decompression of %s: size " \
+                    "larger than HTTPCOMPRESSION_MAXSIZE (%d)" % (request, \
+                    self.maxsize))
+            yield
+        stats.inc_value('httpcompression/response_count', spider=spider)
+        stats.inc_value('httpcompression/compressed_bytes', \
+            _body_size(response), spider=spider)
+        stats.inc_value('httpcompression/decompressed_bytes', body.size, \
+            spider=spider)
+
+    def _decoded(self, response, content_encoding, body=None):
+        respcls = responsetypes.from_args(headers=response.headers, \
+            url=response.url)
+        kwargs = dict(cls=respcls)
+        if body is not None:
+            kwargs['body'] = body
+        if issubclass(respcls, TextResponse):
+            # force recalculating the encoding until we make sure the
+            # responsetypes guessing is reliable
+            kwargs['encoding'] = None
+        response = response.replace(**kwargs)
+        if not content_encoding:
+            del response.headers['Content-Encoding']
+        return response
+
+    def spider_closed(self, spider):
+        compressed = stats.get_value('httpcompression/compressed_bytes', \
+            spider=spider)
+        if compressed:
+            decompressed = stats.get_value('httpcompression/decompressed_bytes', \
+                0, spider=spider)
+            stats.set_value('httpcompression/compression_ratio', \
+                round(float(decompressed) / compressed, 2), spider=spider)
+
 
+def _body_size(response):
+    if not response.spooled:
+        return len(response.body)
+    f = response.open_body()
+    f.seek(0, 2)
+    return f.tell()
@@ -22,7 +22,13 @@ class DownloaderStats(object):
         stats.inc_value('downloader/response_count')
         stats.inc_value('downloader/response_count', spider=spider)
         stats.inc_value('downloader/response_status_count/%s' % response.status, spider=spider)
-        reslen = len(response_httprepr(response))
+        if response.spooled:
+            # don't load the body just to measure it
+            body = response.open_body()
+            body.seek(0, 2)
+            reslen = len(response_httprepr(response.replace(body=''))) + body.tell()
+        else:
+            reslen = len(response_httprepr(response))
         stats.inc_value('downloader/response_bytes', reslen, spider=spider)
         stats.inc_value('downloader/response_bytes', reslen)
         return response
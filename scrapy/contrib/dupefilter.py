@@ -12,9 +12,24 @@ They must implement the following methods:
   return ``True`` if the request was seen before, or ``False`` otherwise. If
   ``dont_record`` is ``True`` the request must not be recorded as seen.
 
+And, optionally:
+
+* checkpoint(spider)
+  save the seen requests (when the JOBDIR setting is used), so that they're
+  kept if the crawl is resumed. Called periodically by the scheduler.
+
 """
 
+from __future__ import with_statement
+
+import os
+import tempfile
+
 from scrapy.utils.request import request_fingerprint
+from scrapy.utils.fingerprintset import FingerprintSet, ScalableBloomFilter, \
+    DiskFingerprintSet
+from scrapy.utils.job import job_dir
+from scrapy.conf import settings
 
 
 class NullDupeFilter(dict):
@@ -29,15 +44,24 @@ class NullDupeFilter(dict):
 
 
 class RequestFingerprintDupeFilter(object):
-    """Duplicate filter using scrapy.utils.request.request_fingerprint"""
+    """Duplicate filter using scrapy.utils.request.request_fingerprint
+
+    When JOBDIR is set, the fingerprints are also appended (on each
+    checkpoint) to a requests.seen file in the job directory, and loaded from
+    there when the spider is opened again.
+    """
 
     def __init__(self):
         self.fingerprints = {}
+        self.jobfiles = {}
+        self.unsaved = {} # fingerprints not yet written to the job files
 
     def open_spider(self, spider):
         self.fingerprints[spider] = set()
+        self._open_jobfile(spider)
 
     def close_spider(self, spider):
+        self._close_jobfile(spider)
         del self.fingerprints[spider]
 
     def request_seen(self, spider, request, dont_record=False):
@@ -46,4 +70,102 @@ class RequestFingerprintDupeFilter(object):
             return True
         if not dont_record:
             self.fingerprints[spider].add(fp)
+            self._record(spider, fp)
+        return False
+
+    def checkpoint(self, spider):
+        f = self.jobfiles.get(spider)
+        if f is not None:
+            f.writelines(fp + '\n' for fp in self.unsaved[spider])
+            f.flush()
+            os.fsync(f.fileno())
+            self.unsaved[spider] = []
+
+    def _record(self, spider, fp):
+        if spider in self.unsaved:
+            self.unsaved[spider].append(fp)
+
+    def _load_fingerprint(self, spider, fp):
+        self.fingerprints[spider].add(fp)
+
+    def _open_jobfile(self, spider):
+        path = job_dir(settings, spider)
+        if not path:
+            return
+        path = os.path.join(path, 'requests.seen')
+        if os.path.exists(path):
+            with open(path) as f:
+                for line in f:
+                    fp = line.rstrip()
+                    if len(fp) == 40: # skip lines partially written
+                        self._load_fingerprint(spider, fp)
+        self.jobfiles[spider] = open(path, 'a')
+        self.unsaved[spider] = []
+
+    def _close_jobfile(self, spider):
+        if spider in self.jobfiles:
+            self.checkpoint(spider)
+            self.jobfiles.pop(spider).close()
+            del self.unsaved[spider]
+
+
+class CompactRequestFingerprintDupeFilter(RequestFingerprintDupeFilter):
+    """Duplicate filter using request fingerprints (like
+    RequestFingerprintDupeFilter) but storing them in binary form, in a compact
+    hash table, which takes about 12-24 bytes per request instead of ~100.
+    """
+
+    def open_spider(self, spider):
+        self.fingerprints[spider] = self._new_fingerprint_set(spider)
+        self._open_jobfile(spider)
+
+    def close_spider(self, spider):
+        self._close_jobfile(spider)
+        self.fingerprints.pop(spider).close()
+
+    def request_seen(self, spider, request, dont_record=False):
+        hexfp = request_fingerprint(request)
+        fp = hexfp.decode('hex')
+        if dont_record:
+            return fp in self.fingerprints[spider]
+        if self.fingerprints[spider].add(fp):
+            return True
+        self._record(spider, hexfp)
         return False
+
+    def _load_fingerprint(self, spider, fp):
+        self.fingerprints[spider].add(fp.decode('hex'))
+
+    def _new_fingerprint_set(self, spider):
+        return FingerprintSet()
+
+
+class BloomRequestFingerprintDupeFilter(CompactRequestFingerprintDupeFilter):
+    """Duplicate filter which stores request fingerprints in a scalable Bloom
+    filter. It uses even less memory than CompactRequestFingerprintDupeFilter,
+    but it may (wrongly) filter out new requests with a probability of
+    DUPEFILTER_BLOOM_ERROR_RATE.
+    """
+
+    def _new_fingerprint_set(self, spider):
+        return ScalableBloomFilter(settings.getfloat('DUPEFILTER_BLOOM_ERROR_RATE'))
+
+
+class DiskRequestFingerprintDupeFilter(CompactRequestFingerprintDupeFilter):
+    """Duplicate filter which keeps the most recent request fingerprints in
+    memory and merges them, in batches of DUPEFILTER_DISK_BATCH_SIZE, into a
+    sorted file on disk.
+    """
+
+    def close_spider(self, spider):
+        self._close_jobfile(spider)
+        fingerprints = self.fingerprints.pop(spider)
+        # don't merge the last batch into a file which is removed right after
+        fingerprints.close(flush=False)
+        os.remove(fingerprints.path)
+
+    def _new_fingerprint_set(self, spider):
+        fd, path = tempfile.mkstemp(prefix='scrapy-dupefilter-')
+        os.close(fd)
+        return DiskFingerprintSet(path, \
+            batchsize=settings.getint('DUPEFILTER_DISK_BATCH_SIZE'))
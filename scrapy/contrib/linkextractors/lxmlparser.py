@@ -1,84 +1,120 @@
 """
-lxml-based link extractors (experimental)
+lxml-based link extractors
 
 NOTE: The ideal name for this module would be `lxml`, but that's not possible
 because it collides with the lxml library module.
 """
 
+import warnings
+
 from lxml import etree
 import lxml.html
 
 from scrapy.link import Link
+from scrapy.selector.lxmlsel import get_root, compile_xpath
 from scrapy.utils.python import unique as unique_list, str_to_unicode
 from scrapy.utils.url import safe_url_string, urljoin_rfc
-
-class LxmlLinkExtractor(object):
-    def __init__(self, tag="a", attr="href", process=None, unique=False):
-        scan_tag = tag if callable(tag) else lambda t: t == tag
-        scan_attr = attr if callable(attr) else lambda a: a == attr
-        process_attr = process if callable(process) else lambda v: v
-
+from scrapy.utils.misc import arg_to_iter
+from scrapy.utils.response import get_base_url
+from scrapy.contrib.linkextractors.sgml import FilteringLinkExtractor
+
+# tags whose end tag is omitted in HTML, so they don't close the text of the
+# link they're in (see LxmlLinkExtractor._link_text)
+_void_tags = frozenset(['area', 'base', 'basefont', 'br', 'col', 'frame', \
+    'hr', 'img', 'input', 'isindex', 'link', 'meta', 'param'])
+
+class LxmlLinkExtractor(FilteringLinkExtractor):
+    """A link extractor with the same arguments, filters and output as
+    SgmlLinkExtractor, which walks the tree parsed by lxml (shared with the
+    selectors of the response) instead of running SGMLParser over the body,
+    and evaluates restrict_xpaths on that tree instead of parsing again the
+    HTML of the regions they select
+
+    The tag, attr and process arguments of the previous LxmlLinkExtractor are
+    deprecated, in favour of tags, attrs and process_value.
+    """
+
+    def __init__(self, allow=(), deny=(), allow_domains=(), deny_domains=(), restrict_xpaths=(),
+                 tags=('a', 'area'), attrs=('href'), canonicalize=True, unique=True, process_value=None,
+                 tag=None, attr=None, process=None):
+        if tag is not None or attr is not None or process is not None:
+            warnings.warn("LxmlLinkExtractor arguments tag, attr and process " \
+                "are deprecated, use tags, attrs and process_value instead", \
+                DeprecationWarning, stacklevel=2)
+        self._set_filters(allow, deny, allow_domains, deny_domains, canonicalize)
+        self.restrict_xpaths = tuple(arg_to_iter(restrict_xpaths))
+        if tag is None:
+            self.scan_tag = lambda t: t in tags
+        else:
+            self.scan_tag = tag if callable(tag) else lambda t: t == tag
+        if attr is None:
+            self.scan_attr = lambda a: a in attrs
+        else:
+            self.scan_attr = attr if callable(attr) else lambda a: a == attr
+        if process is not None and process_value is None:
+            process_value = process
+        self.process_value = (lambda v: v) if process_value is None else process_value
         self.unique = unique
 
-        target = LinkTarget(scan_tag, scan_attr, process_attr)
-        self.parser = etree.HTMLParser(target=target)
-
-    def _extract_links(self, response_text, response_url, response_encoding):
-        self.base_url, self.links = etree.HTML(response_text, self.parser) 
-
-        links = unique_list(self.links, key=lambda link: link.url) if self.unique else self.links
-
-        ret = []
-        base_url = urljoin_rfc(response_url, self.base_url) if self.base_url else response_url
-        for link in links:
-            link.url = urljoin_rfc(base_url, link.url, response_encoding)
-            link.url = safe_url_string(link.url, response_encoding)
-            link.text = str_to_unicode(link.text, response_encoding)
-            ret.append(link)
-
-        return ret
-
     def extract_links(self, response):
-        # wrapper needed to allow to work directly with text
-        return self._extract_links(response.body, response.url, 
-                                   response.encoding)
-
-    def matches(self, url):
-        """This extractor matches with any url, since it doesn't contain any patterns"""
-        return True
-
-
-class LinkTarget(object):
-    def __init__(self, scan_tag, scan_attr, process_attr):
-        self.scan_tag = scan_tag
-        self.scan_attr = scan_attr
-        self.process_attr = process_attr
-
-        self.base_url = None
-        self.links = []
-
-        self.current_link = None
-
-    def start(self, tag, attrs):
-        if tag == 'base':
-            self.base_url = dict(attrs).get('href')
-        if self.scan_tag(tag):
-            for attr, value in attrs.iteritems():
-                if self.scan_attr(attr):
-                    url = self.process_attr(value)
-                    link = Link(url=url)
-                    self.links.append(link)
-                    self.current_link = link
+        root = get_root(response)
+        if root is None:
+            return []
+        if self.restrict_xpaths:
+            elements = []
+            for xpath in self.restrict_xpaths:
+                elements.extend(x for x in compile_xpath(xpath)(root) \
+                    if isinstance(x, etree._Element))
+            base_url = get_base_url(response)
+        else:
+            elements = [root]
+            base_url = None
+            for base in root.iter('base'):
+                base_url = base.get('href')
+            base_url = urljoin_rfc(response.url, base_url, response.encoding) \
+                if base_url else response.url
+
+        links = self._extract_links(elements, response.url, response.encoding, \
+            base_url)
+        links = self._process_links(links)
+        return links
 
-    def end(self, tag):
-        self.current_link = None
+    def _process_links(self, links):
+        links = self._filter_links(links)
+        if self.unique:
+            links = unique_list(links, key=lambda link: link.url)
+        return links
 
-    def data(self, data):
-        if self.current_link and not self.current_link.text:
-            self.current_link.text = data.strip()
+    def _extract_links(self, elements, response_url, response_encoding, base_url):
+        links = []
+        for element in elements:
+            for el in element.iter(etree.Element):
+                if not self.scan_tag(el.tag):
+                    continue
+                link = None
+                for attr, value in el.items():
+                    if self.scan_attr(attr):
+                        url = self.process_value(value)
+                        if url is not None:
+                            url = urljoin_rfc(base_url, url, response_encoding)
+                            link = Link(safe_url_string(url, response_encoding))
+                            links.append(link)
+                # like SgmlLinkExtractor, the text goes to the last link of
+                # the element
+                if link is not None:
+                    link.text = str_to_unicode(self._link_text(el))
+        return links
 
-    def close(self):
-        return self.base_url, self.links
+    def _link_text(self, el):
+        """Return the text SgmlLinkExtractor gives to the link of the given
+        element: the stripped pieces of text from its start tag up to the
+        first end tag found"""
+        text = (el.text or '').strip()
+        for child in el:
+            if isinstance(child.tag, basestring) and child.tag not in _void_tags:
+                return text + self._link_text(child)
+            text += (child.tail or '').strip()
+        return text
 
 
 class LxmlParserLinkExtractor(object):
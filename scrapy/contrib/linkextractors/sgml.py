@@ -86,36 +86,19 @@ _re_type = type(re.compile("", 0))
 _matches = lambda url, regexs: any((r.search(url) for r in regexs))
 _is_valid_url = lambda url: url.split('://', 1)[0] in set(['http', 'https', 'file'])
 
-class SgmlLinkExtractor(BaseSgmlLinkExtractor):
+class FilteringLinkExtractor(object):
+    """Mixin with the filters of SgmlLinkExtractor (allow, deny,
+    allow_domains, deny_domains and canonicalize), for the link extractors
+    which take its arguments"""
 
-    def __init__(self, allow=(), deny=(), allow_domains=(), deny_domains=(), restrict_xpaths=(), 
-                 tags=('a', 'area'), attrs=('href'), canonicalize=True, unique=True, process_value=None):
+    def _set_filters(self, allow, deny, allow_domains, deny_domains, canonicalize):
         self.allow_res = [x if isinstance(x, _re_type) else re.compile(x) for x in arg_to_iter(allow)]
         self.deny_res = [x if isinstance(x, _re_type) else re.compile(x) for x in arg_to_iter(deny)]
         self.allow_domains = set(arg_to_iter(allow_domains))
         self.deny_domains = set(arg_to_iter(deny_domains))
-        self.restrict_xpaths = tuple(arg_to_iter(restrict_xpaths))
         self.canonicalize = canonicalize
-        tag_func = lambda x: x in tags
-        attr_func = lambda x: x in attrs
-        BaseSgmlLinkExtractor.__init__(self, tag=tag_func, attr=attr_func, 
-            unique=unique, process_value=process_value)
-
-    def extract_links(self, response):
-        base_url = None
-        if self.restrict_xpaths:
-            hxs = HtmlXPathSelector(response)
-            html = ''.join(''.join(html_fragm for html_fragm in hxs.select(xpath_expr).extract()) \
-                for xpath_expr in self.restrict_xpaths)
-            base_url = get_base_url(response)
-        else:
-            html = response.body
 
-        links = self._extract_links(html, response.url, response.encoding, base_url)
-        links = self._process_links(links)
-        return links
-
-    def _process_links(self, links):
+    def _filter_links(self, links):
         links = [link for link in links if _is_valid_url(link.url)]
 
         if self.allow_res:
@@ -130,8 +113,6 @@ class SgmlLinkExtractor(BaseSgmlLinkExtractor):
         if self.canonicalize:
             for link in links:
                 link.url = canonicalize_url(link.url)
-
-        links = BaseSgmlLinkExtractor._process_links(self, links)
         return links
 
     def matches(self, url):
@@ -143,3 +124,34 @@ class SgmlLinkExtractor(BaseSgmlLinkExtractor):
         allowed = [regex.search(url) for regex in self.allow_res] if self.allow_res else [True]
         denied = [regex.search(url) for regex in self.deny_res] if self.deny_res else []
         return any(allowed) and not any(denied)
+
+
+class SgmlLinkExtractor(FilteringLinkExtractor, BaseSgmlLinkExtractor):
+
+    def __init__(self, allow=(), deny=(), allow_domains=(), deny_domains=(), restrict_xpaths=(), 
+                 tags=('a', 'area'), attrs=('href'), canonicalize=True, unique=True, process_value=None):
+        self._set_filters(allow, deny, allow_domains, deny_domains, canonicalize)
+        self.restrict_xpaths = tuple(arg_to_iter(restrict_xpaths))
+        tag_func = lambda x: x in tags
+        attr_func = lambda x: x in attrs
+        BaseSgmlLinkExtractor.__init__(self, tag=tag_func, attr=attr_func, 
+            unique=unique, process_value=process_value)
+
+    def extract_links(self, response):
+        base_url = None
+        if self.restrict_xpaths:
+            hxs = HtmlXPathSelector(response)
+            html = ''.join(''.join(html_fragm for html_fragm in hxs.select(xpath_expr).extract()) \
+                for xpath_expr in self.restrict_xpaths)
+            base_url = get_base_url(response)
+        else:
+            html = response.body
+
+        links = self._extract_links(html, response.url, response.encoding, base_url)
+        links = self._process_links(links)
+        return links
+
+    def _process_links(self, links):
+        links = self._filter_links(links)
+        links = BaseSgmlLinkExtractor._process_links(self, links)
+        return links
@@ -187,7 +187,7 @@ class ImagesPipeline(MediaPipeline):
                     % (response.status, request, referer), level=log.WARNING, spider=info.spider)
             raise ImageException
 
-        if not response.body:
+        if not response.open_body().read(1):
             log.msg('Image (empty-content): Empty image from %s referred in <%s>: no-content' \
                     % (request, referer), level=log.WARNING, spider=info.spider)
             raise ImageException
@@ -257,7 +257,7 @@ class ImagesPipeline(MediaPipeline):
 
     def get_images(self, response, request, info):
         key = self.image_key(request.url)
-        orig_image = Image.open(StringIO(response.body))
+        orig_image = Image.open(response.open_body())
 
         width, height = orig_image.size
         if width < self.MIN_WIDTH or height < self.MIN_HEIGHT:
@@ -27,3 +27,7 @@ class DuplicatesFilterMiddleware(object):
 
     def close_spider(self, spider):
         self.dupefilter.close_spider(spider)
+
+    def checkpoint(self, spider):
+        if hasattr(self.dupefilter, 'checkpoint'):
+            self.dupefilter.checkpoint(spider)
@@ -1,10 +1,17 @@
+from __future__ import with_statement
+
+import os
+
 from zope.interface import Interface, implements
+from twisted.internet import task
 
 from scrapy.xlib.pydispatch import dispatcher
 from scrapy.exceptions import NotConfigured
 from scrapy.utils.misc import load_object
 from scrapy.utils.sqlite import JsonSqliteDict
 from scrapy.utils.project import sqlite_db
+from scrapy.utils.job import job_dir
+from scrapy.utils.py26 import json
 from scrapy import signals
 
 class ISpiderContextStorage(Interface):
@@ -37,25 +44,68 @@ class SqliteSpiderContextStorage(object):
         self.d[spider.name] = context
 
 
+class JobDirSpiderContextStorage(object):
+    """Store the context of each spider in a JSON file in its job directory
+    (JOBDIR setting)"""
+
+    implements(ISpiderContextStorage)
+
+    def __init__(self, settings):
+        self.settings = settings
+
+    @classmethod
+    def from_settings(cls, settings):
+        return cls(settings)
+
+    def get(self, spider):
+        path = self._path(spider)
+        if os.path.exists(path):
+            with open(path) as f:
+                return json.load(f)
+
+    def put(self, spider, context):
+        path = self._path(spider)
+        with open(path + '.tmp', 'w') as f:
+            json.dump(context, f)
+        os.rename(path + '.tmp', path)
+
+    def _path(self, spider):
+        return os.path.join(job_dir(self.settings, spider), 'spider.context')
+
+
 class SpiderContext(object):
 
-    def __init__(self, storage):
+    def __init__(self, storage, checkpoint_interval=0):
         dispatcher.connect(self._spider_opened, signals.spider_opened)
         dispatcher.connect(self._spider_closed, signals.spider_closed)
         self.storage = storage
+        self.checkpoint_interval = checkpoint_interval
+        self.tasks = {}
 
     @classmethod
     def from_settings(cls, settings):
         if not settings.getbool('SPIDER_CONTEXT_ENABLED'):
             raise NotConfigured
+        if settings['JOBDIR']:
+            storage = JobDirSpiderContextStorage.from_settings(settings)
+            return cls(storage, settings.getfloat('JOBDIR_CHECKPOINT_INTERVAL'))
         stcls = load_object(settings['SPIDER_CONTEXT_STORAGE_CLASS'])
         storage = stcls.from_settings(settings)
         return cls(storage)
 
     def _spider_opened(self, spider):
         spider.context = self.storage.get(spider) or {}
+        if self.checkpoint_interval:
+            tsk = task.LoopingCall(self._checkpoint, spider)
+            tsk.start(self.checkpoint_interval, now=False)
+            self.tasks[spider] = tsk
 
     def _spider_closed(self, spider):
+        tsk = self.tasks.pop(spider, None)
+        if tsk is not None:
+            tsk.stop()
+        self._checkpoint(spider)
+
+    def _checkpoint(self, spider):
         if spider.context:
             self.storage.put(spider, spider.context)
-
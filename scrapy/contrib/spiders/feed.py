@@ -8,7 +8,7 @@ See documentation in docs/topics/spiders.rst
 from scrapy.contrib.spiders.init import InitSpider
 from scrapy.item import BaseItem
 from scrapy.http import Request
-from scrapy.utils.iterators import xmliter, csviter
+from scrapy.utils.iterators import xmliter, xmliter_lxml, csviter
 from scrapy.selector import XmlXPathSelector, HtmlXPathSelector
 from scrapy.exceptions import NotConfigured, NotSupported
 
@@ -17,9 +17,11 @@ class XMLFeedSpider(InitSpider):
     This class intends to be the base class for spiders that scrape
     from XML feeds.
 
-    You can choose whether to parse the file using the 'iternodes' iterator, an
-    'xml' selector, or an 'html' selector.  In most cases, it's convenient to
-    use iternodes, since it's a faster and cleaner.
+    You can choose whether to parse the file using the 'iternodes' iterator,
+    the 'iterparse' iterator, an 'xml' selector, or an 'html' selector.  In
+    most cases, it's convenient to use iternodes, since it's a faster and
+    cleaner. For big feeds, use iterparse, which doesn't load the whole feed
+    in memory.
     """
 
     iterator = 'iternodes'
@@ -73,6 +75,9 @@ class XMLFeedSpider(InitSpider):
         response = self.adapt_response(response)
         if self.iterator == 'iternodes':
             nodes = xmliter(response, self.itertag)
+        elif self.iterator == 'iterparse':
+            nodes = self._iter_registering_namespaces( \
+                xmliter_lxml(response, self.itertag))
         elif self.iterator == 'xml':
             selector = XmlXPathSelector(response)
             self._register_namespaces(selector)
@@ -86,6 +91,11 @@ class XMLFeedSpider(InitSpider):
 
         return self.parse_nodes(response, nodes)
 
+    def _iter_registering_namespaces(self, selectors):
+        for selector in selectors:
+            self._register_namespaces(selector)
+            yield selector
+
     def _register_namespaces(self, selector):
         for (prefix, uri) in self.namespaces:
             selector.register_namespace(prefix, uri)
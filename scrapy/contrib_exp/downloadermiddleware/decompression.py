@@ -1,81 +1,171 @@
 """ This module implements the DecompressionMiddleware which tries to recognise
-and extract the potentially compressed responses that may arrive. 
+and extract the potentially compressed responses that may arrive.
+
+The format is recognised by the magic number at the start of the body (or, if
+there's none, by the Content-Type header), so uncompressed responses are only
+checked once. The middleware replaces archives (tar and zip) by their first
+member, the other members can be extracted with iter_decompressed().
+
+Bodies are decompressed in chunks, up to HTTPCOMPRESSION_MAXSIZE bytes (each
+archive member), so decompression bombs are aborted before they fill up the
+memory.
 """
 
 import bz2
-import gzip
 import zipfile
 import tarfile
-from cStringIO import StringIO
-from tempfile import mktemp
 
 from scrapy import log
-from scrapy.http import Response
+from scrapy.http.body import Spool, spool_threshold
+from scrapy.exceptions import IgnoreRequest
+from scrapy.utils.gz import gunzip_file, DecompressorFile
 from scrapy.core.downloader.responsetypes import responsetypes
+from scrapy.stats import stats
+from scrapy import conf
 
+# tar files have their magic number at offset 257
+_SNIFF_SIZE = 262
 
-class DecompressionMiddleware(object):
-    """ This middleware tries to recognise and extract the possibly compressed
-    responses that may arrive. """
-
-    def __init__(self):
-        self._formats = {
-            'tar': self._is_tar,
-            'zip': self._is_zip,
-            'gz': self._is_gzip,
-            'bz2': self._is_bzip2
-        }
-
-    def _is_tar(self, response):
-        archive = StringIO(response.body)
-        try:
-            tar_file = tarfile.open(name=mktemp(), fileobj=archive)
-        except tarfile.ReadError:
-            return
-
-        body = tar_file.extractfile(tar_file.members[0]).read()
-        respcls = responsetypes.from_args(filename=tar_file.members[0].name, body=body)
-        return response.replace(body=body, cls=respcls)
+_TAR_CONTENT_TYPES = ('application/x-tar', 'application/tar')
 
-    def _is_zip(self, response):
-        archive = StringIO(response.body)
-        try:
-            zip_file = zipfile.ZipFile(archive)
-        except zipfile.BadZipfile:
-            return
+_CHUNK_SIZE = 65536
 
-        namelist = zip_file.namelist()
-        body = zip_file.read(namelist[0])
-        respcls = responsetypes.from_args(filename=namelist[0], body=body)
-        return response.replace(body=body, cls=respcls)
 
-    def _is_gzip(self, response):
-        archive = StringIO(response.body)
-        try:
-            body = gzip.GzipFile(fileobj=archive).read()
-        except IOError:
-            return
+class MaxSizeExceeded(Exception):
+    """Raised by iter_decompressed() when a body decompresses to more than
+    maxsize bytes"""
 
-        respcls = responsetypes.from_args(body=body)
-        return response.replace(body=body, cls=respcls)
 
-    def _is_bzip2(self, response):
-        try:
-            body = bz2.decompress(response.body)
-        except IOError:
-            return
+class DecompressionMiddleware(object):
+    """ This middleware tries to recognise and extract the possibly compressed
+    responses that may arrive. Archives are replaced by their first member,
+    unless the request has the dont_decompress meta key. Responses which
+    decompress to more than HTTPCOMPRESSION_MAXSIZE bytes are ignored. """
 
-        respcls = responsetypes.from_args(body=body)
-        return response.replace(body=body, cls=respcls)
+    def __init__(self, settings=conf.settings):
+        self.spool_threshold = settings.getint('DOWNLOAD_SPOOL_THRESHOLD')
+        self.maxsize = settings.getint('HTTPCOMPRESSION_MAXSIZE')
 
     def process_response(self, request, response, spider):
-        if not response.body:
+        if request is not None and request.meta.get('dont_decompress'):
             return response
-
-        for fmt, func in self._formats.iteritems():
-            new_response = func(response)
-            if new_response:
+        fmt = sniff_format(response)
+        if fmt is None:
+            return response
+        try:
+            for new_response in iter_decompressed(response, fmt, \
+                    spool_threshold(request, self.spool_threshold), \
+                    self.maxsize):
                 log.msg('Decompressed response with format: %s' % \
                         fmt, log.DEBUG, spider=spider)
                 return new_response
+        except MaxSizeExceeded:
+            stats.inc_value('decompression/response_aborted_count', \
+                spider=spider)
+            raise IgnoreRequest("Aborted decompression of %s: size larger " \
+                "than HTTPCOMPRESSION_MAXSIZE (%d)" % (request or response, \
+                self.maxsize))
+        except (IOError, EOFError, tarfile.TarError, zipfile.BadZipfile):
+            pass
         return response
+
+
+def sniff_format(response):
+    """Return the format of a compressed response ('tar', 'zip', 'gz' or
+    'bz2') or None if it isn't compressed"""
+    chunk = response.open_body().read(_SNIFF_SIZE)
+    if chunk.startswith('\x1f\x8b'):
+        return 'gz'
+    if chunk.startswith('BZh'):
+        return 'bz2'
+    if chunk.startswith('PK\x03\x04') or chunk.startswith('PK\x05\x06'):
+        return 'zip'
+    if chunk[257:262] == 'ustar':
+        return 'tar'
+    # old tar files have no magic number
+    content_type = response.headers.get('Content-Type') or ''
+    if chunk and content_type.split(';')[0].strip().lower() in \
+            _TAR_CONTENT_TYPES:
+        return 'tar'
+
+
+def iter_decompressed(response, fmt=None, spool_threshold=None, maxsize=0):
+    """Iterate over the responses extracted from a compressed response: one
+    per member of tar and zip archives, or the decompressed response for
+    gzip and bzip2 ones (or for the tar archive they contain). fmt is the
+    result of sniff_format(), which is called if not given.
+
+    Members are extracted as they're iterated. gzip and bzip2 bodies are
+    decompressed here, once, so invalid or truncated data raises IOError (or
+    EOFError) when calling this function. Bodies are kept in memory, or in a
+    temporary file once bigger than spool_threshold bytes (see
+    DOWNLOAD_SPOOL_THRESHOLD), and MaxSizeExceeded is raised as soon as one
+    is bigger than maxsize bytes (if not 0).
+    """
+    if fmt is None:
+        fmt = sniff_format(response)
+    if fmt == 'tar':
+        return _iter_tar(response, spool_threshold, maxsize)
+    if fmt == 'zip':
+        return _iter_zip(response, spool_threshold, maxsize)
+    if fmt == 'gz':
+        stream = gunzip_file(response.open_body())
+    elif fmt == 'bz2':
+        stream = _bunzip2_file(response.open_body())
+    else:
+        return iter([])
+    body, head = _read(stream, spool_threshold, maxsize)
+    if head[257:262] == 'ustar':
+        return _iter_tar(response.replace(body=body), spool_threshold, \
+            maxsize)
+    respcls = responsetypes.from_args(body=head[:5000])
+    return iter([response.replace(body=body, cls=respcls)])
+
+
+def _read(stream, spool_threshold, maxsize):
+    """Read the stream into a Spool, in chunks, up to maxsize bytes. Return
+    the body and its first chunk"""
+    body = Spool(spool_threshold)
+    try:
+        chunk = head = stream.read(_CHUNK_SIZE)
+        while chunk:
+            body.write(chunk)
+            if maxsize and body.size > maxsize:
+                raise MaxSizeExceeded("Body larger than %d bytes" % maxsize)
+            chunk = stream.read(_CHUNK_SIZE)
+    except:
+        body.close()
+        raise
+    return body.getvalue(), head
+
+def _iter_tar(response, spool_threshold=None, maxsize=0):
+    # read as a stream, without seeking, so compressed tar files are only
+    # decompressed once
+    tar_file = tarfile.open(fileobj=response.open_body(), mode='r|')
+    for member in tar_file:
+        if member.isfile():
+            if maxsize and member.size > maxsize:
+                raise MaxSizeExceeded("Member %s larger than %d bytes" % \
+                    (member.name, maxsize))
+            body, head = _read(tar_file.extractfile(member), \
+                spool_threshold, maxsize)
+            respcls = responsetypes.from_args(filename=member.name, \
+                body=head[:5000])
+            yield response.replace(body=body, cls=respcls)
+
+def _iter_zip(response, spool_threshold=None, maxsize=0):
+    zip_file = zipfile.ZipFile(response.open_body())
+    for info in zip_file.infolist():
+        if not info.filename.endswith('/'):
+            # the size in the archive may be wrong, the member is read in
+            # chunks anyway
+            if maxsize and info.file_size > maxsize:
+                raise MaxSizeExceeded("Member %s larger than %d bytes" % \
+                    (info.filename, maxsize))
+            body, head = _read(zip_file.open(info), spool_threshold, maxsize)
+            respcls = responsetypes.from_args(filename=info.filename, \
+                body=head[:5000])
+            yield response.replace(body=body, cls=respcls)
+
+def _bunzip2_file(fileobj):
+    return DecompressorFile(fileobj, bz2.BZ2Decompressor())
@@ -4,6 +4,7 @@ Download web pages using asynchronous IO
 
 import random
 from time import time
+from collections import deque
 
 from twisted.internet import reactor, defer
 from twisted.python.failure import Failure
@@ -11,44 +12,94 @@ from twisted.python.failure import Failure
 from scrapy.exceptions import IgnoreRequest
 from scrapy.conf import settings
 from scrapy.utils.defer import mustbe_deferred
+from scrapy.utils.httpobj import urlparse_cached
 from scrapy.utils.signal import send_catch_log
+from scrapy.utils.datatypes import LruCache
 from scrapy.utils import deprecate
 from scrapy import signals
 from scrapy import log
 from .middleware import DownloaderMiddlewareManager
 from .handlers import DownloadHandlers
+from .throttle import AutoThrottle
+
+# maximum number of hostnames whose IP is kept to find their downloader slot
+# (see CONCURRENT_REQUESTS_PER_IP). The downloads resolve them on their own,
+# so an outdated IP only puts a request in the slot of that IP
+IP_CACHE_SIZE = 10000
+
+
+class Slot(object):
+    """Downloader slot. Requests sent to the same domain (or IP, see
+    CONCURRENT_REQUESTS_PER_IP) share a slot, which keeps their own
+    concurrency, delay and queue"""
+
+    def __init__(self, concurrency, delay, randomize_delay):
+        self.concurrency = concurrency
+        self.delay = delay
+        self.randomize_delay = randomize_delay
+        self.queue = deque()
+        self.transferring = set()
+        self.lastseen = 0
+        self.latercall = None
+        self.blocked = False
+
+    def free_transfer_slots(self):
+        return self.concurrency - len(self.transferring)
+
+    def download_delay(self):
+        if self.randomize_delay:
+            # same policy as wget --random-wait
+            return random.uniform(0.5*self.delay, 1.5*self.delay)
+        return self.delay
+
+    def is_idle(self):
+        return not (self.queue or self.transferring or self.latercall)
+
+    def cancel_latercall(self):
+        if self.latercall and self.latercall.active():
+            self.latercall.cancel()
+        self.latercall = None
 
 
 class SpiderInfo(object):
     """Simple class to keep information and state for each open spider"""
 
+    # idle slots not seen in this amount of secs are garbage-collected
+    SLOT_GC_AGE = 60
+
     def __init__(self, spider):
         if hasattr(spider, 'download_delay'):
             deprecate.attribute(spider, 'download_delay', 'DOWNLOAD_DELAY')
-            self._download_delay = spider.download_delay
+            self.download_delay = spider.download_delay
         else:
-            self._download_delay = spider.settings.getfloat('DOWNLOAD_DELAY')
-        if self._download_delay:
-            self.max_concurrent_requests = 1
+            self.download_delay = spider.settings.getfloat('DOWNLOAD_DELAY')
+        if hasattr(spider, 'max_concurrent_requests'):
+            deprecate.attribute(spider, 'max_concurrent_requests', 'CONCURRENT_REQUESTS_PER_SPIDER')
+            self.max_concurrent_requests = spider.max_concurrent_requests
         else:
-            if hasattr(spider, 'max_concurrent_requests'):
-                deprecate.attribute(spider, 'max_concurrent_requests', 'CONCURRENT_REQUESTS_PER_SPIDER')
-                self.max_concurrent_requests = spider.max_concurrent_requests
-            else:
-                self.max_concurrent_requests = spider.settings.getint('CONCURRENT_REQUESTS_PER_SPIDER')
-        if self._download_delay and spider.settings.getbool('RANDOMIZE_DOWNLOAD_DELAY'):
-            # same policy as wget --random-wait
-            self.random_delay_interval = (0.5*self._download_delay, \
-                1.5*self._download_delay)
+            self.max_concurrent_requests = spider.settings.getint('CONCURRENT_REQUESTS_PER_SPIDER')
+        ip_concurrency = spider.settings.getint('CONCURRENT_REQUESTS_PER_IP')
+        self.slots_by_ip = bool(ip_concurrency)
+        if self.download_delay:
+            self.slot_concurrency = 1
+        elif ip_concurrency:
+            self.slot_concurrency = ip_concurrency
         else:
-            self.random_delay_interval = None
+            self.slot_concurrency = spider.settings.getint('CONCURRENT_REQUESTS_PER_DOMAIN')
+        self.randomize_delay = spider.settings.getbool('RANDOMIZE_DOWNLOAD_DELAY')
+        if spider.settings.getbool('AUTOTHROTTLE_ENABLED'):
+            self.throttle = AutoThrottle(spider, spider.settings, \
+                self.download_delay, ip_concurrency or \
+                spider.settings.getint('CONCURRENT_REQUESTS_PER_DOMAIN'))
+        else:
+            self.throttle = None
 
         self.active = set()
-        self.queue = []
+        self.slots = {}
         self.transferring = set()
         self.closing = False
         self.lastseen = 0
-        self.next_request_calls = set()
+        self.lastgc = time()
 
     def free_transfer_slots(self):
         return self.max_concurrent_requests - len(self.transferring)
@@ -57,22 +108,38 @@ class SpiderInfo(object):
         # use self.active to include requests in the downloader middleware
         return len(self.active) > 2 * self.max_concurrent_requests
 
-    def download_delay(self):
-        if self.random_delay_interval:
-            return random.uniform(*self.random_delay_interval)
-        else:
-            return self._download_delay
+    def get_slot(self, key):
+        if key not in self.slots:
+            slot = Slot(self.slot_concurrency, self.download_delay, \
+                self.randomize_delay)
+            if self.throttle:
+                self.throttle.init_slot(slot)
+            self.slots[key] = slot
+        return self.slots[key]
+
+    def throttle_status(self):
+        if self.throttle:
+            return self.throttle.status(self.slots)
+
+    def queue_size(self):
+        return sum(len(slot.queue) for slot in self.slots.itervalues())
+
+    def gc_slots(self, now):
+        self.lastgc = now
+        for key, slot in self.slots.items():
+            age = max(self.SLOT_GC_AGE, 2 * slot.delay)
+            if slot.is_idle() and slot.lastseen + age < now:
+                del self.slots[key]
 
     def cancel_request_calls(self):
-        for call in self.next_request_calls:
-            call.cancel()
-        self.next_request_calls.clear()
+        for slot in self.slots.itervalues():
+            slot.cancel_latercall()
 
 
 class Downloader(object):
     """Mantain many concurrent downloads and provide an HTTP abstraction.
-    It supports a limited number of connections per spider and many spiders in
-    parallel.
+    It supports a limited number of connections per domain (or IP), per spider
+    and in total, and many spiders in parallel.
     """
 
     def __init__(self):
@@ -80,6 +147,9 @@ class Downloader(object):
         self.handlers = DownloadHandlers()
         self.middleware = DownloaderMiddlewareManager.from_settings(settings)
         self.concurrent_spiders = settings.getint('CONCURRENT_SPIDERS')
+        self.total_concurrency = settings.getint('CONCURRENT_REQUESTS')
+        self._blocked = deque()
+        self._ip_cache = LruCache(IP_CACHE_SIZE)
 
     def fetch(self, request, spider):
         """Main method to use to request a download
@@ -115,40 +185,99 @@ class Downloader(object):
             return response
 
         deferred = defer.Deferred().addCallback(_downloaded)
-        site.queue.append((request, deferred))
-        self._process_queue(spider)
+        if site.slots_by_ip:
+            dfd = self._get_ip_slot_key(request)
+            dfd.addCallback(self._enqueue_in_slot, request, deferred, spider)
+        else:
+            key = urlparse_cached(request).hostname or ''
+            self._enqueue_in_slot(key, request, deferred, spider)
         return deferred
 
-    def _process_queue(self, spider):
-        """Effective download requests from site queue"""
+    def _get_ip_slot_key(self, request):
+        hostname = urlparse_cached(request).hostname or ''
+        ip = self._ip_cache.get(hostname)
+        if ip is not None:
+            return defer.succeed(ip)
+        def _resolved(ip):
+            self._ip_cache[hostname] = ip
+            return ip
+        dfd = reactor.resolve(hostname)
+        # failed lookups aren't cached, the download reports them
+        return dfd.addCallbacks(_resolved, lambda _: hostname)
+
+    def _enqueue_in_slot(self, key, request, deferred, spider):
+        site = self.sites[spider]
+        if site.closing:
+            deferred.errback(Failure(IgnoreRequest()))
+            return
+        slot = site.get_slot(key)
+        slot.queue.append((request, deferred))
+        self._process_queue(spider, slot)
+
+    def _free_transfer_slots(self):
+        if not self.total_concurrency:
+            return True
+        transferring = sum(len(x.transferring) for x in self.sites.itervalues())
+        return transferring < self.total_concurrency
+
+    def _process_queue(self, spider, slot):
+        """Effective download requests from slot queue"""
         site = self.sites.get(spider)
-        if not site:
+        if not site or slot.latercall:
+            return
+
+        if site.closing:
+            while slot.queue:
+                _, deferred = slot.queue.popleft()
+                deferred.errback(Failure(IgnoreRequest()))
+            self._close_if_idle(spider)
             return
 
         # Delay queue processing if a download_delay is configured
         now = time()
-        delay = site.download_delay()
-        if delay:
-            penalty = delay - now + site.lastseen
+        delay = slot.download_delay()
+        if delay and slot.queue:
+            penalty = delay - now + slot.lastseen
             if penalty > 0:
-                d = defer.Deferred()
-                d.addCallback(self._process_queue)
-                call = reactor.callLater(penalty, d.callback, spider)
-                site.next_request_calls.add(call)
-                d.addBoth(lambda x: site.next_request_calls.remove(call))
+                slot.latercall = reactor.callLater(penalty, \
+                    self._process_queue_later, spider, slot)
                 return
-        site.lastseen = now
 
-        # Process enqueued requests if there are free slots to transfer for this site
-        while site.queue and site.free_transfer_slots() > 0:
-            request, deferred = site.queue.pop(0)
-            if site.closing:
-                dfd = defer.fail(Failure(IgnoreRequest()))
-            else:
-                dfd = self._download(site, request, spider)
+        # Process enqueued requests if there are free slots to transfer for
+        # this domain, spider and in total
+        while slot.queue and slot.free_transfer_slots() > 0:
+            if site.free_transfer_slots() <= 0 or not self._free_transfer_slots():
+                if not slot.blocked:
+                    slot.blocked = True
+                    self._blocked.append((spider, slot))
+                break
+            slot.lastseen = site.lastseen = now
+            request, deferred = slot.queue.popleft()
+            dfd = self._download(site, slot, request, spider)
             dfd.chainDeferred(deferred)
-
-        self._close_if_idle(spider)
+            if delay:
+                # wait for the delay before sending the next request
+                if slot.queue and slot.free_transfer_slots() > 0:
+                    slot.latercall = reactor.callLater(delay, \
+                        self._process_queue_later, spider, slot)
+                break
+
+        if now - site.lastgc > site.SLOT_GC_AGE:
+            site.gc_slots(now)
+
+    def _process_queue_later(self, spider, slot):
+        slot.latercall = None
+        self._process_queue(spider, slot)
+
+    def _process_blocked(self):
+        """Process the slots which were waiting for free spider or global
+        transfer slots"""
+        for _ in xrange(len(self._blocked)):
+            if not self._free_transfer_slots():
+                break
+            spider, slot = self._blocked.popleft()
+            slot.blocked = False
+            self._process_queue(spider, slot)
 
     def _close_if_idle(self, spider):
         site = self.sites.get(spider)
@@ -156,7 +285,7 @@ class Downloader(object):
             del self.sites[spider]
             site.closing.callback(None)
 
-    def _download(self, site, request, spider):
+    def _download(self, site, slot, request, spider):
         # The order is very important for the following deferreds. Do not change!
 
         # 1. Create the download deferred
@@ -166,10 +295,16 @@ class Downloader(object):
         # state to free up the transferring slot so it can be used by the
         # following requests (perhaps those which came from the downloader
         # middleware itself)
+        slot.transferring.add(request)
         site.transferring.add(request)
+        start_time = time()
         def finish_transferring(_):
+            slot.transferring.remove(request)
             site.transferring.remove(request)
-            self._process_queue(spider)
+            if site.throttle:
+                site.throttle.transfer_finished(slot, time() - start_time, _)
+            self._process_queue(spider, slot)
+            self._process_blocked()
             # avoid partially downloaded responses from propagating to the
             # downloader middleware, to speed-up the closing process
             if site.closing:
@@ -190,7 +325,9 @@ class Downloader(object):
         site = self.sites.get(spider)
         site.closing = defer.Deferred()
         site.cancel_request_calls()
-        self._process_queue(spider)
+        for slot in site.slots.values():
+            self._process_queue(spider, slot)
+        self._close_if_idle(spider)
         return site.closing
 
     def is_idle(self):
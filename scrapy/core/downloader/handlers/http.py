@@ -22,6 +22,7 @@ class HttpDownloadHandler(object):
     def download_request(self, request, spider):
         """Return a deferred for the HTTP download"""
         factory = self.httpclientfactory(request)
+        factory.spider = spider
         self._connect(factory)
         return factory.deferred
 
@@ -0,0 +1,48 @@
+"""Download handler for http and https schemes using persistent HTTP/1.1
+connections"""
+
+from scrapy.xlib.pydispatch import dispatcher
+from scrapy.core.downloader.webclient import ScrapyHTTP11ClientFactory, \
+    HTTPConnectionPool
+from scrapy.exceptions import NotSupported
+from scrapy.stats import stats
+from scrapy import signals, optional_features
+from scrapy import conf
+
+ssl_supported = 'ssl' in optional_features
+
+
+class Http11DownloadHandler(object):
+
+    def __init__(self, httpclientfactory=ScrapyHTTP11ClientFactory, \
+            settings=conf.settings):
+        self.httpclientfactory = httpclientfactory
+        self.pool = HTTPConnectionPool(
+            maxidle_perhost=settings.getint('DOWNLOADER_POOL_MAXIDLE_PER_HOST'),
+            idle_timeout=settings.getfloat('DOWNLOADER_POOL_IDLE_TIMEOUT'),
+            maxsockets=settings.getint('DOWNLOADER_POOL_MAXSOCKETS'))
+        dispatcher.connect(self.engine_stopped, signal=signals.engine_stopped)
+
+    def download_request(self, request, spider):
+        """Return a deferred for the HTTP download"""
+        factory = self.httpclientfactory(request)
+        factory.spider = spider
+        if factory.scheme == 'https' and not ssl_supported:
+            raise NotSupported("HTTPS not supported: install pyopenssl library")
+        key = (factory.scheme, factory.host, factory.port, \
+            request.meta.get('proxy'))
+        dfd = self.pool.download(key, factory)
+        return dfd.addBoth(self._update_stats, factory, spider)
+
+    def _update_stats(self, result, factory, spider):
+        if factory.reused_connection is not None:
+            if factory.reused_connection:
+                key = 'downloader/connection_reused_count'
+            else:
+                key = 'downloader/connection_opened_count'
+            stats.inc_value(key, spider=spider)
+            stats.inc_value(key)
+        return result
+
+    def engine_stopped(self):
+        return self.pool.close()
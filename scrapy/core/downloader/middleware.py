@@ -4,15 +4,25 @@ Downloader Middleware manager
 See documentation in docs/topics/downloader-middleware.rst
 """
 
+from twisted.internet import defer
+
+from scrapy.xlib.pydispatch import dispatcher
 from scrapy.http import Request, Response
 from scrapy.middleware import MiddlewareManager
 from scrapy.utils.defer import mustbe_deferred
 from scrapy.utils.conf import build_component_list
+from scrapy import signals
 
 class DownloaderMiddlewareManager(MiddlewareManager):
 
     component_name = 'downloader middleware'
 
+    def __init__(self, *middlewares):
+        super(DownloaderMiddlewareManager, self).__init__(*middlewares)
+        if self.methods['process_headers']:
+            dispatcher.connect(self.process_headers, \
+                signal=signals.headers_received)
+
     @classmethod
     def _get_mwlist_from_settings(cls, settings):
         return build_component_list(settings['DOWNLOADER_MIDDLEWARES_BASE'], \
@@ -21,33 +31,58 @@ class DownloaderMiddlewareManager(MiddlewareManager):
     def _add_middleware(self, mw):
         if hasattr(mw, 'process_request'):
             self.methods['process_request'].append(mw.process_request)
+        if hasattr(mw, 'process_headers'):
+            self.methods['process_headers'].insert(0, mw.process_headers)
         if hasattr(mw, 'process_response'):
             self.methods['process_response'].insert(0, mw.process_response)
         if hasattr(mw, 'process_exception'):
             self.methods['process_exception'].insert(0, mw.process_exception)
 
+    def process_headers(self, response, request, spider):
+        """Called (through the headers_received signal) when the headers of a
+        response arrive. Middlewares raise IgnoreRequest to abort the download.
+        """
+        for method in self.methods['process_headers']:
+            method(request=request, response=response, spider=spider)
+
     def download(self, download_func, request, spider):
-        def process_request(request):
-            for method in self.methods['process_request']:
+        def check_request_output(response, method):
+            assert response is None or isinstance(response, (Response, Request)), \
+                    'Middleware %s.process_request must return None, Response or Request, got %s' % \
+                    (method.im_self.__class__.__name__, response.__class__.__name__)
+            return response
+
+        def check_response_output(response, method):
+            assert isinstance(response, (Response, Request)), \
+                'Middleware %s.process_response must return Response or Request, got %s' % \
+                (method.im_self.__class__.__name__, type(response))
+            return response
+
+        def process_request(methods):
+            for method in methods:
                 response = method(request=request, spider=spider)
-                assert response is None or isinstance(response, (Response, Request)), \
-                        'Middleware %s.process_request must return None, Response or Request, got %s' % \
-                        (method.im_self.__class__.__name__, response.__class__.__name__)
-                if response:
+                if isinstance(response, defer.Deferred):
+                    # continue with the next middlewares once it fires
+                    response.addCallback(check_request_output, method)
+                    return response.addCallback(lambda r: r or process_request(methods))
+                if check_request_output(response, method):
                     return response
             return download_func(request=request, spider=spider)
 
-        def process_response(response):
+        def process_response(response, methods=None):
             assert response is not None, 'Received None in process_response'
             if isinstance(response, Request):
                 return response
 
-            for method in self.methods['process_response']:
+            if methods is None:
+                methods = iter(self.methods['process_response'])
+            for method in methods:
                 response = method(request=request, response=response, spider=spider)
-                assert isinstance(response, (Response, Request)), \
-                    'Middleware %s.process_response must return Response or Request, got %s' % \
-                    (method.im_self.__class__.__name__, type(response))
-                if isinstance(response, Request):
+                if isinstance(response, defer.Deferred):
+                    # continue with the next middlewares once it fires
+                    response.addCallback(check_response_output, method)
+                    return response.addCallback(process_response, methods)
+                if isinstance(check_response_output(response, method), Request):
                     return response
             return response
 
@@ -62,7 +97,8 @@ class DownloaderMiddlewareManager(MiddlewareManager):
                     return response
             return _failure
 
-        deferred = mustbe_deferred(process_request, request)
+        deferred = mustbe_deferred(process_request, \
+            iter(self.methods['process_request']))
         deferred.addErrback(process_exception)
         deferred.addCallback(process_response)
         return deferred
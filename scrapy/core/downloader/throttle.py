@@ -0,0 +1,88 @@
+"""
+AutoThrottle adjusts the download delay and concurrency of each downloader
+slot based on the latency and errors of the downloads performed through it.
+
+See documentation in docs/topics/autothrottle.rst
+"""
+
+from twisted.python.failure import Failure
+from twisted.internet.error import TimeoutError as ServerTimeoutError, \
+    ConnectError, ConnectionLost, ConnectionDone
+from twisted.internet.defer import TimeoutError as UserTimeoutError
+from twisted.web.client import PartialDownloadError
+
+from scrapy.http import Response
+from scrapy.stats import stats
+
+
+class AutoThrottle(object):
+
+    # weight of the last latency measured in the slot latency average
+    LATENCY_WEIGHT = 0.3
+
+    # statuses which mean the server is overloaded (or rate limiting us)
+    BACKOFF_HTTP_CODES = (408, 429, 500, 502, 503, 504)
+
+    # failures which mean the server is overloaded (or unreachable). Other
+    # failures (like IgnoreRequest, DNS errors or aborted downloads) don't
+    # tell anything about the server load
+    BACKOFF_EXCEPTIONS = (ServerTimeoutError, UserTimeoutError, ConnectError, \
+        ConnectionLost, ConnectionDone, PartialDownloadError)
+
+    def __init__(self, spider, settings, min_delay=0, max_concurrency=8):
+        self.spider = spider
+        self.target_concurrency = settings.getfloat('AUTOTHROTTLE_TARGET_CONCURRENCY')
+        self.max_delay = settings.getfloat('AUTOTHROTTLE_MAX_DELAY')
+        self.min_delay = min_delay
+        self.start_delay = max(settings.getfloat('AUTOTHROTTLE_START_DELAY'), \
+            min_delay)
+        self.max_concurrency = max_concurrency
+
+    def init_slot(self, slot):
+        slot.delay = self.start_delay
+        slot.concurrency = 1
+        slot.latency = None
+
+    def transfer_finished(self, slot, latency, result):
+        """Adjust the delay and concurrency of the given slot after a transfer
+        which took ``latency`` seconds and returned ``result`` (a Response or
+        a Failure)"""
+        if isinstance(result, Failure) and \
+                not result.check(*self.BACKOFF_EXCEPTIONS):
+            return
+        if slot.latency is None:
+            slot.latency = latency
+        else:
+            slot.latency += self.LATENCY_WEIGHT * (latency - slot.latency)
+
+        if self._is_error(result):
+            # multiplicative decrease
+            delay = max(slot.delay * 2, slot.latency)
+            slot.concurrency = max(1, slot.concurrency // 2)
+            stats.inc_value('autothrottle/backoff_count', spider=self.spider)
+        else:
+            delay = (slot.delay + slot.latency / self.target_concurrency) / 2.0
+            if isinstance(result, Response) and result.status != 200:
+                # non-200 responses are usually faster than normal ones and
+                # aren't a good measure of the server load
+                delay = max(delay, slot.delay)
+            elif slot.concurrency < self.max_concurrency:
+                # additive increase
+                slot.concurrency += 1
+        slot.delay = min(max(delay, self.min_delay), self.max_delay)
+
+        stats.max_value('autothrottle/max_delay', slot.delay, spider=self.spider)
+        stats.max_value('autothrottle/max_latency', latency, spider=self.spider)
+
+    def status(self, slots, limit=20):
+        """Return the current delay, concurrency and latency of the busiest
+        slots (at most ``limit`` of them)"""
+        busiest = sorted(slots.items(), key=lambda x: len(x[1].queue) + \
+            len(x[1].transferring), reverse=True)[:limit]
+        return dict((key, {'delay': slot.delay, 'concurrency': slot.concurrency, \
+            'latency': slot.latency}) for key, slot in busiest)
+
+    def _is_error(self, result):
+        if isinstance(result, Failure):
+            return True
+        return result.status in self.BACKOFF_HTTP_CODES
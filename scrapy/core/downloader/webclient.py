@@ -1,12 +1,21 @@
 from urlparse import urlparse, urlunparse, urldefrag
+from cStringIO import StringIO
 
 from twisted.python import failure
 from twisted.web.client import PartialDownloadError, HTTPClientFactory
 from twisted.web.http import HTTPClient
-from twisted.internet import defer
+from twisted.protocols.basic import LineReceiver
+from twisted.internet.protocol import ClientCreator
+from twisted.internet import defer, reactor
 
 from scrapy.http import Headers
+from scrapy.exceptions import IgnoreRequest
 from scrapy.utils.httpobj import urlparse_cached
+from scrapy.utils.py26 import SpooledTemporaryFile
+from scrapy.utils.signal import send_catch_log, has_receivers
+from scrapy.stats import stats
+from scrapy.conf import settings
+from scrapy import signals
 from scrapy.core.downloader.responsetypes import responsetypes
 
 
@@ -26,10 +35,15 @@ def _parse(url):
     parsed = urlparse(url)
     return _parsed_url_args(parsed)
 
+# maximum amount of a spooled body kept in memory before rolling it to disk
+SPOOL_MAX_MEMORY = 1024 * 1024
+
 
 class ScrapyHTTPPageGetter(HTTPClient):
 
     delimiter = '\n'
+    _spool = None
+    _aborted = False
 
     def connectionMade(self):
         self.headers = Headers() # bucket for response headers
@@ -56,12 +70,38 @@ class ScrapyHTTPPageGetter(HTTPClient):
 
     def handleEndHeaders(self):
         self.factory.gotHeaders(self.headers)
+        reason = self.factory.check_headers()
+        if reason is not None:
+            self._abort(reason)
+            return
+        self._spool = self.factory.spool_file()
+        self._size = 0
+
+    def handleResponsePart(self, data):
+        if self._aborted:
+            return
+        self._size += len(data)
+        reason = self.factory.check_size(self._size)
+        if reason is not None:
+            self._abort(reason)
+            return
+        if self._spool is not None:
+            self._spool.write(data)
+        else:
+            HTTPClient.handleResponsePart(self, data)
+
+    def _abort(self, reason):
+        self._aborted = True
+        self.factory.noPage(reason)
+        self.transport.loseConnection()
 
     def connectionLost(self, reason):
         HTTPClient.connectionLost(self, reason)
         self.factory.noPage(reason)
 
     def handleResponse(self, response):
+        if self._spool is not None:
+            response = self._spool
         if self.factory.method.upper() == 'HEAD':
             self.factory.page('')
         elif self.length != None and self.length != 0:
@@ -90,13 +130,20 @@ class ScrapyHTTPClientFactory(HTTPClientFactory):
     followRedirect = False
     afterFoundGet = False
 
+    # the spider the request is downloaded for, set by the download handler
+    spider = None
+
     def __init__(self, request, timeout=180):
+        self.request = request
         self.url = urldefrag(request.url)[0]
         self.method = request.method
         self.body = request.body or None
         self.headers = Headers(request.headers)
         self.response_headers = None
         self.timeout = request.meta.get('download_timeout') or timeout
+        self.spool = request.meta.get('download_spool')
+        self.spool_threshold = settings.getint('DOWNLOAD_SPOOL_THRESHOLD')
+        self.maxsize = request.meta.get('download_maxsize') or 0
         self.deferred = defer.Deferred().addCallback(self._build_response)
 
         self._set_connection_attributes(request)
@@ -126,3 +173,423 @@ class ScrapyHTTPClientFactory(HTTPClientFactory):
 
     def gotHeaders(self, headers):
         self.response_headers = headers
+
+    def check_headers(self):
+        """Send the headers_received signal for the response whose headers
+        were just received. Return a Failure if the download must be aborted
+        (because a signal handler raised IgnoreRequest) or None otherwise.
+        """
+        if not has_receivers(signals.headers_received):
+            return
+        response = self._build_response('')
+        for _, result in send_catch_log(signal=signals.headers_received, \
+                response=response, request=self.request, spider=self.spider, \
+                dont_log=IgnoreRequest):
+            if isinstance(result, failure.Failure) and \
+                    isinstance(result.value, IgnoreRequest):
+                try:
+                    length = int(response.headers.get('Content-Length'))
+                except (TypeError, ValueError):
+                    length = 0
+                self._aborted(length)
+                return result
+
+    def check_size(self, size):
+        """Return a Failure if the download must be aborted because ``size``
+        bytes of the body were received, more than the download_maxsize
+        request meta key allows, or None otherwise. Unlike the Content-Length
+        checks done on the headers, this applies to every response.
+        """
+        if self.maxsize and size > self.maxsize:
+            self._aborted(size)
+            return failure.Failure(IgnoreRequest("Aborted download of %s: " \
+                "body larger than download max size (%d)" % (self.request, \
+                self.maxsize)))
+
+    def _aborted(self, length):
+        for spider in (None, self.spider) if self.spider else (None,):
+            stats.inc_value('downloader/response_aborted_count', spider=spider)
+            stats.inc_value('downloader/response_aborted_bytes', length, \
+                spider=spider)
+
+    def spool_file(self):
+        """Return the temporary file where the response body should be
+        written to, or None to keep it in memory. Must be called after the
+        response headers were received.
+        """
+        spool = self.spool
+        if spool is None and self.spool_threshold:
+            try:
+                length = int(self.response_headers.get('Content-Length'))
+            except (TypeError, ValueError):
+                length = None
+            spool = length > self.spool_threshold
+        if spool:
+            return SpooledTemporaryFile(max_size=SPOOL_MAX_MEMORY)
+
+
+class ScrapyHTTP11PageGetter(LineReceiver):
+    """HTTP/1.1 client protocol which can send many requests, one after the
+    other, over the same connection. Connections are created and recycled by
+    a HTTPConnectionPool, which feeds them with ScrapyHTTP11ClientFactory
+    instances (one per request) through the sendRequest() method.
+    """
+
+    delimiter = '\n'
+
+    def __init__(self, pool, key):
+        self.pool = pool
+        self.key = key
+        self.factory = None
+        self.reused = False
+        self._timeoutcall = None
+        self._closed = None
+
+    def sendRequest(self, factory, reused=False):
+        self.factory = factory
+        self.reused = factory.reused_connection = reused
+        self.headers = Headers() # bucket for response headers
+        self._state = 'status'
+        self._header = ''
+        self._received = False
+        self._persistent = False
+        self._chunked = False
+        self._remaining = None
+        self._body = None
+        self._spool = None
+        self.setLineMode()
+
+        # Method command
+        self.transport.write('%s %s HTTP/1.1\r\n' % (factory.method, factory.path))
+        # Headers
+        for key, values in factory.headers.items():
+            for value in values:
+                self.transport.write('%s: %s\r\n' % (key, value))
+        self.transport.write('\r\n')
+        # Body
+        if factory.body is not None:
+            self.transport.write(factory.body)
+
+        if factory.timeout:
+            self._timeoutcall = reactor.callLater(factory.timeout, self.timeout)
+
+    def dataReceived(self, data):
+        if self.factory is None:
+            # nobody asked for this data, the connection can't be trusted
+            self.transport.loseConnection()
+            return
+        self._received = True
+        return LineReceiver.dataReceived(self, data)
+
+    def lineReceived(self, line):
+        if self.factory is None:
+            return # the download was aborted, ignore the rest of the data
+        line = line.rstrip()
+        if self._state == 'status':
+            self._status_received(line)
+        elif self._state == 'headers':
+            self._header_received(line)
+        elif self._state == 'chunk-length':
+            try:
+                self._remaining = int(line.split(';', 1)[0], 16)
+            except ValueError:
+                self._fail(failure.Failure(PartialDownloadError( \
+                    self.factory.status, 'Invalid chunk length', \
+                    self._received_body())))
+                return
+            if self._remaining:
+                self._state = 'chunk'
+                self.setRawMode()
+            else:
+                self._state = 'trailer'
+        elif self._state == 'chunk-end':
+            self._state = 'chunk-length'
+        elif self._state == 'trailer':
+            if not line:
+                self._finish()
+
+    def _status_received(self, line):
+        l = line.split(None, 2)
+        if not l:
+            return # tolerate empty lines before the status line
+        version, status = l[0], l[1]
+        message = l[2] if len(l) > 2 else ''
+        self.version = version
+        self.factory.gotStatus(version, status, message)
+        self._state = 'headers'
+
+    def _header_received(self, line):
+        if line and line[0] in ' \t':
+            self._header = self._header + line
+            return
+        if self._header:
+            key, value = self._header.split(':', 1)
+            self.headers.appendlist(key, value.lstrip())
+        self._header = line
+        if not line:
+            self._end_headers()
+
+    def _end_headers(self):
+        status = int(self.factory.status)
+        if 100 <= status < 200:
+            # informational response (ie. 100 Continue), wait for the real one
+            self.headers = Headers()
+            self._state = 'status'
+            return
+
+        self.factory.gotHeaders(self.headers)
+        reason = self.factory.check_headers()
+        if reason is not None:
+            # the rest of the response is not wanted, so the connection
+            # can't be reused
+            self._fail(reason)
+            return
+        self._persistent = self._is_persistent()
+        self._spool = self.factory.spool_file()
+        self._body = self._spool if self._spool is not None else StringIO()
+        self._size = 0
+        if self.factory.method.upper() == 'HEAD' or status in (204, 304):
+            self._finish()
+        elif 'chunked' in self.headers.get('Transfer-Encoding', '').lower():
+            self._chunked = True
+            self._state = 'chunk-length'
+        elif 'Content-Length' in self.headers:
+            self._remaining = int(self.headers['Content-Length'])
+            self._state = 'body'
+            if self._remaining:
+                self.setRawMode()
+            else:
+                self._finish()
+        else:
+            # body delimited by connection close
+            self._persistent = False
+            self._state = 'body'
+            self.setRawMode()
+
+    def _is_persistent(self):
+        tokens = set()
+        for value in self.headers.getlist('Connection') + \
+                self.factory.headers.getlist('Connection'):
+            tokens.update(x.strip().lower() for x in value.split(','))
+        if 'close' in tokens:
+            return False
+        return self.version == 'HTTP/1.1' or 'keep-alive' in tokens
+
+    def rawDataReceived(self, data):
+        if self.factory is None:
+            return
+        if self._remaining is None:
+            self._write_body(data)
+            return
+        data, rest = data[:self._remaining], data[self._remaining:]
+        self._remaining -= len(data)
+        if not self._write_body(data):
+            return
+        if self._remaining:
+            return
+        if self._chunked:
+            self._state = 'chunk-end'
+            self.setLineMode(rest)
+        else:
+            self._finish(rest)
+
+    def _write_body(self, data):
+        self._size += len(data)
+        reason = self.factory.check_size(self._size)
+        if reason is not None:
+            self._fail(reason)
+            return False
+        self._body.write(data)
+        return True
+
+    def _finish(self, rest=''):
+        factory, self.factory = self.factory, None
+        self._cancel_timeout()
+        body = self._received_body() if factory.method.upper() != 'HEAD' else ''
+        self._body = self._spool = None
+        if self._persistent and not rest:
+            self.pool._release(self)
+        else:
+            self.transport.loseConnection()
+        factory.page(body)
+
+    def _received_body(self):
+        if self._body is self._spool:
+            return self._body
+        return self._body.getvalue()
+
+    def _fail(self, reason):
+        factory, self.factory = self.factory, None
+        self._cancel_timeout()
+        self.transport.loseConnection()
+        factory.noPage(reason)
+
+    def timeout(self):
+        self._timeoutcall = None
+        self._fail(defer.TimeoutError("Getting %s took longer than %s seconds." % \
+            (self.factory.url, self.factory.timeout)))
+
+    def _cancel_timeout(self):
+        if self._timeoutcall and self._timeoutcall.active():
+            self._timeoutcall.cancel()
+        self._timeoutcall = None
+
+    def close(self):
+        """Close the connection and return a deferred fired once it's lost"""
+        self._closed = defer.Deferred()
+        self.transport.loseConnection()
+        return self._closed
+
+    def connectionLost(self, reason):
+        self._cancel_timeout()
+        factory, self.factory = self.factory, None
+        self.pool._connection_lost(self)
+        if self._closed is not None:
+            self._closed.callback(None)
+        if factory is None:
+            return
+        if self.reused and not self._received:
+            # the server closed the idle connection before getting our
+            # request, it's safe to send it again through another one
+            self.pool._send(self.key, factory)
+        elif self._state == 'body' and self._remaining is None:
+            factory.page(self._received_body())
+        elif self._body is not None:
+            factory.noPage(failure.Failure(PartialDownloadError( \
+                factory.status, None, self._received_body())))
+        else:
+            factory.noPage(reason)
+
+
+class ScrapyHTTP11ClientFactory(ScrapyHTTPClientFactory):
+    """Request factory used with HTTPConnectionPool. Unlike its parent, it
+    doesn't build connections by itself: it only holds the request data and
+    fires the deferred with the response built by the protocol.
+    """
+
+    reused_connection = None
+
+    def __init__(self, request, timeout=180):
+        ScrapyHTTPClientFactory.__init__(self, request, timeout)
+        # connections are persistent unless the request explicitly asks
+        # otherwise
+        if 'Connection' not in request.headers:
+            self.headers.pop('Connection', None)
+
+
+class HTTPConnectionPool(object):
+    """Keep HTTP/1.1 connections alive to reuse them in later requests.
+
+    Connections are keyed by a ``(scheme, host, port, proxy)`` tuple. At most
+    ``maxidle_perhost`` idle connections are kept per key, for no more than
+    ``idle_timeout`` seconds. If ``maxsockets`` is non-zero, no more than that
+    many connections are open at the same time, and requests wait for a free
+    connection.
+    """
+
+    protocol = ScrapyHTTP11PageGetter
+
+    def __init__(self, maxidle_perhost=2, idle_timeout=60, maxsockets=0):
+        self.maxidle_perhost = maxidle_perhost
+        self.idle_timeout = idle_timeout
+        self.maxsockets = maxsockets
+        self.connections = 0
+        self._idle = {}
+        self._idlecalls = {}
+        self._waiting = []
+
+    def download(self, key, factory):
+        """Send the request held by the given ScrapyHTTP11ClientFactory
+        through a connection to ``key``, and return the factory deferred
+        """
+        self._send(key, factory)
+        return factory.deferred
+
+    def idle_connections(self, key=None):
+        if key is not None:
+            return len(self._idle.get(key, ()))
+        return sum(len(x) for x in self._idle.values())
+
+    def close(self):
+        """Close all idle connections. Return a deferred fired once they have
+        all been closed"""
+        dfds = []
+        for key in self._idle.keys():
+            while self._idle.get(key):
+                dfds.append(self._pop_idle(key).close())
+        return defer.DeferredList(dfds)
+
+    def _send(self, key, factory):
+        conn = self._pop_idle(key)
+        if conn is not None:
+            conn.sendRequest(factory, reused=True)
+        elif self.maxsockets and self.connections >= self.maxsockets:
+            self._waiting.append((key, factory))
+            # free a socket held by an idle connection to another host
+            for otherkey in self._idle.keys():
+                if self._idle[otherkey]:
+                    self._pop_idle(otherkey).transport.loseConnection()
+                    break
+        else:
+            self._connect(key, factory)
+
+    def _connect(self, key, factory):
+        self.connections += 1
+        scheme, host, port = key[:3]
+        creator = ClientCreator(reactor, self.protocol, self, key)
+        if scheme == 'https':
+            from twisted.internet.ssl import ClientContextFactory
+            d = creator.connectSSL(host, port, ClientContextFactory())
+        else:
+            d = creator.connectTCP(host, port)
+        d.addCallbacks(lambda conn: conn.sendRequest(factory), \
+            self._connect_failed, errbackArgs=(factory,))
+
+    def _connect_failed(self, _failure, factory):
+        self.connections -= 1
+        factory.noPage(_failure)
+        self._process_waiting()
+
+    def _pop_idle(self, key):
+        conns = self._idle.get(key)
+        if not conns:
+            return
+        conn = conns.pop()
+        if not conns:
+            del self._idle[key]
+        call = self._idlecalls.pop(conn, None)
+        if call and call.active():
+            call.cancel()
+        return conn
+
+    def _release(self, conn):
+        for i, (key, factory) in enumerate(self._waiting):
+            if key == conn.key:
+                del self._waiting[i]
+                conn.sendRequest(factory, reused=True)
+                return
+        if self._waiting or self.idle_connections(conn.key) >= self.maxidle_perhost:
+            conn.transport.loseConnection()
+            return
+        self._idle.setdefault(conn.key, []).append(conn)
+        if self.idle_timeout:
+            self._idlecalls[conn] = reactor.callLater(self.idle_timeout, \
+                conn.transport.loseConnection)
+
+    def _connection_lost(self, conn):
+        self.connections -= 1
+        conns = self._idle.get(conn.key, [])
+        if conn in conns:
+            conns.remove(conn)
+            if not conns:
+                del self._idle[conn.key]
+            call = self._idlecalls.pop(conn, None)
+            if call and call.active():
+                call.cancel()
+        self._process_waiting()
+
+    def _process_waiting(self):
+        while self._waiting and not (self.maxsockets and \
+                self.connections >= self.maxsockets):
+            key, factory = self._waiting.pop(0)
+            self._send(key, factory)
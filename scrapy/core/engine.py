@@ -21,6 +21,10 @@ from scrapy.utils.defer import mustbe_deferred
 
 class ExecutionEngine(object):
 
+    # seconds to wait before checking again a spider kept open (while idle)
+    # by a DontCloseSpider exception
+    IDLE_POLL_INTERVAL = 5
+
     def __init__(self, settings, spider_closed_callback):
         self.settings = settings
         self.closing = {} # dict (spider -> reason) of spiders being closed
@@ -28,6 +32,9 @@ class ExecutionEngine(object):
         self.running = False
         self.paused = False
         self._next_request_calls = {}
+        self._idle_calls = {}
+        self.opening = set() # spiders being opened
+        self.unfinished = {} # dict (spider -> set) of requests being processed, with JOBDIR
         self.scheduler = load_object(settings['SCHEDULER'])()
         self.downloader = Downloader()
         self.scraper = Scraper(self, self.settings)
@@ -55,6 +62,8 @@ class ExecutionEngine(object):
     def unpause(self):
         """Resume the execution engine"""
         self.paused = False
+        for spider in self.open_spiders:
+            self.next_request(spider)
 
     def is_idle(self):
         return self.scheduler.is_idle() and self.downloader.is_idle() and \
@@ -77,8 +86,8 @@ class ExecutionEngine(object):
         else:
             return
 
-        if self.paused:
-            return reactor.callLater(5, self.next_request, spider)
+        if self.paused: # unpause() wakes up the spiders
+            return
 
         while not self._needs_backout(spider):
             if not self._next_request(spider):
@@ -90,19 +99,61 @@ class ExecutionEngine(object):
     def _needs_backout(self, spider):
         return not self.running \
             or self.spider_is_closed(spider) \
+            or spider in self.closing \
             or self.downloader.sites[spider].needs_backout() \
             or self.scraper.sites[spider].needs_backout()
 
     def _next_request(self, spider):
         # Next pending request from scheduler
         request, deferred = self.scheduler.next_request(spider)
-        if request:
+        if request and deferred is None:
+            # disk queues don't keep deferreds, the download output goes
+            # straight to the scraper
+            if spider in self.unfinished:
+                self.unfinished[spider].add(request)
+            dwld = mustbe_deferred(self._download, request, spider)
+            dwld.addBoth(self._handle_downloader_output, request, spider)
+            dwld.addErrback(log.err, "Unhandled error on engine._next_request()",
+                spider=spider)
+            dwld.addBoth(lambda _: self.next_request(spider))
+            return dwld
+        elif request:
+            def _downloaded(response):
+                # the download freed a downloader slot, fill it while this
+                # response is being scraped
+                self.next_request(spider)
+                return response
             dwld = mustbe_deferred(self.download, request, spider)
+            dwld.addBoth(_downloaded)
             dwld.chainDeferred(deferred).addBoth(lambda _: deferred)
             dwld.addErrback(log.err, "Unhandled error on engine._next_request()",
                 spider=spider)
             return dwld
 
+    def _handle_downloader_output(self, response, request, spider):
+        # the download freed a downloader slot, fill it while this response
+        # is being scraped
+        self.next_request(spider)
+        if spider in self.unfinished and self.closing.get(spider) == 'shutdown' \
+                and not isinstance(response, Response):
+            # cancelled by the shutdown (or a redirect, which can't be
+            # scheduled anymore), the request is resumed with the crawl
+            return
+        # downloader middlewares can return requests (ie. redirects)
+        if isinstance(response, Request):
+            self.crawl(response, spider)
+            self._request_processed(None, request, spider)
+            return
+        dfd = self.scraper.enqueue_scrape(response, request, spider)
+        if dfd is not None:
+            dfd.addBoth(self._request_processed, request, spider)
+        return dfd
+
+    def _request_processed(self, result, request, spider):
+        if spider in self.unfinished:
+            self.unfinished[spider].discard(request)
+        return result
+
     def spider_is_idle(self, spider):
         scraper_idle = spider in self.scraper.sites \
             and self.scraper.sites[spider].is_idle()
@@ -127,7 +178,8 @@ class ExecutionEngine(object):
 
     def has_capacity(self):
         """Does the engine have capacity to handle more spiders"""
-        return len(self.downloader.sites) < self.downloader.concurrent_spiders
+        return len(self.downloader.sites) + len(self.opening) < \
+            self.downloader.concurrent_spiders
 
     def crawl(self, request, spider):
         assert spider in self.open_spiders, \
@@ -135,11 +187,17 @@ class ExecutionEngine(object):
         if spider in self.closing: # ignore requests for spiders being closed
             return
         schd = mustbe_deferred(self.schedule, request, spider)
-        # FIXME: we can't log errors because we would be preventing them from
-        # propagating to the request errback. This should be fixed after the
-        # next core refactoring.
-        #schd.addErrback(log.err, "Error on engine.crawl()")
-        schd.addBoth(self.scraper.enqueue_scrape, request, spider)
+        if self.scheduler.has_disk_queue(spider):
+            # the response is scraped as soon as it's downloaded, only
+            # requests which couldn't be scheduled (ie. filtered duplicates)
+            # go to the request errback here
+            schd.addErrback(self.scraper.enqueue_scrape, request, spider)
+        else:
+            # FIXME: we can't log errors because we would be preventing them
+            # from propagating to the request errback. This should be fixed
+            # after the next core refactoring.
+            #schd.addErrback(log.err, "Error on engine.crawl()")
+            schd.addBoth(self.scraper.enqueue_scrape, request, spider)
         schd.addErrback(log.err, "Unhandled error on engine.crawl()", spider=spider)
         schd.addBoth(lambda _: self.next_request(spider))
 
@@ -150,6 +208,20 @@ class ExecutionEngine(object):
         return self.scheduler.enqueue_request(spider, request)
 
     def download(self, request, spider):
+        """Download the given request and return a deferred fired with the
+        response. Requests returned by the downloader middlewares (ie.
+        redirects) are scheduled, or downloaded here when using a disk queue,
+        as it can't return their response.
+        """
+        def _follow(response):
+            if not isinstance(response, Request):
+                return response
+            if self.scheduler.has_disk_queue(spider):
+                return self.download(response, spider)
+            return mustbe_deferred(self.schedule, response, spider)
+        return self._download(request, spider).addCallback(_follow)
+
+    def _download(self, request, spider):
         def _on_success(response):
             """handle the result of a page download"""
             assert isinstance(response, (Response, Request))
@@ -157,9 +229,7 @@ class ExecutionEngine(object):
                 response.request = request # tie request to response received
                 log.msg(log.formatter.crawled(request, response, spider), \
                     level=log.DEBUG, spider=spider)
-                return response
-            elif isinstance(response, Request):
-                return mustbe_deferred(self.schedule, response, spider)
+            return response
 
         def _on_error(_failure):
             """handle an error processing a page"""
@@ -192,7 +262,13 @@ class ExecutionEngine(object):
         assert self.has_capacity(), "No free spider slots when opening %r" % \
             spider.name
         log.msg("Spider opened", spider=spider)
-        yield self.scheduler.open_spider(spider)
+        self.opening.add(spider)
+        try:
+            yield self.scheduler.open_spider(spider)
+        finally:
+            self.opening.discard(spider)
+        if self.settings['JOBDIR']:
+            self.unfinished[spider] = set()
         self.downloader.open_spider(spider)
         yield self.scraper.open_spider(spider)
         stats.open_spider(spider)
@@ -211,21 +287,36 @@ class ExecutionEngine(object):
             spider=spider, dont_log=DontCloseSpider)
         if any(isinstance(x, Failure) and isinstance(x.value, DontCloseSpider) \
                 for _, x in res):
-            reactor.callLater(5, self.next_request, spider)
+            # new requests wake up the spider as soon as they're scheduled,
+            # this is only a fallback for extensions which keep it open
+            # without scheduling requests
+            if spider not in self._idle_calls:
+                self._idle_calls[spider] = reactor.callLater(self.IDLE_POLL_INTERVAL, \
+                    self._idle_poll, spider)
             return
 
         if self.spider_is_idle(spider):
             self.close_spider(spider, reason='finished')
 
+    def _idle_poll(self, spider):
+        del self._idle_calls[spider]
+        self.next_request(spider)
+
     def close_spider(self, spider, reason='cancelled'):
         """Close (cancel) spider and clear all its outstanding requests"""
         if spider in self.closing:
             return defer.succeed(None)
         log.msg("Closing spider (%s)" % reason, spider=spider)
         self.closing[spider] = reason
-        self.scheduler.clear_pending_requests(spider)
+        if not (reason == 'shutdown' and self.settings['JOBDIR']):
+            # when using a job directory the pending requests are kept, to
+            # resume the crawl later
+            self.scheduler.clear_pending_requests(spider)
         dfd = self.downloader.close_spider(spider)
         self.closing_dfds[spider] = dfd
+        dfd.addBoth(lambda _: self._requeue_unfinished(spider))
+        dfd.addErrback(log.err, "Unhandled error in engine._requeue_unfinished()", \
+            spider=spider)
         dfd.addBoth(lambda _: self.scheduler.close_spider(spider))
         dfd.addErrback(log.err, "Unhandled error in scheduler.close_spider()", \
             spider=spider)
@@ -235,6 +326,18 @@ class ExecutionEngine(object):
         dfd.addBoth(lambda _: self._finish_closing_spider(spider))
         return dfd
 
+    def _requeue_unfinished(self, spider):
+        """Put back in the scheduler queue the requests which were being
+        downloaded or scraped when the spider was shut down, so that they're
+        resumed with the crawl"""
+        unfinished = self.unfinished.pop(spider, ())
+        if self.closing.get(spider) != 'shutdown' or not unfinished:
+            return
+        for request in unfinished:
+            self.scheduler.requeue_request(spider, request)
+        log.msg("Put back %d unfinished requests in the queue" % len(unfinished), \
+            spider=spider)
+
     def _close_all_spiders(self):
         dfds = [self.close_spider(s, reason='shutdown') for s in self.open_spiders]
         dfds += self.closing_dfds.values()
@@ -244,9 +347,10 @@ class ExecutionEngine(object):
     def _finish_closing_spider(self, spider):
         """This function is called after the spider has been closed"""
         reason = self.closing.pop(spider, 'finished')
-        call = self._next_request_calls.pop(spider, None)
-        if call and call.active():
-            call.cancel()
+        for calls in (self._next_request_calls, self._idle_calls):
+            call = calls.pop(spider, None)
+            if call and call.active():
+                call.cancel()
         dfd = send_catch_log_deferred(signal=signals.spider_closed, \
             spider=spider, reason=reason)
         dfd.addBoth(lambda _: stats.close_spider(spider, reason=reason))
@@ -0,0 +1,374 @@
+"""
+This module implements the pool of worker processes used to call the spider
+callbacks that are CPU-bound (see SCRAPER_PROCESSES setting), so parsing the
+responses doesn't block the reactor and can use all the CPU cores.
+
+The responses are sent to the workers and the callbacks output (Items and
+Requests) sent back, pickled. Requests are converted with request_to_dict(),
+so their callbacks must be methods of the spider.
+
+See documentation in docs/topics/spiders.rst
+"""
+
+import os
+import signal
+import traceback
+import cPickle as pickle
+from collections import deque
+
+from twisted.internet import defer, reactor
+from twisted.internet.error import ProcessTerminated
+from twisted.python.failure import Failure
+from twisted.python import log as txlog
+
+from scrapy.http import Request, TextResponse
+from scrapy.exceptions import NotConfigured
+from scrapy.utils.misc import load_object
+from scrapy.utils.reqser import request_to_dict, request_from_dict
+from scrapy.utils.spider import iterate_spider_output
+from scrapy.utils.py26 import cpu_count
+from scrapy import log
+
+try:
+    import multiprocessing
+except ImportError:
+    multiprocessing = None
+
+
+def uses_processes(spider):
+    """Return True if some callback of the spider may be called in a worker
+    process: the spider has the run_in_process attribute set or some of its
+    methods have the run_in_process decorator"""
+    if getattr(spider, 'run_in_process', False):
+        return True
+    for cls in type(spider).__mro__:
+        for value in vars(cls).itervalues():
+            if getattr(value, 'run_in_process', False):
+                return True
+    return False
+
+def runs_in_process(callback, request, spider):
+    """Return True if the given callback must be called in a worker process.
+    The run_in_process request meta key takes precedence over the callback
+    attribute (see scrapy.utils.decorator.run_in_process) and the spider
+    attribute with the same name."""
+    value = request.meta.get('run_in_process')
+    if value is None:
+        value = getattr(callback, 'run_in_process', None)
+    if value is None:
+        value = getattr(spider, 'run_in_process', False)
+    return bool(value)
+
+
+class ProcessPool(object):
+    """Pool of worker processes to call the callbacks of a spider.
+
+    The workers are forked when the pool is created (and when a worker is
+    replaced), so they get a copy of the spider as it was at that time.
+    Changes made to it by the callbacks called in the workers, and the stats
+    collected there, aren't seen by the main process (nor by the other
+    workers): they're lost.
+
+    The workers close the file descriptors inherited from the main process
+    (the sockets and pipes of the reactor, among others), except their own
+    pipe, the standard streams and the log file.
+
+    Each worker runs one task at a time, sent through its own pipe, which is
+    read by the reactor. A task fails if its worker dies, or is killed when
+    it takes more than timeout seconds (if not 0), and the worker is
+    replaced.
+    """
+
+    def __init__(self, spider, processes=0, timeout=0):
+        if multiprocessing is None:
+            raise NotConfigured("multiprocessing module not available")
+        self.spider = spider
+        self.processes = processes or cpu_count()
+        self.timeout = timeout
+        self.pending = 0
+        self.closed = False
+        self._workers = []
+        self._idle = []
+        self._queue = deque()
+        try:
+            for _ in range(self.processes):
+                self._start_worker()
+        except (OSError, IOError), e:
+            self.close()
+            raise NotConfigured("Cannot start the worker processes: %s" % e)
+
+    def needs_backout(self):
+        """Return True if there are enough responses waiting for a worker to
+        keep all of them busy"""
+        return self.pending >= 2 * self.processes
+
+    def call(self, response, request):
+        """Call the request callback (or the spider parse method) with the
+        response in a worker process. Return a deferred with its output, or
+        with its failure if it raised an exception before returning any
+        output (the exceptions have the remote_traceback attribute), its
+        worker died (ProcessTerminated) or it timed out (TimeoutError).
+
+        Raises ValueError if the response or request can't be sent to the
+        workers.
+        """
+        task = (_response_to_dict(response), request_to_dict(request, \
+            self.spider))
+        try:
+            task = pickle.dumps(task, protocol=2)
+        except Exception, e:
+            raise ValueError("Cannot send %s to the worker processes: %s" % \
+                (response, e))
+        dfd = defer.Deferred()
+        self.pending += 1
+        self._queue.append((task, dfd))
+        self._send_tasks()
+        return dfd
+
+    def close(self):
+        """Stop the worker processes. The tasks not finished yet fail."""
+        self.closed = True
+        for worker in self._workers[:]:
+            worker.stop(Failure(ProcessTerminated(signal=signal.SIGTERM)))
+        while self._queue:
+            _, dfd = self._queue.popleft()
+            self._task_failed(dfd, \
+                Failure(ProcessTerminated(signal=signal.SIGTERM)))
+
+    def _start_worker(self):
+        worker = _Worker(self)
+        self._workers.append(worker)
+        self._idle.append(worker)
+
+    def _send_tasks(self):
+        while self._queue and self._idle:
+            task, dfd = self._queue.popleft()
+            self._idle.pop().send(task, dfd)
+
+    def _worker_finished(self, worker, result, dfd):
+        self._idle.append(worker)
+        self.pending -= 1
+        try:
+            outputs, error = pickle.loads(result)
+            outputs = [request_from_dict(x, self.spider) if isreq else x \
+                for isreq, x in outputs]
+        except Exception:
+            dfd.errback()
+        else:
+            if error is None:
+                dfd.callback(outputs)
+            elif outputs:
+                dfd.callback(_iter_output(outputs, error))
+            else:
+                dfd.errback(Failure(error))
+        self._send_tasks()
+
+    def _worker_stopped(self, worker, dfd, failure):
+        self._workers.remove(worker)
+        if worker in self._idle:
+            self._idle.remove(worker)
+        if not self.closed:
+            try:
+                self._start_worker()
+            except (OSError, IOError):
+                log.err(None, "Cannot replace worker process", \
+                    spider=self.spider)
+                if not self._workers:
+                    self.close()
+        if dfd is not None:
+            self._task_failed(dfd, failure)
+        self._send_tasks()
+
+    def _task_failed(self, dfd, failure):
+        self.pending -= 1
+        dfd.errback(failure)
+
+
+class _Worker(object):
+    """A worker process of a ProcessPool. The reactor reads the results from
+    its pipe (it's an IReadDescriptor)"""
+
+    def __init__(self, pool):
+        self.pool = pool
+        self.dfd = None
+        self.timeout_call = None
+        self.conn, child_conn = multiprocessing.Pipe()
+        # the workers are forked with the default signal handlers, not the
+        # reactor ones, so they can be stopped as soon as they're started
+        handlers = _set_signal_handlers(signal.SIG_IGN, signal.SIG_DFL)
+        try:
+            self.process = multiprocessing.Process(target=_worker_main, \
+                args=(child_conn, pool.spider))
+            self.process.daemon = True
+            try:
+                self.process.start()
+            except:
+                self.conn.close()
+                raise
+        finally:
+            _set_signal_handlers(*handlers)
+            child_conn.close()
+        reactor.addReader(self)
+
+    def send(self, task, dfd):
+        self.dfd = dfd
+        if self.pool.timeout:
+            self.timeout_call = reactor.callLater(self.pool.timeout, \
+                self.stop, Failure(defer.TimeoutError("Callback took more " \
+                "than %s seconds" % self.pool.timeout)))
+        try:
+            self.conn.send_bytes(task)
+        except (OSError, IOError):
+            self.stop()
+
+    def stop(self, failure=None):
+        """Stop the worker process, if it's still running, and fail its task
+        with the given failure or ProcessTerminated"""
+        reactor.removeReader(self)
+        self.conn.close()
+        if self.process.is_alive():
+            self.process.terminate()
+        self.process.join()
+        if failure is None:
+            code = self.process.exitcode
+            failure = Failure(ProcessTerminated(exitCode=max(code, 0) or \
+                None, signal=-min(code, 0) or None))
+        dfd, self.dfd = self.dfd, None
+        self._cancel_timeout()
+        self.pool._worker_stopped(self, dfd, failure)
+
+    def _cancel_timeout(self):
+        if self.timeout_call and self.timeout_call.active():
+            self.timeout_call.cancel()
+        self.timeout_call = None
+
+    def fileno(self):
+        # -1 tells the reactor it was closed while handling other events
+        return -1 if self.conn.closed else self.conn.fileno()
+
+    def doRead(self):
+        try:
+            result = self.conn.recv_bytes()
+        except (EOFError, IOError, OSError):
+            self.stop()
+            return
+        dfd, self.dfd = self.dfd, None
+        self._cancel_timeout()
+        self.pool._worker_finished(self, result, dfd)
+
+    def connectionLost(self, reason):
+        if not self.conn.closed:
+            self.stop()
+
+    def logPrefix(self):
+        return 'ProcessPool'
+
+
+def _iter_output(outputs, error):
+    # keep the output returned before the error, as when the callback is
+    # called in the main process
+    for output in outputs:
+        yield output
+    raise error
+
+def _response_to_dict(response):
+    d = {
+        '_class': '%s.%s' % (type(response).__module__, \
+            type(response).__name__),
+        'url': response.url,
+        'status': response.status,
+        'headers': dict(response.headers),
+        'body': response.body,
+        'flags': response.flags,
+    }
+    if isinstance(response, TextResponse):
+        # don't infer the encoding again in the worker
+        d['encoding'] = response.encoding
+    return d
+
+def _response_from_dict(d, request):
+    d = d.copy()
+    cls = load_object(d.pop('_class'))
+    return cls(request=request, **d)
+
+
+# the spider of the worker process, set by _worker_main()
+_spider = None
+
+def _worker_main(conn, spider):
+    """Main function of the worker processes: call the callbacks of the tasks
+    received from conn and send back the results, until it's closed"""
+    global _spider
+    # interrupts are handled by the main process, which stops the workers
+    _set_signal_handlers(signal.SIG_IGN, signal.SIG_DFL)
+    # the workers may be forked while crawling, so close the sockets and pipes
+    # of the reactor (and the pipes of the other workers, so they're closed
+    # when the main process exits)
+    _close_fds([0, 1, 2, conn.fileno()] + _log_fds())
+    _spider = spider
+    while True:
+        try:
+            task = conn.recv_bytes()
+        except EOFError:
+            break
+        conn.send_bytes(_call_callback(task))
+
+def _close_fds(keep):
+    """Close all the file descriptors of the process except the given ones"""
+    try:
+        maxfd = os.sysconf('SC_OPEN_MAX')
+    except (AttributeError, ValueError, OSError):
+        maxfd = 256
+    low = 0
+    for fd in sorted(set(keep)):
+        os.closerange(low, fd)
+        low = fd + 1
+    os.closerange(low, max(maxfd, low))
+
+def _log_fds():
+    """Return the file descriptors of the files the log observers write to"""
+    fds = []
+    for observer in txlog.theLogPublisher.observers:
+        write = getattr(getattr(observer, 'im_self', None), 'write', None)
+        try:
+            fds.append(write.__self__.fileno())
+        except (AttributeError, ValueError, IOError):
+            pass
+    return fds
+
+def _set_signal_handlers(sigint, sigterm):
+    """Set the SIGINT and SIGTERM handlers, return the previous ones"""
+    return signal.signal(signal.SIGINT, sigint), \
+        signal.signal(signal.SIGTERM, sigterm)
+
+def _call_callback(task):
+    """Called in the worker processes to call the callback of a task sent by
+    ProcessPool.call(). Returns the pickled output and exception raised (or
+    None)"""
+    outputs = []
+    error = None
+    try:
+        response, request = pickle.loads(task)
+        request = request_from_dict(request, _spider)
+        response = _response_from_dict(response, request)
+        callback = request.callback or _spider.parse
+        for output in iterate_spider_output(callback(response)):
+            if isinstance(output, Request):
+                outputs.append((True, request_to_dict(output, _spider)))
+            else:
+                outputs.append((False, output))
+    except Exception, e:
+        error = _remote_error(e)
+    try:
+        return pickle.dumps((outputs, error), protocol=2)
+    except Exception, e:
+        return pickle.dumps(([], _remote_error(e)), protocol=2)
+
+def _remote_error(exc):
+    tb = traceback.format_exc()
+    try:
+        pickle.loads(pickle.dumps(exc, protocol=2))
+    except Exception:
+        exc = RuntimeError("%s: %s" % (type(exc).__name__, exc))
+    exc.remote_traceback = tb
+    return exc
@@ -2,10 +2,20 @@
 The Scrapy Scheduler
 """
 
-from twisted.internet import defer
+import os
+import shutil
+import tempfile
+import cPickle as pickle
+
+from twisted.internet import defer, task
 from twisted.python.failure import Failure
 
+from scrapy import log, signals
 from scrapy.utils.datatypes import PriorityQueue, PriorityStack
+from scrapy.utils.diskqueue import DiskBackedPriorityQueue
+from scrapy.utils.reqser import request_to_dict, request_from_dict
+from scrapy.utils.job import job_dir
+from scrapy.utils.signal import send_catch_log
 from scrapy.core.schedulermw import SchedulerMiddlewareManager
 from scrapy.exceptions import IgnoreRequest
 from scrapy.conf import settings
@@ -21,6 +31,11 @@ class Scheduler(object):
     def __init__(self):
         self.pending_requests = {}
         self.dfo = settings['SCHEDULER_ORDER'].upper() == 'DFO'
+        self.disk_queue = settings.getbool('SCHEDULER_DISK_QUEUE')
+        self.memory_queue_size = settings.getint('SCHEDULER_MEMORY_QUEUE_SIZE')
+        self.checkpoint_interval = settings.getfloat('JOBDIR_CHECKPOINT_INTERVAL')
+        self.checkpoint_tasks = {}
+        self.job_dirs = {} # spider -> job directory (None without JOBDIR)
         self.middleware = SchedulerMiddlewareManager.from_settings(settings)
 
     def spider_is_open(self, spider):
@@ -37,9 +52,56 @@ class Scheduler(object):
         if spider in self.pending_requests:
             raise RuntimeError('Scheduler spider already opened: %s' % spider)
 
-        Priority = PriorityStack if self.dfo else PriorityQueue
-        self.pending_requests[spider] = Priority()
-        return self.middleware.open_spider(spider)
+        self.job_dirs[spider] = job_dir(settings, spider)
+        self.pending_requests[spider] = q = self._new_queue(spider)
+        dfd = self.middleware.open_spider(spider)
+        if self.job_dirs[spider]:
+            if q:
+                log.msg("Resuming crawl (%d requests scheduled)" % len(q), \
+                    spider=spider)
+            tsk = task.LoopingCall(self.checkpoint, spider)
+            tsk.start(self.checkpoint_interval, now=False)
+            self.checkpoint_tasks[spider] = tsk
+        return dfd
+
+    def checkpoint(self, spider):
+        """Save the pending requests of the given spider (and the state of
+        the scheduler middlewares) to the job directory, so that the crawl can
+        be resumed from this point even if the process is killed"""
+        self.pending_requests[spider].flush()
+        self.middleware.checkpoint(spider)
+
+    def has_disk_queue(self, spider):
+        """Return True if the pending requests of the given spider are kept
+        in a disk-backed queue, which doesn't keep a deferred for each request
+        (see next_request)"""
+        if self.disk_queue:
+            return True
+        if spider in self.job_dirs:
+            return self.job_dirs[spider] is not None
+        return bool(settings['JOBDIR']) # not opened yet
+
+    def _new_queue(self, spider):
+        jobdir = self.job_dirs[spider]
+        if not self.has_disk_queue(spider):
+            Priority = PriorityStack if self.dfo else PriorityQueue
+            return Priority()
+        def serialize(request):
+            try:
+                return pickle.dumps(request_to_dict(request, spider), protocol=2)
+            except (ValueError, TypeError, pickle.PicklingError):
+                return # keep it in memory
+        def deserialize(data):
+            return request_from_dict(pickle.loads(data), spider)
+        if jobdir:
+            # keep all requests on disk, to resume the crawl from them
+            path = os.path.join(jobdir, 'requests.queue')
+            memsize = 0
+        else:
+            path = tempfile.mkdtemp(prefix='scrapy-queue-')
+            memsize = self.memory_queue_size
+        return DiskBackedPriorityQueue(path, serialize, deserialize, \
+            lifo=self.dfo, memsize=memsize)
 
     def close_spider(self, spider):
         """Called when a spider has finished scraping to free any resources
@@ -47,21 +109,56 @@ class Scheduler(object):
         """
         if spider not in self.pending_requests:
             raise RuntimeError('Scheduler spider is not open: %s' % spider)
-        self.pending_requests.pop(spider, None)
+        q = self.pending_requests.pop(spider)
+        self.job_dirs.pop(spider)
+        tsk = self.checkpoint_tasks.pop(spider, None)
+        if tsk is not None:
+            tsk.stop()
+            lost = q.close()
+            if lost:
+                log.msg("%d requests could not be stored in the job directory " \
+                    "(their callbacks are not spider methods or their meta " \
+                    "can't be pickled) and were discarded" % lost, \
+                    level=log.WARNING, spider=spider)
+        else:
+            self._discard_queue(q)
         return self.middleware.close_spider(spider)
 
+    def _discard_queue(self, q):
+        if isinstance(q, DiskBackedPriorityQueue):
+            q.close()
+            shutil.rmtree(q.path, ignore_errors=True)
+
     def enqueue_request(self, spider, request):
         """Enqueue a request to be downloaded for a spider that is currently being scraped."""
-        return self.middleware.enqueue_request(self._enqueue_request, spider, request)
+        return self.middleware.enqueue_request(self._schedule_request, spider, request)
+
+    def _schedule_request(self, spider, request):
+        send_catch_log(signal=signals.request_scheduled, request=request, \
+            spider=spider)
+        return self._enqueue_request(spider, request)
 
     def _enqueue_request(self, spider, request):
+        if self.has_disk_queue(spider):
+            self.pending_requests[spider].push(request, -request.priority)
+            return
         dfd = defer.Deferred()
         self.pending_requests[spider].push((request, dfd), -request.priority)
         return dfd
 
+    def requeue_request(self, spider, request):
+        """Put back in the queue a request returned by next_request() which
+        wasn't processed, without going through the scheduler middlewares
+        (which have already seen it)"""
+        return self._enqueue_request(spider, request)
+
     def clear_pending_requests(self, spider):
         """Remove all pending requests for the given spider"""
         q = self.pending_requests[spider]
+        if self.has_disk_queue(spider):
+            self._discard_queue(q)
+            self.pending_requests[spider] = self._new_queue(spider)
+            return
         while q:
             _, dfd = q.pop()[0]
             dfd.errback(Failure(IgnoreRequest()))
@@ -70,15 +167,19 @@ class Scheduler(object):
         """Return the next available request to be downloaded for a spider.
 
         Returns a pair ``(request, deferred)`` where ``deferred`` is the
-        `Deferred` instance returned to the original requester.
+        `Deferred` instance returned to the original requester. With a disk
+        queue no deferreds are kept, and ``deferred`` is always ``None``.
 
         ``(None, None)`` is returned if there aren't any request pending for
         the given spider.
         """
         try:
-            return self.pending_requests[spider].pop()[0] # [1] is priority
+            item = self.pending_requests[spider].pop()[0] # [1] is priority
         except (KeyError, IndexError):
             return (None, None)
+        if self.has_disk_queue(spider):
+            return (item, None)
+        return item
 
     def is_idle(self):
         """Checks if the schedulers has any request pendings"""
@@ -23,6 +23,8 @@ class SchedulerMiddlewareManager(MiddlewareManager):
         super(SchedulerMiddlewareManager, self)._add_middleware(mw)
         if hasattr(mw, 'enqueue_request'):
             self.methods['enqueue_request'].append(mw.enqueue_request)
+        if hasattr(mw, 'checkpoint'):
+            self.methods['checkpoint'].append(mw.checkpoint)
 
     def enqueue_request(self, wrappedfunc, spider, request):
         def _enqueue_request(request):
@@ -37,3 +39,7 @@ class SchedulerMiddlewareManager(MiddlewareManager):
 
         deferred = mustbe_deferred(_enqueue_request, request)
         return deferred
+
+    def checkpoint(self, spider):
+        for mwfunc in self.methods['checkpoint']:
+            mwfunc(spider)
@@ -8,14 +8,21 @@ from scrapy.utils.defer import defer_result, defer_succeed, parallel, iter_errba
 from scrapy.utils.spider import iterate_spider_output
 from scrapy.utils.misc import load_object
 from scrapy.utils.signal import send_catch_log, send_catch_log_deferred
-from scrapy.exceptions import IgnoreRequest, DropItem
+from scrapy.exceptions import IgnoreRequest, DropItem, NotConfigured
 from scrapy import signals
 from scrapy.http import Request, Response
 from scrapy.item import BaseItem
 from scrapy.core.spidermw import SpiderMiddlewareManager
+from scrapy.core.processpool import ProcessPool, runs_in_process, \
+    uses_processes
 from scrapy import log
 from scrapy.stats import stats
 
+try:
+    from scrapy.selector.lxmlsel import pop_parses_avoided
+except ImportError:
+    pop_parses_avoided = None
+
 
 class SpiderInfo(object):
     """Object for holding data of the responses being scraped"""
@@ -29,14 +36,12 @@ class SpiderInfo(object):
         self.active_size = 0
         self.itemproc_size = 0
         self.closing = None
+        self.pool = None
 
     def add_response_request(self, response, request):
         deferred = defer.Deferred()
         self.queue.append((response, request, deferred))
-        if isinstance(response, Response):
-            self.active_size += max(len(response.body), self.MIN_RESPONSE_SIZE)
-        else:
-            self.active_size += self.MIN_RESPONSE_SIZE
+        self.active_size += self._response_size(response)
         return deferred
 
     def next_response_request_deferred(self):
@@ -46,15 +51,20 @@ class SpiderInfo(object):
 
     def finish_response(self, response):
         self.active.remove(response)
-        if isinstance(response, Response):
-            self.active_size -= max(len(response.body), self.MIN_RESPONSE_SIZE)
-        else:
-            self.active_size -= self.MIN_RESPONSE_SIZE
+        self.active_size -= self._response_size(response)
+
+    def _response_size(self, response):
+        # spooled bodies live on disk, so they don't count as active size
+        if isinstance(response, Response) and not response.spooled:
+            return max(len(response.body), self.MIN_RESPONSE_SIZE)
+        return self.MIN_RESPONSE_SIZE
 
     def is_idle(self):
         return not (self.queue or self.active)
 
     def needs_backout(self):
+        if self.pool and self.pool.needs_backout():
+            return True
         return self.active_size > self.max_active_size
 
 class Scraper(object):
@@ -65,13 +75,24 @@ class Scraper(object):
         itemproc_cls = load_object(settings['ITEM_PROCESSOR'])
         self.itemproc = itemproc_cls.from_settings(settings)
         self.concurrent_items = settings.getint('CONCURRENT_ITEMS')
+        self.processes = settings.getint('SCRAPER_PROCESSES')
+        self.process_timeout = settings.getfloat('SCRAPER_PROCESS_TIMEOUT')
         self.engine = engine
 
     @defer.inlineCallbacks
     def open_spider(self, spider):
         """Open the given spider for scraping and allocate resources for it"""
         assert spider not in self.sites, "Spider already opened: %s" % spider
-        self.sites[spider] = SpiderInfo()
+        site = self.sites[spider] = SpiderInfo()
+        if uses_processes(spider):
+            # forked before starting the downloads, and the threads they use
+            try:
+                site.pool = ProcessPool(spider, self.processes, \
+                    self.process_timeout)
+            except NotConfigured, e:
+                log.msg("Calling spider callbacks in the main process: %s" % \
+                    e, log.WARNING, spider=spider)
+                site.pool = False
         yield self.itemproc.open_spider(spider)
 
     def close_spider(self, spider):
@@ -90,6 +111,8 @@ class Scraper(object):
     def _check_if_closing(self, spider, site):
         if site.closing and site.is_idle():
             del self.sites[spider]
+            if site.pool:
+                site.pool.close()
             site.closing.callback(spider)
 
     def enqueue_scrape(self, response, request, spider):
@@ -98,6 +121,7 @@ class Scraper(object):
             return
         dfd = site.add_response_request(response, request)
         def finish_scraping(_):
+            self._collect_parses_avoided(response, spider)
             site.finish_response(response)
             self._check_if_closing(spider, site)
             self._scrape_next(spider, site)
@@ -108,6 +132,13 @@ class Scraper(object):
         self._scrape_next(spider, site)
         return dfd
 
+    def _collect_parses_avoided(self, response, spider):
+        if pop_parses_avoided is not None and isinstance(response, Response):
+            avoided = pop_parses_avoided(response)
+            if avoided:
+                stats.inc_value('selector/parses_avoided', avoided, \
+                    spider=spider)
+
     def _scrape_next(self, spider, site):
         while site.queue:
             response, request, deferred = site.next_response_request_deferred()
@@ -136,14 +167,41 @@ class Scraper(object):
                 request_result, request, spider)
 
     def call_spider(self, result, request, spider):
+        if isinstance(result, Response) and runs_in_process(request.callback \
+                or spider.parse, request, spider):
+            dfd = self._call_in_process(result, request, spider)
+            if dfd is not None:
+                return dfd.addCallback(iterate_spider_output)
         dfd = defer_result(result)
         dfd.addCallbacks(request.callback or spider.parse, request.errback)
         return dfd.addCallback(iterate_spider_output)
 
+    def _call_in_process(self, response, request, spider):
+        """Call the spider callback in a worker process. Return None if it
+        must be called in the main process"""
+        site = self.sites.get(spider)
+        if site is None:
+            return
+        if site.pool is None:
+            log.msg("Calling spider callbacks in the main process: the " \
+                "worker processes are only started for spiders with the " \
+                "run_in_process attribute or decorated callbacks", \
+                log.WARNING, spider=spider)
+            site.pool = False
+        if site.pool:
+            try:
+                return site.pool.call(response, request)
+            except ValueError, e:
+                log.msg("Calling spider callback in the main process: %s" % \
+                    e, log.WARNING, spider=spider)
+
     def handle_spider_error(self, _failure, request, spider, propagated_failure=None):
         referer = request.headers.get('Referer', None)
         msg = "Spider error processing <%s> (referer: <%s>)" % \
             (request.url, referer)
+        remote_tb = getattr(_failure.value, 'remote_traceback', None)
+        if remote_tb:
+            msg += "\nTraceback in the worker process:\n%s" % remote_tb
         log.err(_failure, msg, spider=spider)
         stats.inc_value("spider_exceptions/%s" % _failure.value.__class__.__name__, \
             spider=spider)
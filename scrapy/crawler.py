@@ -41,16 +41,45 @@ class Crawler(object):
         self.queue = ExecutionQueue(self.spiders, spq, poll_interval=pollint,
             keep_alive=keepalive)
         self.engine = ExecutionEngine(self.settings, self._spider_closed)
+        self._starting = False
+        self._start_again = False
 
     @defer.inlineCallbacks
     def _start_next_spider(self):
-        spider, requests = yield defer.maybeDeferred(self.queue.get_next)
-        if spider:
-            self._start_spider(spider, requests)
-        if self.engine.has_capacity() and not self._nextcall.active():
+        """Start spiders from the queue until it's empty or the engine has no
+        more capacity. The queue is only polled again (after
+        QUEUE_POLL_INTERVAL) when it was found empty, otherwise a spider being
+        closed or appended to the queue starts the next one right away.
+        """
+        if self._starting:
+            # called while getting the next spider, check the queue again
+            # when done
+            self._start_again = True
+            return
+        self._starting = True
+        try:
+            while self.engine.running and self.engine.has_capacity():
+                self._start_again = False
+                spider, requests = yield defer.maybeDeferred(self.queue.get_next)
+                if spider:
+                    self._start_spider(spider, requests)
+                elif not self._start_again:
+                    break
+        finally:
+            self._starting = False
+        if self.engine.running and self.engine.has_capacity() and \
+                not self._nextcall.active():
             self._nextcall = reactor.callLater(self.queue.poll_interval, \
                 self._spider_closed)
 
+    def _wait_queue(self):
+        self.queue.wait().addCallback(self._queue_appended)
+
+    def _queue_appended(self, _):
+        self._wait_queue()
+        if self.engine.running and self.engine.has_capacity():
+            self._start_next_spider()
+
     @defer.inlineCallbacks
     def _start_spider(self, spider, requests):
         """Don't call this method. Use self.queue to start new spiders"""
@@ -61,7 +90,7 @@ class Crawler(object):
 
     @defer.inlineCallbacks
     def _spider_closed(self, spider=None):
-        if not self.engine.open_spiders:
+        if not (self.engine.open_spiders or self.engine.opening):
             is_finished = yield defer.maybeDeferred(self.queue.is_finished)
             if is_finished:
                 self.stop()
@@ -74,6 +103,7 @@ class Crawler(object):
         yield defer.maybeDeferred(self.configure)
         yield defer.maybeDeferred(self.engine.start)
         self._nextcall = reactor.callLater(0, self._start_next_spider)
+        self._wait_queue()
 
     @defer.inlineCallbacks
     def stop(self):
@@ -0,0 +1,129 @@
+"""
+This module implements the objects used to keep response bodies that aren't
+loaded in memory: bodies kept in (temporary) files, which can be shared by
+several responses (see Response.replace), each reader getting its own
+file-like object to read them, and the spools bodies are written to while
+they're decompressed.
+
+See documentation in docs/topics/request-response.rst
+"""
+
+import threading
+from cStringIO import StringIO
+from tempfile import TemporaryFile
+
+
+class BodyFile(object):
+    """A body kept in a file. The file may be read from several threads (see
+    HTTPCACHE_THREADS), so it's only accessed with the lock held, and each
+    reader keeps its own position.
+    """
+
+    def __init__(self, file):
+        self.file = file
+        self.lock = threading.Lock()
+
+    def open(self):
+        """Return a new file-like object to read the body from"""
+        return _FileReader(self)
+
+    def read(self):
+        """Return the whole body"""
+        return self.open().read()
+
+
+class Spool(object):
+    """A body being written (ie. decompressed), kept in memory until it's
+    bigger than threshold bytes and in a temporary file after that (never, if
+    threshold is None)"""
+
+    def __init__(self, threshold):
+        self.threshold = threshold
+        self.chunks = []
+        self.file = None
+        self.size = 0
+
+    def write(self, data):
+        self.size += len(data)
+        if self.file is not None:
+            self.file.write(data)
+            return
+        self.chunks.append(data)
+        if self.threshold is not None and self.size > self.threshold:
+            self.file = TemporaryFile(prefix='scrapy-')
+            self.file.writelines(self.chunks)
+            self.chunks = None
+
+    def getvalue(self):
+        """Return the body: a str or the temporary file"""
+        if self.file is None:
+            return ''.join(self.chunks)
+        return self.file
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+        self.chunks = self.file = None
+
+
+def spool_threshold(request, default):
+    """Return the threshold of the Spool to write the body of a response to
+    request (which may be None) to: default (the DOWNLOAD_SPOOL_THRESHOLD
+    setting) unless the download_spool request meta key forces or prevents
+    spooling the body, as in the downloader"""
+    spool = request.meta.get('download_spool') if request is not None \
+        else None
+    if spool is None:
+        return default or None
+    return 0 if spool else None
+
+def open_body(body):
+    """Return a new file-like object to read a str or BodyFile"""
+    if isinstance(body, str):
+        return StringIO(body)
+    return body.open()
+
+def read_body(body):
+    """Return the contents of a str or BodyFile"""
+    if isinstance(body, str):
+        return body
+    return body.read()
+
+
+class _FileReader(object):
+
+    def __init__(self, bodyfile):
+        self._bodyfile = bodyfile
+        self._pos = 0
+
+    def read(self, size=-1):
+        bf = self._bodyfile
+        bf.lock.acquire()
+        try:
+            bf.file.seek(self._pos)
+            data = bf.file.read() if size < 0 else bf.file.read(size)
+        finally:
+            bf.lock.release()
+        self._pos += len(data)
+        return data
+
+    def seek(self, offset, whence=0):
+        if whence == 1:
+            offset += self._pos
+        elif whence == 2:
+            bf = self._bodyfile
+            bf.lock.acquire()
+            try:
+                bf.file.seek(0, 2)
+                offset += bf.file.tell()
+            finally:
+                bf.lock.release()
+        if offset < 0:
+            raise IOError("Invalid argument")
+        self._pos = offset
+
+    def tell(self):
+        return self._pos
+
+    def close(self):
+        pass
@@ -26,6 +26,13 @@ class Headers(CaselessDict):
             return list(value)
         return [value]
 
+    def update(self, seq):
+        if isinstance(seq, Headers):
+            # already normalized, only copy the lists of values
+            dict.update(self, ((k, list(v)) for k, v in dict.iteritems(seq)))
+        else:
+            super(Headers, self).update(seq)
+
     def __getitem__(self, key):
         try:
             return super(Headers, self).__getitem__(key)[-1]
@@ -6,14 +6,16 @@ See documentation in docs/topics/request-response.rst
 """
 
 import copy
+from cStringIO import StringIO
 
 from scrapy.http.headers import Headers
+from scrapy.http.body import BodyFile
 from scrapy.utils.trackref import object_ref
 from scrapy.http.common import deprecated_setter
 
 class Response(object_ref):
 
-    __slots__ = ['_url', 'headers', 'status', '_body', 'request', \
+    __slots__ = ['_url', 'headers', 'status', '_body', '_bodyfile', 'request', \
         'flags', '__weakref__']
 
     def __init__(self, url, status=200, headers=None, body='', flags=None, request=None):
@@ -45,10 +47,19 @@ class Response(object_ref):
     url = property(_get_url, deprecated_setter(_set_url, 'url'))
 
     def _get_body(self):
+        if self._body is None:
+            self._body = self._bodyfile.read()
         return self._body
 
     def _set_body(self, body):
-        if isinstance(body, str):
+        self._bodyfile = None
+        if isinstance(body, BodyFile):
+            self._body = None
+            self._bodyfile = body
+        elif hasattr(body, 'read'):
+            self._body = None
+            self._bodyfile = BodyFile(body)
+        elif isinstance(body, str):
             self._body = body
         elif isinstance(body, unicode):
             raise TypeError("Cannot assign a unicode body to a raw Response. " \
@@ -61,6 +72,33 @@ class Response(object_ref):
 
     body = property(_get_body, deprecated_setter(_set_body, 'body'))
 
+    @property
+    def spooled(self):
+        """True if the body is read on demand, from a (temporary) file or
+        computed from another body, instead of being kept in memory"""
+        return self._bodyfile is not None
+
+    def open_body(self):
+        """Return a new file-like object, positioned at the beginning, to
+        read the body from"""
+        if self._body is None:
+            return self._bodyfile.open()
+        return StringIO(self._body)
+
+    def iter_body(self, chunk_size=65536):
+        """Iterate over the body in chunks of (at most) chunk_size bytes,
+        without loading it all in memory for spooled responses"""
+        if self._body is not None:
+            for i in xrange(0, len(self._body), chunk_size):
+                yield self._body[i:i+chunk_size]
+            return
+        f = self._bodyfile.open()
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                break
+            yield chunk
+
     def __repr__(self):
         attrs = ['url', 'status', 'body', 'headers', 'request', 'flags']
         args = ", ".join(["%s=%r" % (a, getattr(self, a)) for a in attrs])
@@ -77,7 +115,9 @@ class Response(object_ref):
         """Create a new Response with the same attributes except for those
         given new values.
         """
-        for x in ['url', 'status', 'headers', 'body', 'request', 'flags']:
+        for x in ['url', 'status', 'headers', 'request', 'flags']:
             kwargs.setdefault(x, getattr(self, x))
+        if 'body' not in kwargs:
+            kwargs['body'] = self._bodyfile if self._body is None else self._body
         cls = kwargs.pop('cls', self.__class__)
         return cls(*args, **kwargs)
@@ -25,7 +25,7 @@ class HtmlResponse(TextResponse):
 
     @memoizemethod_noargs
     def _body_declared_encoding(self):
-        chunk = self.body[:5000]
+        chunk = self.open_body().read(5000)
         match = self.METATAG_RE.search(chunk) or self.METATAG_RE2.search(chunk)
         return match.group('charset') if match else None
 
@@ -7,7 +7,11 @@ See documentation in docs/topics/request-response.rst
 
 import re
 import codecs
-from scrapy.xlib.BeautifulSoup import UnicodeDammit
+try:
+    import chardet
+except ImportError:
+    chardet = None
+
 from scrapy.http.response import Response
 from scrapy.utils.python import memoizemethod_noargs
 from scrapy.utils.encoding import encoding_exists, resolve_encoding
@@ -22,8 +26,23 @@ codecs.register_error('scrapy_replace', lambda exc: (u'\ufffd', exc.start+1))
 class TextResponse(Response):
 
     _DEFAULT_ENCODING = settings['DEFAULT_RESPONSE_ENCODING']
+    _SNIFF_SIZE = settings.getint('RESPONSE_ENCODING_SNIFF_SIZE')
     _ENCODING_RE = re.compile(r'charset=([\w-]+)', re.I)
 
+    # byte order marks and the first bytes of an xml declaration (without BOM)
+    # of the encodings that aren't ascii compatible
+    _BOMS = [
+        ('\x00\x00\xfe\xff', 'utf-32'),
+        ('\xff\xfe\x00\x00', 'utf-32'),
+        ('\xfe\xff', 'utf-16'),
+        ('\xff\xfe', 'utf-16'),
+        ('\xef\xbb\xbf', 'utf-8'),
+        ('\x00<\x00?', 'utf-16-be'),
+        ('<\x00?\x00', 'utf-16-le'),
+    ]
+    _SNIFF_RE = re.compile(r'''^\s*<\?xml[^>]*?encoding\s*=\s*["']?\s*([\w-]+)''' \
+        r'''|<meta\s[^>]*?charset\s*=\s*["']?\s*([\w-]+)''', re.I)
+
     __slots__ = ['_encoding', '_cached_benc', '_cached_ubody']
 
     def __init__(self, *args, **kwargs):
@@ -43,6 +62,7 @@ class TextResponse(Response):
 
     def _set_body(self, body):
         self._body = ''
+        self._bodyfile = None
         if isinstance(body, unicode):
             if self.encoding is None:
                 raise TypeError('Cannot convert unicode body - %s has no encoding' %
@@ -52,6 +72,9 @@ class TextResponse(Response):
             super(TextResponse, self)._set_body(body)
 
     def replace(self, *args, **kwargs):
+        if 'body' not in kwargs and self._body is None:
+            # keep the body spooled, even if inferring the encoding loads it
+            kwargs['body'] = self._bodyfile
         kwargs.setdefault('encoding', self.encoding)
         return Response.replace(self, *args, **kwargs)
 
@@ -91,15 +114,44 @@ class TextResponse(Response):
 
     def _body_inferred_encoding(self):
         if self._cached_benc is None:
-            enc = self._get_encoding()
-            dammit = UnicodeDammit(self.body, [enc])
-            benc = dammit.originalEncoding
-            self._cached_benc = benc
-            # UnicodeDammit is buggy decoding utf-16
-            if self._cached_ubody is None and benc != 'utf-16':
-                self._cached_ubody = dammit.unicode
+            self._cached_benc = self._sniff_encoding(self.open_body().read( \
+                self._SNIFF_SIZE + 1))
         return self._cached_benc
 
+    def _sniff_encoding(self, chunk):
+        """Guess the encoding of the body from its first bytes, without
+        decoding it: looking for a BOM, an encoding declared in a xml
+        declaration or meta tag and, as a last resort, for the first encoding
+        that can decode them"""
+        final = len(chunk) <= self._SNIFF_SIZE
+        chunk = chunk[:self._SNIFF_SIZE]
+        for bom, encoding in self._BOMS:
+            if chunk.startswith(bom):
+                return encoding
+        m = self._SNIFF_RE.search(chunk)
+        if m:
+            encoding = m.group(1) or m.group(2)
+            # an ascii declaration can't be right about utf-16 or utf-32
+            if encoding_exists(encoding) and not codecs.lookup( \
+                    resolve_encoding(encoding)).name.startswith(('utf-16', 'utf-32')):
+                return encoding
+        encodings = [self._DEFAULT_ENCODING, 'utf-8']
+        if not final and resolve_encoding(self._DEFAULT_ENCODING) == 'ascii':
+            # the rest of the body may not be ascii, and utf-8 decodes the
+            # same ascii text
+            encodings.pop(0)
+        for encoding in encodings:
+            try:
+                codecs.getincrementaldecoder(encoding)().decode(chunk, final)
+                return encoding
+            except UnicodeDecodeError:
+                pass
+        if chardet is not None:
+            encoding = chardet.detect(chunk)['encoding']
+            if encoding and encoding_exists(encoding):
+                return encoding
+        return 'cp1252'
+
     def _body_declared_encoding(self):
         # implemented in subclasses (XmlResponse, HtmlResponse)
         return None
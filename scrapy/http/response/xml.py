@@ -20,7 +20,7 @@ class XmlResponse(TextResponse):
 
     @memoizemethod_noargs
     def _body_declared_encoding(self):
-        chunk = self.body[:5000]
+        chunk = self.open_body().read(5000)
         match = self.XMLDECL_RE.search(chunk)
         return match.group('charset') if match else None
 
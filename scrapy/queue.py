@@ -15,6 +15,7 @@ class ExecutionQueue(object):
         self._spiders = spiders
         self._queue = queue
         self._keepalive = keep_alive
+        self._waiters = []
 
     @defer.inlineCallbacks
     def _append_next(self):
@@ -54,16 +55,32 @@ class ExecutionQueue(object):
         """
         return not self._keepalive and not bool(self.spider_requests)
 
+    def wait(self):
+        """Return a Deferred which is fired (with no result) the next time a
+        spider is appended to this queue. Spiders added to the underlying
+        spider queue are not notified, those are still found by polling
+        """
+        d = defer.Deferred()
+        self._waiters.append(d)
+        return d
+
+    def _appended(self):
+        waiters, self._waiters = self._waiters, []
+        for d in waiters:
+            d.callback(None)
+
     def append_spider(self, spider):
         """Append a Spider to crawl"""
         requests = spider.start_requests()
         self.spider_requests.append((spider, requests))
+        self._appended()
 
     def append_request(self, request, spider=None, **kwargs):
         if spider is None:
             spider = create_spider_for_request(self._spiders, request, **kwargs)
         if spider:
             self.spider_requests.append((spider, [request]))
+            self._appended()
 
     def append_url(self, url=None, spider=None, **kwargs):
         """Append a URL to crawl with the given spider. If the spider is not
@@ -77,6 +94,7 @@ class ExecutionQueue(object):
         if spider:
             requests = arg_to_iter(spider.make_requests_from_url(url))
             self.spider_requests.append((spider, requests))
+        self._appended()
 
     def append_spider_name(self, name=None, **spider_kwargs):
         """Append a spider to crawl given its name and optional arguments,
@@ -2,9 +2,13 @@
 XPath selectors based on lxml
 """
 
+import codecs
+import weakref
+
 from lxml import etree
 
 from scrapy.utils.misc import extract_regex
+from scrapy.utils.datatypes import LruCache
 from scrapy.utils.trackref import object_ref
 from scrapy.utils.python import unicode_to_str
 from scrapy.utils.decorator import deprecated
@@ -14,9 +18,62 @@ from .list import XPathSelectorList
 __all__ = ['HtmlXPathSelector', 'XmlXPathSelector', 'XPathSelector', \
     'XPathSelectorList']
 
+# maximum number of compiled XPath expressions kept, the least recently used
+# ones are discarded as spiders may build expressions dynamically
+XPATH_CACHE_SIZE = 1000
+
+_xpath_cache = LruCache(XPATH_CACHE_SIZE)
+
+def compile_xpath(xpath, namespaces=None):
+    """Return the compiled etree.XPath for the given expression and namespaces
+    (a dict), reusing the ones already compiled in this process"""
+    key = (xpath, tuple(sorted(namespaces.items())) if namespaces else None)
+    compiled = _xpath_cache.get(key)
+    if compiled is None:
+        compiled = _xpath_cache[key] = etree.XPath(xpath, namespaces=namespaces)
+    return compiled
+
+# response -> {parser class: root element}, the trees are freed along with
+# their responses
+_document_cache = weakref.WeakKeyDictionary()
+
+# response -> number of parses avoided by _document_cache, collected in the
+# selector/parses_avoided stat of the spider by the scraper
+_parses_avoided = weakref.WeakKeyDictionary()
+
+def get_root(response, parser=etree.HTMLParser):
+    """Return the root element of the given response parsed with the given
+    parser class, parsing it only the first time for each response (so
+    selectors, link extractors and item loaders share the same tree)"""
+    cache = _document_cache.setdefault(response, {})
+    if parser in cache:
+        _parses_avoided[response] = _parses_avoided.get(response, 0) + 1
+    else:
+        body, encoding = response.body, response.encoding
+        # libxml2 doesn't know some of the names python gives to encodings
+        # (like latin-1), so try the canonical one and, as a last resort,
+        # parse the body re-encoded to utf-8
+        for name in (encoding, codecs.lookup(encoding).name):
+            try:
+                parser_obj = parser(encoding=name, recover=True)
+                break
+            except LookupError:
+                pass
+        else:
+            body = response.body_as_unicode().encode('utf-8')
+            parser_obj = parser(encoding='utf-8', recover=True)
+        cache[parser] = etree.fromstring(body, base_url=response.url, \
+            parser=parser_obj)
+    return cache[parser]
+
+def pop_parses_avoided(response):
+    """Return the number of times the given response wasn't parsed again
+    thanks to get_root(), since the last call"""
+    return _parses_avoided.pop(response, 0)
+
 class XPathSelector(object_ref):
 
-    __slots__ = ['response', 'text', 'expr', 'namespaces', '_root', '_xpathev', \
+    __slots__ = ['response', 'text', 'expr', 'namespaces', '_root', \
         '__weakref__']
     _parser = etree.HTMLParser
     _tostring_method = 'html'
@@ -28,27 +85,18 @@ class XPathSelector(object_ref):
         else:
             self.response = response
         self._root = root
-        self._xpathev = None
         self.namespaces = namespaces
         self.expr = expr
 
     @property
     def root(self):
         if self._root is None:
-            parser = self._parser(encoding=self.response.encoding, recover=True)
-            self._root = etree.fromstring(self.response.body, parser=parser, \
-                base_url=self.response.url)
+            self._root = get_root(self.response, self._parser)
         return self._root
 
-    @property
-    def xpathev(self):
-        if self._xpathev is None:
-            self._xpathev = etree.XPathEvaluator(self.root, namespaces=self.namespaces)
-        return self._xpathev
-
     def select(self, xpath):
         try:
-            result = self.xpathev(xpath)
+            result = compile_xpath(xpath, self.namespaces)(self.root)
         except etree.XPathError:
             raise ValueError("Invalid XPath: %s" % xpath)
         if hasattr(result, '__iter__'):
@@ -15,6 +15,11 @@ Scrapy developers, if you add a setting here remember to:
 
 from os.path import join, abspath, dirname
 
+AUTOTHROTTLE_ENABLED = False
+AUTOTHROTTLE_MAX_DELAY = 60.0
+AUTOTHROTTLE_START_DELAY = 5.0
+AUTOTHROTTLE_TARGET_CONCURRENCY = 1.0
+
 BOT_NAME = 'scrapybot'
 BOT_VERSION = '1.0'
 
@@ -25,6 +30,9 @@ CLOSESPIDER_ITEMPASSED = 0
 COMMANDS_MODULE = ''
 
 CONCURRENT_ITEMS = 100
+CONCURRENT_REQUESTS = 0
+CONCURRENT_REQUESTS_PER_DOMAIN = 8
+CONCURRENT_REQUESTS_PER_IP = 0
 CONCURRENT_REQUESTS_PER_SPIDER = 8
 CONCURRENT_SPIDERS = 8
 
@@ -52,6 +60,17 @@ DOWNLOAD_HANDLERS_BASE = {
     's3': 'scrapy.core.downloader.handlers.s3.S3DownloadHandler',
 }
 
+DOWNLOAD_MAXSIZE = 0
+
+DOWNLOAD_MIMETYPES_ALLOWED = []
+DOWNLOAD_MIMETYPES_DENIED = []
+
+DOWNLOAD_POLICY_ENABLED = False
+
+DOWNLOAD_SPOOL_THRESHOLD = 10485760  # 10mb
+
+DOWNLOAD_STATUS_DENIED = []
+
 DOWNLOAD_TIMEOUT = 180      # 3mins
 
 DOWNLOADER_DEBUG = False
@@ -65,6 +84,7 @@ DOWNLOADER_MIDDLEWARES_BASE = {
     'scrapy.contrib.downloadermiddleware.robotstxt.RobotsTxtMiddleware': 100,
     'scrapy.contrib.downloadermiddleware.httpauth.HttpAuthMiddleware': 300,
     'scrapy.contrib.downloadermiddleware.downloadtimeout.DownloadTimeoutMiddleware': 350,
+    'scrapy.contrib.downloadermiddleware.downloadpolicy.DownloadPolicyMiddleware': 375,
     'scrapy.contrib.downloadermiddleware.useragent.UserAgentMiddleware': 400,
     'scrapy.contrib.downloadermiddleware.retry.RetryMiddleware': 500,
     'scrapy.contrib.downloadermiddleware.defaultheaders.DefaultHeadersMiddleware': 550,
@@ -77,10 +97,18 @@ DOWNLOADER_MIDDLEWARES_BASE = {
     # Downloader side
 }
 
+DOWNLOADER_POOL_IDLE_TIMEOUT = 60
+DOWNLOADER_POOL_MAXIDLE_PER_HOST = 2
+DOWNLOADER_POOL_MAXSOCKETS = 0
+
 DOWNLOADER_STATS = True
 
+DUPEFILTER_BLOOM_ERROR_RATE = 0.001
+
 DUPEFILTER_CLASS = 'scrapy.contrib.dupefilter.RequestFingerprintDupeFilter'
 
+DUPEFILTER_DISK_BATCH_SIZE = 100000
+
 ENCODING_ALIASES = {}
 
 ENCODING_ALIASES_BASE = {
@@ -148,19 +176,29 @@ FEED_EXPORTERS_BASE = {
     'xml': 'scrapy.contrib.exporter.XmlItemExporter',
 }
 
+HTTPCACHE_COMPRESSION_LEVEL = 6
 HTTPCACHE_ENABLED = False
 HTTPCACHE_DIR = 'httpcache'
 HTTPCACHE_IGNORE_MISSING = False
+HTTPCACHE_MAXSIZE = 0
 HTTPCACHE_STORAGE = 'scrapy.contrib.downloadermiddleware.httpcache.FilesystemCacheStorage'
 HTTPCACHE_EXPIRATION_SECS = 0
 HTTPCACHE_IGNORE_HTTP_CODES = []
 HTTPCACHE_IGNORE_SCHEMES = ['file']
+HTTPCACHE_POLICY = 'scrapy.contrib.downloadermiddleware.httpcache.DummyPolicy'
+HTTPCACHE_THREADS = 0
+HTTPCACHE_READAHEAD = 32
+
+HTTPCOMPRESSION_MAXSIZE = 1073741824  # 1gb
 
 ITEM_PROCESSOR = 'scrapy.contrib.pipeline.ItemPipelineManager'
 
 # Item pipelines are typically set in specific commands settings
 ITEM_PIPELINES = []
 
+JOBDIR = None
+JOBDIR_CHECKPOINT_INTERVAL = 5
+
 KEEP_ALIVE = False
 
 LOG_ENABLED = True
@@ -196,6 +234,8 @@ REDIRECT_MAX_METAREFRESH_DELAY = 100
 REDIRECT_MAX_TIMES = 20 # uses Firefox default setting
 REDIRECT_PRIORITY_ADJUST = +2
 
+RESPONSE_ENCODING_SNIFF_SIZE = 65536
+
 # contrib.middleware.retry.RetryMiddleware default settings
 RETRY_TIMES = 2 # initial response + 2 retries = 3 requests
 RETRY_HTTP_CODES = ['500', '503', '504', '400', '408']
@@ -205,6 +245,10 @@ ROBOTSTXT_OBEY = False
 
 SCHEDULER = 'scrapy.core.scheduler.Scheduler'
 
+SCHEDULER_DISK_QUEUE = False
+
+SCHEDULER_MEMORY_QUEUE_SIZE = 10000
+
 SCHEDULER_MIDDLEWARES = {}
 
 SCHEDULER_MIDDLEWARES_BASE = {
@@ -213,6 +257,9 @@ SCHEDULER_MIDDLEWARES_BASE = {
 
 SCHEDULER_ORDER = 'DFO'
 
+SCRAPER_PROCESSES = 0 # 0 means one per cpu
+SCRAPER_PROCESS_TIMEOUT = 180
+
 SELECTORS_BACKEND = None # possible values: libxml2, lxml
 
 SPIDER_MANAGER_CLASS = 'scrapy.spidermanager.SpiderManager'
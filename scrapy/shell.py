@@ -6,7 +6,7 @@ See documentation in docs/topics/shell.rst
 
 import signal
 
-from twisted.internet import reactor, threads
+from twisted.internet import reactor, threads, defer
 
 from scrapy.item import BaseItem
 from scrapy.spider import BaseSpider
@@ -57,9 +57,20 @@ class Shell(object):
             spider = create_spider_for_request(self.crawler.spiders, request, \
                 BaseSpider('default'), log_multiple=True)
         spider.set_crawler(self.crawler)
-        self.crawler.engine.open_spider(spider)
-        d = self.crawler.engine.schedule(request, spider)
+        if not self.crawler.engine.scheduler.has_disk_queue(spider):
+            self.crawler.engine.open_spider(spider)
+            d = self.crawler.engine.schedule(request, spider)
+            d.addCallback(lambda x: (x, spider))
+            return d
+        # disk queues don't keep a deferred for each request, so the response
+        # is taken from the request callback
+        d = _request_deferred(request)
         d.addCallback(lambda x: (x, spider))
+        if spider in self.crawler.engine.open_spiders:
+            self.crawler.engine.crawl(request, spider)
+        else:
+            dfd = self.crawler.engine.open_spider(spider)
+            dfd.addCallback(lambda _: self.crawler.engine.crawl(request, spider))
         return d
 
     def fetch(self, request_or_url, spider=None):
@@ -117,3 +128,21 @@ def inspect_response(response, spider=None):
     """Open a shell to inspect the given response"""
     from scrapy.project import crawler
     Shell(crawler).start(response=response, spider=spider)
+
+
+def _request_deferred(request):
+    """Return a deferred fired with the response (or failure) of the given
+    request, by replacing its callback and errback. They're restored once the
+    deferred is fired.
+    """
+    request_callback = request.callback
+    request_errback = request.errback
+    def _restore_callbacks(result):
+        request.callback = request_callback
+        request.errback = request_errback
+        return result
+
+    d = defer.Deferred()
+    d.addBoth(_restore_callbacks)
+    request.callback, request.errback = d.callback, d.errback
+    return d
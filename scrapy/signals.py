@@ -11,8 +11,10 @@ spider_opened = object()
 spider_idle = object()
 spider_closed = object()
 request_received = object()
+request_scheduled = object()
 response_received = object()
 response_downloaded = object()
+headers_received = object()
 item_scraped = object()
 item_passed = object()
 item_dropped = object()
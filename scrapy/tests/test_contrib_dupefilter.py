@@ -0,0 +1,131 @@
+import os
+
+from twisted.trial import unittest
+
+from scrapy.conf import settings
+from scrapy.http import Request
+from scrapy.spider import BaseSpider
+from scrapy.contrib.dupefilter import RequestFingerprintDupeFilter, \
+    CompactRequestFingerprintDupeFilter, BloomRequestFingerprintDupeFilter, \
+    DiskRequestFingerprintDupeFilter
+
+
+class RequestFingerprintDupeFilterTest(unittest.TestCase):
+
+    dupefilter_class = RequestFingerprintDupeFilter
+
+    def setUp(self):
+        self.spider = BaseSpider('foo')
+        self.dupefilter = self.dupefilter_class()
+        self.dupefilter.open_spider(self.spider)
+
+    def tearDown(self):
+        if self.spider in self.dupefilter.fingerprints:
+            self.dupefilter.close_spider(self.spider)
+
+    def test_request_seen(self):
+        r1 = Request('http://scrapytest.org/1')
+        r2 = Request('http://scrapytest.org/2')
+        r3 = Request('http://scrapytest.org/2')
+        df, spider = self.dupefilter, self.spider
+
+        self.failIf(df.request_seen(spider, r1))
+        assert df.request_seen(spider, r1)
+
+        self.failIf(df.request_seen(spider, r2, dont_record=True))
+        self.failIf(df.request_seen(spider, r2))
+        assert df.request_seen(spider, r3)
+
+    def test_many_requests(self):
+        df, spider = self.dupefilter, self.spider
+        for n in range(3000):
+            self.failIf(df.request_seen(spider, Request('http://scrapytest.org/%d' % n)))
+        for n in range(3000):
+            assert df.request_seen(spider, Request('http://scrapytest.org/%d' % n))
+
+
+class CompactRequestFingerprintDupeFilterTest(RequestFingerprintDupeFilterTest):
+
+    dupefilter_class = CompactRequestFingerprintDupeFilter
+
+
+class BloomRequestFingerprintDupeFilterTest(RequestFingerprintDupeFilterTest):
+
+    dupefilter_class = BloomRequestFingerprintDupeFilter
+
+    def test_many_requests(self):
+        df, spider = self.dupefilter, self.spider
+        seen = [df.request_seen(spider, Request('http://scrapytest.org/%d' % n)) \
+            for n in range(3000)]
+        assert seen.count(True) < 10
+        for n in range(3000):
+            assert df.request_seen(spider, Request('http://scrapytest.org/%d' % n))
+
+
+class DiskRequestFingerprintDupeFilterTest(RequestFingerprintDupeFilterTest):
+
+    dupefilter_class = DiskRequestFingerprintDupeFilter
+
+    def test_file_removed_on_close(self):
+        path = self.dupefilter.fingerprints[self.spider].path
+        assert os.path.exists(path)
+        self.dupefilter.close_spider(self.spider)
+        self.failIf(os.path.exists(path))
+
+    def test_no_flush_on_close(self):
+        fingerprints = self.dupefilter.fingerprints[self.spider]
+        self.dupefilter.request_seen(self.spider, Request('http://scrapytest.org/1'))
+        fingerprints.flush = lambda: self.fail("flushed on close")
+        self.dupefilter.close_spider(self.spider)
+
+
+class JobDirRequestFingerprintDupeFilterTest(unittest.TestCase):
+
+    dupefilter_class = RequestFingerprintDupeFilter
+
+    def setUp(self):
+        settings.overrides['JOBDIR'] = self.mktemp()
+        self.spider = BaseSpider('foo')
+
+    def tearDown(self):
+        del settings.overrides['JOBDIR']
+
+    def _open(self):
+        df = self.dupefilter_class()
+        df.open_spider(self.spider)
+        return df
+
+    def test_resume(self):
+        r1 = Request('http://scrapytest.org/1')
+        r2 = Request('http://scrapytest.org/2')
+        df = self._open()
+        self.failIf(df.request_seen(self.spider, r1))
+        df.close_spider(self.spider)
+
+        df = self._open()
+        assert df.request_seen(self.spider, r1)
+        self.failIf(df.request_seen(self.spider, r2))
+        df.close_spider(self.spider)
+
+    def test_resume_from_checkpoint(self):
+        r1 = Request('http://scrapytest.org/1')
+        r2 = Request('http://scrapytest.org/2')
+        df = self._open()
+        self.failIf(df.request_seen(self.spider, r1))
+        df.checkpoint(self.spider)
+        self.failIf(df.request_seen(self.spider, r2)) # then killed
+
+        df = self._open()
+        assert df.request_seen(self.spider, r1)
+        self.failIf(df.request_seen(self.spider, r2))
+        df.close_spider(self.spider)
+
+
+class JobDirCompactRequestFingerprintDupeFilterTest(JobDirRequestFingerprintDupeFilterTest):
+
+    dupefilter_class = CompactRequestFingerprintDupeFilter
+
+
+class JobDirDiskRequestFingerprintDupeFilterTest(JobDirRequestFingerprintDupeFilterTest):
+
+    dupefilter_class = DiskRequestFingerprintDupeFilter
@@ -1,9 +1,13 @@
+from __future__ import with_statement
+
 import re
 import unittest
+import warnings
 
 from scrapy.http import HtmlResponse
 from scrapy.link import Link
 from scrapy.contrib.linkextractors.sgml import SgmlLinkExtractor, BaseSgmlLinkExtractor
+from scrapy.contrib.linkextractors.lxmlparser import LxmlLinkExtractor
 from scrapy.contrib.linkextractors.image import HTMLImageLinkExtractor
 from scrapy.tests import get_testdata
 
@@ -80,77 +84,80 @@ class LinkExtractorTestCase(unittest.TestCase):
         self.assertEqual(lx.matches(url2), True)
 
 class SgmlLinkExtractorTestCase(unittest.TestCase):
+
+    extractor_cls = SgmlLinkExtractor
+
     def setUp(self):
         body = get_testdata('link_extractor', 'sgml_linkextractor.html')
         self.response = HtmlResponse(url='http://example.com/index', body=body)
 
     def test_urls_type(self):
         '''Test that the resulting urls are regular strings and not a unicode objects'''
-        lx = SgmlLinkExtractor()
+        lx = self.extractor_cls()
         self.assertTrue(all(isinstance(link.url, str) for link in lx.extract_links(self.response)))
 
     def test_extraction(self):
         '''Test the extractor's behaviour among different situations'''
 
-        lx = SgmlLinkExtractor()
+        lx = self.extractor_cls()
         self.assertEqual([link for link in lx.extract_links(self.response)],
             [ Link(url='http://example.com/sample1.html', text=u''),
               Link(url='http://example.com/sample2.html', text=u'sample 2'),
               Link(url='http://example.com/sample3.html', text=u'sample 3 text'),
               Link(url='http://www.google.com/something', text=u'') ])
 
-        lx = SgmlLinkExtractor(allow=('sample', ))
+        lx = self.extractor_cls(allow=('sample', ))
         self.assertEqual([link for link in lx.extract_links(self.response)],
             [ Link(url='http://example.com/sample1.html', text=u''),
               Link(url='http://example.com/sample2.html', text=u'sample 2'),
               Link(url='http://example.com/sample3.html', text=u'sample 3 text') ])
 
-        lx = SgmlLinkExtractor(allow=('sample', ), unique=False)
+        lx = self.extractor_cls(allow=('sample', ), unique=False)
         self.assertEqual([link for link in lx.extract_links(self.response)],
             [ Link(url='http://example.com/sample1.html', text=u''),
               Link(url='http://example.com/sample2.html', text=u'sample 2'),
               Link(url='http://example.com/sample3.html', text=u'sample 3 text'),
               Link(url='http://example.com/sample3.html', text=u'sample 3 repetition') ])
 
-        lx = SgmlLinkExtractor(allow=('sample', ))
+        lx = self.extractor_cls(allow=('sample', ))
         self.assertEqual([link for link in lx.extract_links(self.response)],
             [ Link(url='http://example.com/sample1.html', text=u''),
               Link(url='http://example.com/sample2.html', text=u'sample 2'),
               Link(url='http://example.com/sample3.html', text=u'sample 3 text'),
               ])
 
-        lx = SgmlLinkExtractor(allow=('sample', ), deny=('3', ))
+        lx = self.extractor_cls(allow=('sample', ), deny=('3', ))
         self.assertEqual([link for link in lx.extract_links(self.response)],
             [ Link(url='http://example.com/sample1.html', text=u''),
               Link(url='http://example.com/sample2.html', text=u'sample 2') ])
 
-        lx = SgmlLinkExtractor(allow_domains=('google.com', ))
+        lx = self.extractor_cls(allow_domains=('google.com', ))
         self.assertEqual([link for link in lx.extract_links(self.response)],
             [ Link(url='http://www.google.com/something', text=u'') ])
 
-        lx = SgmlLinkExtractor(tags=('img', ), attrs=('src', ))
+        lx = self.extractor_cls(tags=('img', ), attrs=('src', ))
         self.assertEqual([link for link in lx.extract_links(self.response)],
             [ Link(url='http://example.com/sample2.jpg', text=u'') ])
 
     def test_extraction_using_single_values(self):
         '''Test the extractor's behaviour among different situations'''
 
-        lx = SgmlLinkExtractor(allow='sample')
+        lx = self.extractor_cls(allow='sample')
         self.assertEqual([link for link in lx.extract_links(self.response)],
             [ Link(url='http://example.com/sample1.html', text=u''),
               Link(url='http://example.com/sample2.html', text=u'sample 2'),
               Link(url='http://example.com/sample3.html', text=u'sample 3 text') ])
 
-        lx = SgmlLinkExtractor(allow='sample', deny='3')
+        lx = self.extractor_cls(allow='sample', deny='3')
         self.assertEqual([link for link in lx.extract_links(self.response)],
             [ Link(url='http://example.com/sample1.html', text=u''),
               Link(url='http://example.com/sample2.html', text=u'sample 2') ])
 
-        lx = SgmlLinkExtractor(allow_domains='google.com')
+        lx = self.extractor_cls(allow_domains='google.com')
         self.assertEqual([link for link in lx.extract_links(self.response)],
             [ Link(url='http://www.google.com/something', text=u'') ])
 
-        lx = SgmlLinkExtractor(deny_domains='example.com')
+        lx = self.extractor_cls(deny_domains='example.com')
         self.assertEqual([link for link in lx.extract_links(self.response)],
             [ Link(url='http://www.google.com/something', text=u'') ])
 
@@ -158,23 +165,23 @@ class SgmlLinkExtractorTestCase(unittest.TestCase):
         url1 = 'http://lotsofstuff.com/stuff1/index'
         url2 = 'http://evenmorestuff.com/uglystuff/index'
 
-        lx = SgmlLinkExtractor(allow=(r'stuff1', ))
+        lx = self.extractor_cls(allow=(r'stuff1', ))
         self.assertEqual(lx.matches(url1), True)
         self.assertEqual(lx.matches(url2), False)
 
-        lx = SgmlLinkExtractor(deny=(r'uglystuff', ))
+        lx = self.extractor_cls(deny=(r'uglystuff', ))
         self.assertEqual(lx.matches(url1), True)
         self.assertEqual(lx.matches(url2), False)
 
-        lx = SgmlLinkExtractor(allow_domains=('evenmorestuff.com', ))
+        lx = self.extractor_cls(allow_domains=('evenmorestuff.com', ))
         self.assertEqual(lx.matches(url1), False)
         self.assertEqual(lx.matches(url2), True)
 
-        lx = SgmlLinkExtractor(deny_domains=('lotsofstuff.com', ))
+        lx = self.extractor_cls(deny_domains=('lotsofstuff.com', ))
         self.assertEqual(lx.matches(url1), False)
         self.assertEqual(lx.matches(url2), True)
 
-        lx = SgmlLinkExtractor(allow=('blah1', ), deny=('blah2', ),
+        lx = self.extractor_cls(allow=('blah1', ), deny=('blah2', ),
             allow_domains=('blah1.com', ), deny_domains=('blah2.com', ))
         self.assertEqual(lx.matches('http://blah1.com/blah1'), True)
         self.assertEqual(lx.matches('http://blah1.com/blah2'), False)
@@ -182,7 +189,7 @@ class SgmlLinkExtractorTestCase(unittest.TestCase):
         self.assertEqual(lx.matches('http://blah2.com/blah2'), False)
 
     def test_restrict_xpaths(self):
-        lx = SgmlLinkExtractor(restrict_xpaths=('//div[@id="subwrapper"]', ))
+        lx = self.extractor_cls(restrict_xpaths=('//div[@id="subwrapper"]', ))
         self.assertEqual([link for link in lx.extract_links(self.response)],
             [ Link(url='http://example.com/sample1.html', text=u''),
               Link(url='http://example.com/sample2.html', text=u'sample 2') ])
@@ -200,7 +207,7 @@ class SgmlLinkExtractorTestCase(unittest.TestCase):
         </body></html>"""
         response = HtmlResponse("http://example.org/somepage/index.html", body=html, encoding='windows-1252')
 
-        lx = SgmlLinkExtractor(restrict_xpaths="//div[@class='links']") 
+        lx = self.extractor_cls(restrict_xpaths="//div[@class='links']") 
         self.assertEqual(lx.extract_links(response),
                          [Link(url='http://example.org/about.html', text=u'About us\xa3')])
 
@@ -217,7 +224,7 @@ class SgmlLinkExtractorTestCase(unittest.TestCase):
             if m:
                 return m.group(1)
 
-        lx = SgmlLinkExtractor(process_value=process_value)
+        lx = self.extractor_cls(process_value=process_value)
         self.assertEqual(lx.extract_links(response),
                          [Link(url='http://example.org/other/page.html', text='Link text')])
 
@@ -226,11 +233,56 @@ class SgmlLinkExtractorTestCase(unittest.TestCase):
         <body><p><a href="item/12.html">Item 12</a></p>
         </body></html>"""
         response = HtmlResponse("http://example.org/somepage/index.html", body=html)
-        lx = SgmlLinkExtractor(restrict_xpaths="//p") 
+        lx = self.extractor_cls(restrict_xpaths="//p") 
         self.assertEqual(lx.extract_links(response),
                          [Link(url='http://otherdomain.com/base/item/12.html', text='Item 12')])
 
 
+class LxmlLinkExtractorTestCase(SgmlLinkExtractorTestCase):
+
+    extractor_cls = LxmlLinkExtractor
+
+    def test_link_text(self):
+        html = """<a href="/1.html">one <b>bold</b> text</a>
+        <a href="/2.html">two<br>lines <img src="/logo.png"> here</a>
+        <a href="/3.html"><!-- comment -->three</a>"""
+        response = HtmlResponse("http://example.org/index.html", body=html)
+        lx = self.extractor_cls()
+        self.assertEqual(lx.extract_links(response),
+            [Link(url='http://example.org/1.html', text=u'onebold'),
+             Link(url='http://example.org/2.html', text=u'twolineshere'),
+             Link(url='http://example.org/3.html', text=u'three')])
+        self.assertEqual(lx.extract_links(response),
+            SgmlLinkExtractor().extract_links(response))
+
+    def test_restrict_xpaths_selecting_links(self):
+        lx = self.extractor_cls(restrict_xpaths=('//a[@title]', '//a/@href'))
+        self.assertEqual(lx.extract_links(self.response),
+            [Link(url='http://example.com/sample3.html', text=u'sample 3 text')])
+
+    def test_extraction_encoding(self):
+        for name, headers in [('linkextractor_noenc.html', {}),
+                ('linkextractor_noenc.html', {'Content-Type': ['text/html; charset=utf-8']}),
+                ('linkextractor_latin1.html', {})]:
+            body = get_testdata('link_extractor', name)
+            response = HtmlResponse(url='http://example.com/', body=body, headers=headers)
+            self.assertEqual(self.extractor_cls().extract_links(response),
+                SgmlLinkExtractor().extract_links(response))
+
+    def test_empty_response(self):
+        response = HtmlResponse("http://example.org/index.html", body='')
+        self.assertEqual(self.extractor_cls().extract_links(response), [])
+
+    def test_deprecated_arguments(self):
+        with warnings.catch_warnings(record=True) as w:
+            warnings.simplefilter('always')
+            lx = self.extractor_cls(tag='img', attr='src', \
+                process=lambda v: v.replace('.jpg', '.png'))
+        self.assertEqual([x.category for x in w], [DeprecationWarning])
+        self.assertEqual(lx.extract_links(self.response),
+            [Link(url='http://example.com/sample2.png', text=u'')])
+
+
 class HTMLImageLinkExtractorTestCase(unittest.TestCase):
     def setUp(self):
         body = get_testdata('link_extractor', 'image_linkextractor.html')
@@ -1,9 +1,51 @@
 from twisted.trial import unittest
 from zope.interface.verify import verifyObject
 
-from scrapy.contrib.spidercontext import ISpiderContextStorage, SqliteSpiderContextStorage
+from scrapy.conf import settings
+from scrapy.xlib.pydispatch import dispatcher
+from scrapy import signals
+from scrapy.spider import BaseSpider
+from scrapy.contrib.spidercontext import ISpiderContextStorage, \
+    SqliteSpiderContextStorage, JobDirSpiderContextStorage, SpiderContext
 
 class SqliteSpiderContextStorageTest(unittest.TestCase):
 
     def test_interface(self):
         verifyObject(ISpiderContextStorage, SqliteSpiderContextStorage())
+
+
+class JobDirSpiderContextStorageTest(unittest.TestCase):
+
+    def setUp(self):
+        settings.overrides['JOBDIR'] = self.mktemp()
+
+    def tearDown(self):
+        del settings.overrides['JOBDIR']
+
+    def test_interface(self):
+        verifyObject(ISpiderContextStorage, JobDirSpiderContextStorage(settings))
+
+    def test_get_put(self):
+        st = JobDirSpiderContextStorage.from_settings(settings)
+        spider = BaseSpider('foo')
+        self.assertEqual(st.get(spider), None)
+        st.put(spider, {'a': 1, 'b': [1, 2]})
+        st = JobDirSpiderContextStorage.from_settings(settings)
+        self.assertEqual(st.get(spider), {'a': 1, 'b': [1, 2]})
+        self.assertEqual(st.get(BaseSpider('bar')), None)
+
+    def test_spider_context(self):
+        ext = SpiderContext.from_settings(settings)
+        dispatcher.disconnect(ext._spider_opened, signals.spider_opened)
+        dispatcher.disconnect(ext._spider_closed, signals.spider_closed)
+        assert isinstance(ext.storage, JobDirSpiderContextStorage)
+        spider = BaseSpider('foo')
+        ext._spider_opened(spider)
+        self.assertEqual(spider.context, {})
+        spider.context['page'] = 3
+        ext._spider_closed(spider)
+
+        spider = BaseSpider('foo')
+        ext._spider_opened(spider)
+        self.assertEqual(spider.context, {'page': 3})
+        ext._spider_closed(spider)
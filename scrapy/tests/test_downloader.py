@@ -0,0 +1,213 @@
+from time import time
+
+from twisted.trial import unittest
+from twisted.internet import defer, reactor
+from twisted.python.failure import Failure
+from twisted.internet.error import ConnectionRefusedError, DNSLookupError
+
+from scrapy.core.downloader import Downloader
+from scrapy.http import Request, Response
+from scrapy.exceptions import IgnoreRequest
+from scrapy.spider import BaseSpider
+from scrapy.stats import stats
+from scrapy.utils.test import get_crawler
+
+
+class DownloadHandlersMock(object):
+    """Keep the download deferreds to fire them from tests"""
+
+    def __init__(self):
+        self.pending = []
+
+    def download_request(self, request, spider):
+        dfd = defer.Deferred()
+        self.pending.append((request, dfd))
+        return dfd
+
+    def finish(self, index=0):
+        request, dfd = self.pending.pop(index)
+        dfd.callback(Response(request.url))
+
+
+class DownloaderTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.crawler = get_crawler()
+        self.crawler.install()
+        self.downloader = Downloader()
+        self.handlers = self.downloader.handlers = DownloadHandlersMock()
+
+    def tearDown(self):
+        self.crawler.uninstall()
+
+    def _open_spider(self, **settings):
+        spider = BaseSpider('foo')
+        spider.set_crawler(get_crawler(settings))
+        self.downloader.open_spider(spider)
+        return spider
+
+    def _enqueue(self, spider, *urls):
+        return [self.downloader.enqueue(Request(url), spider) for url in urls]
+
+    def _transferring(self):
+        return sorted(r.url for r, _ in self.handlers.pending)
+
+
+class DownloaderSlotsTest(DownloaderTestCase):
+
+    def test_slot_per_domain(self):
+        spider = self._open_spider(CONCURRENT_REQUESTS_PER_DOMAIN=2, \
+            CONCURRENT_REQUESTS_PER_SPIDER=10)
+        self._enqueue(spider, 'http://a.com/1', 'http://a.com/2', 'http://a.com/3', \
+            'http://b.com/1', 'http://b.com/2', 'http://b.com/3')
+        site = self.downloader.sites[spider]
+        self.assertEqual(sorted(site.slots), ['a.com', 'b.com'])
+        self.assertEqual(self._transferring(), ['http://a.com/1', \
+            'http://a.com/2', 'http://b.com/1', 'http://b.com/2'])
+        self.assertEqual(site.queue_size(), 2)
+
+        self.handlers.finish(0) # a.com/1
+        self.assertEqual(self._transferring(), ['http://a.com/2', \
+            'http://a.com/3', 'http://b.com/1', 'http://b.com/2'])
+        self.assertEqual(site.queue_size(), 1)
+
+    def test_spider_concurrency(self):
+        spider = self._open_spider(CONCURRENT_REQUESTS_PER_DOMAIN=2, \
+            CONCURRENT_REQUESTS_PER_SPIDER=3)
+        self._enqueue(spider, 'http://a.com/1', 'http://a.com/2', \
+            'http://b.com/1', 'http://b.com/2', 'http://c.com/1')
+        self.assertEqual(len(self.handlers.pending), 3)
+        self.assertEqual(self.downloader.sites[spider].queue_size(), 2)
+
+        # the freed transfer slot is used by a blocked domain
+        self.handlers.finish(0) # a.com/1
+        self.assertEqual(len(self.handlers.pending), 3)
+        self.assertEqual(self.downloader.sites[spider].queue_size(), 1)
+
+    def test_total_concurrency(self):
+        self.downloader.total_concurrency = 2
+        spider1 = self._open_spider()
+        spider2 = self._open_spider()
+        self._enqueue(spider1, 'http://a.com/1', 'http://a.com/2')
+        self._enqueue(spider2, 'http://b.com/1', 'http://b.com/2')
+        self.assertEqual(self._transferring(), ['http://a.com/1', 'http://a.com/2'])
+
+        self.handlers.finish(0)
+        self.assertEqual(self._transferring(), ['http://a.com/2', 'http://b.com/1'])
+
+    def test_idle_slots_gc(self):
+        spider = self._open_spider()
+        dfds = self._enqueue(spider, 'http://a.com/1', 'http://b.com/1')
+        site = self.downloader.sites[spider]
+        site.gc_slots(time() + site.SLOT_GC_AGE + 1)
+        self.assertEqual(len(site.slots), 2) # busy slots are kept
+
+        while self.handlers.pending:
+            self.handlers.finish()
+        site.gc_slots(time())
+        self.assertEqual(len(site.slots), 2) # recently seen slots are kept
+        site.gc_slots(time() + site.SLOT_GC_AGE + 1)
+        self.assertEqual(len(site.slots), 0)
+        return defer.DeferredList(dfds)
+
+    def test_slot_per_ip_resolved_once(self):
+        resolved = []
+        def resolve(hostname):
+            resolved.append(hostname)
+            return defer.succeed('10.0.0.1')
+        self.patch(reactor, 'resolve', resolve)
+        spider = self._open_spider(CONCURRENT_REQUESTS_PER_IP=1)
+        self._enqueue(spider, 'http://a.com/1', 'http://b.com/1', \
+            'http://a.com/2')
+        site = self.downloader.sites[spider]
+        self.assertEqual(sorted(site.slots), ['10.0.0.1'])
+        self.assertEqual(resolved, ['a.com', 'b.com'])
+        self.assertEqual(self._transferring(), ['http://a.com/1'])
+        self.assertEqual(site.queue_size(), 2)
+
+    def test_download_delay_concurrency(self):
+        # the delay applies to each slot, not to the whole spider
+        spider = self._open_spider(DOWNLOAD_DELAY=10, \
+            RANDOMIZE_DOWNLOAD_DELAY=False)
+        self._enqueue(spider, 'http://a.com/1', 'http://a.com/2', \
+            'http://b.com/1')
+        self.assertEqual(self._transferring(), ['http://a.com/1', \
+            'http://b.com/1'])
+        self.downloader.sites[spider].cancel_request_calls()
+
+    def test_close_spider_discards_queue(self):
+        spider = self._open_spider(CONCURRENT_REQUESTS_PER_DOMAIN=1)
+        dfds = self._enqueue(spider, 'http://a.com/1', 'http://a.com/2')
+        closed = self.downloader.close_spider(spider)
+        self.assertFailure(dfds[1], IgnoreRequest)
+        self.handlers.finish()
+        self.assertFailure(dfds[0], IgnoreRequest)
+        return defer.DeferredList(dfds + [closed])
+
+
+class AutoThrottleTest(DownloaderTestCase):
+
+    def _open_spider(self, **settings):
+        settings.setdefault('AUTOTHROTTLE_ENABLED', True)
+        settings.setdefault('AUTOTHROTTLE_START_DELAY', 0)
+        spider = super(AutoThrottleTest, self)._open_spider(**settings)
+        stats.open_spider(spider)
+        return spider
+
+    def _get_slot(self, **settings):
+        spider = self._open_spider(**settings)
+        site = self.downloader.sites[spider]
+        return site.throttle, site.get_slot('a.com')
+
+    def test_slot_initialization(self):
+        throttle, slot = self._get_slot(AUTOTHROTTLE_START_DELAY=3, DOWNLOAD_DELAY=1)
+        self.assertEqual(slot.delay, 3)
+        self.assertEqual(slot.concurrency, 1)
+
+    def test_delay_follows_latency(self):
+        throttle, slot = self._get_slot(AUTOTHROTTLE_TARGET_CONCURRENCY=2)
+        for _ in range(20):
+            throttle.transfer_finished(slot, 1.0, Response('http://a.com'))
+        self.assertAlmostEqual(slot.delay, 0.5, 3)
+        self.assertEqual(slot.concurrency, 8) # CONCURRENT_REQUESTS_PER_DOMAIN
+
+    def test_delay_limits(self):
+        throttle, slot = self._get_slot(DOWNLOAD_DELAY=0.8, AUTOTHROTTLE_MAX_DELAY=2)
+        throttle.transfer_finished(slot, 0.1, Response('http://a.com'))
+        self.assertEqual(slot.delay, 0.8)
+        throttle.transfer_finished(slot, 100, Response('http://a.com'))
+        self.assertEqual(slot.delay, 2)
+
+    def test_backoff_on_errors(self):
+        throttle, slot = self._get_slot()
+        slot.delay, slot.concurrency = 1.0, 4
+        throttle.transfer_finished(slot, 0.5, Response('http://a.com', status=503))
+        self.assertEqual(slot.delay, 2.0)
+        self.assertEqual(slot.concurrency, 2)
+        throttle.transfer_finished(slot, 0.5, Failure(ConnectionRefusedError()))
+        self.assertEqual(slot.delay, 4.0)
+        self.assertEqual(slot.concurrency, 1)
+        self.assertEqual(stats.get_value('autothrottle/backoff_count', \
+            spider=throttle.spider), 2)
+
+    def test_other_failures_are_ignored(self):
+        throttle, slot = self._get_slot()
+        slot.delay, slot.concurrency = 1.0, 4
+        for exc in [IgnoreRequest(), DNSLookupError()]:
+            throttle.transfer_finished(slot, 0.01, Failure(exc))
+        self.assertEqual(slot.delay, 1.0)
+        self.assertEqual(slot.concurrency, 4)
+        self.assertEqual(slot.latency, None)
+        self.assertEqual(stats.get_value('autothrottle/backoff_count', \
+            spider=throttle.spider), None)
+
+    def test_non_200_responses_dont_decrease_delay(self):
+        throttle, slot = self._get_slot()
+        slot.delay = 1.0
+        throttle.transfer_finished(slot, 0.1, Response('http://a.com', status=404))
+        self.assertEqual(slot.delay, 1.0)
+
+    def test_status(self):
+        throttle, slot = self._get_slot(AUTOTHROTTLE_START_DELAY=3)
+        self.assertEqual(self.downloader.sites[throttle.spider].throttle_status(), \
+            {'a.com': {'delay': 3, 'concurrency': 1, 'latency': None}})
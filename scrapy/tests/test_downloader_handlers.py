@@ -12,8 +12,14 @@ from twisted.web.test.test_webclient import ForeverTakingResource, \
 from scrapy.core.downloader.webclient import PartialDownloadError
 from scrapy.core.downloader.handlers.file import FileDownloadHandler
 from scrapy.core.downloader.handlers.http import HttpDownloadHandler
+from scrapy.core.downloader.handlers.http11 import Http11DownloadHandler
 from scrapy.core.downloader.handlers.s3 import S3DownloadHandler
 from scrapy.spider import BaseSpider
+from scrapy.xlib.pydispatch import dispatcher
+from scrapy.exceptions import IgnoreRequest
+from scrapy.stats import stats
+from scrapy import signals
+from scrapy.conf import settings
 from scrapy.http import Request
 from scrapy.utils.url import path_to_file_uri
 from scrapy import optional_features
@@ -46,6 +52,8 @@ class FileTestCase(unittest.TestCase):
 
 class HttpTestCase(unittest.TestCase):
 
+    download_handler_cls = HttpDownloadHandler
+
     def setUp(self):
         name = self.mktemp()
         os.mkdir(name)
@@ -61,7 +69,9 @@ class HttpTestCase(unittest.TestCase):
         self.wrapper = WrappingFactory(self.site)
         self.port = reactor.listenTCP(0, self.wrapper, interface='127.0.0.1')
         self.portno = self.port.getHost().port
-        self.download_request = HttpDownloadHandler().download_request
+        self.spider = BaseSpider('foo')
+        self.download_handler = self.download_handler_cls()
+        self.download_request = self.download_handler.download_request
 
     def tearDown(self):
         return self.port.stopListening()
@@ -71,35 +81,35 @@ class HttpTestCase(unittest.TestCase):
 
     def test_download(self):
         request = Request(self.getURL('file'))
-        d = self.download_request(request, BaseSpider('foo'))
+        d = self.download_request(request, self.spider)
         d.addCallback(lambda r: r.body)
         d.addCallback(self.assertEquals, "0123456789")
         return d
 
     def test_download_head(self):
         request = Request(self.getURL('file'), method='HEAD')
-        d = self.download_request(request, BaseSpider('foo'))
+        d = self.download_request(request, self.spider)
         d.addCallback(lambda r: r.body)
         d.addCallback(self.assertEquals, '')
         return d
 
     def test_redirect_status(self):
         request = Request(self.getURL('redirect'))
-        d = self.download_request(request, BaseSpider('foo'))
+        d = self.download_request(request, self.spider)
         d.addCallback(lambda r: r.status)
         d.addCallback(self.assertEquals, 302)
         return d
 
     def test_redirect_status_head(self):
         request = Request(self.getURL('redirect'), method='HEAD')
-        d = self.download_request(request, BaseSpider('foo'))
+        d = self.download_request(request, self.spider)
         d.addCallback(lambda r: r.status)
         d.addCallback(self.assertEquals, 302)
         return d
 
     def test_timeout_download_from_spider(self):
         request = Request(self.getURL('wait'), meta=dict(download_timeout=0.000001))
-        d = self.download_request(request, BaseSpider('foo'))
+        d = self.download_request(request, self.spider)
         return self.assertFailure(d, defer.TimeoutError)
 
     def test_host_header_not_in_request_headers(self):
@@ -108,7 +118,7 @@ class HttpTestCase(unittest.TestCase):
             self.assertEquals(request.headers, {})
 
         request = Request(self.getURL('host'))
-        return self.download_request(request, BaseSpider('foo')).addCallback(_test)
+        return self.download_request(request, self.spider).addCallback(_test)
 
     def test_host_header_seted_in_request_headers(self):
         def _test(response):
@@ -116,9 +126,9 @@ class HttpTestCase(unittest.TestCase):
             self.assertEquals(request.headers.get('Host'), 'example.com')
 
         request = Request(self.getURL('host'), headers={'Host': 'example.com'})
-        return self.download_request(request, BaseSpider('foo')).addCallback(_test)
+        return self.download_request(request, self.spider).addCallback(_test)
 
-        d = self.download_request(request, BaseSpider('foo'))
+        d = self.download_request(request, self.spider)
         d.addCallback(lambda r: r.body)
         d.addCallback(self.assertEquals, 'example.com')
         return d
@@ -126,16 +136,151 @@ class HttpTestCase(unittest.TestCase):
     def test_payload(self):
         body = '1'*100 # PayloadResource requires body length to be 100
         request = Request(self.getURL('payload'), method='POST', body=body)
-        d = self.download_request(request, BaseSpider('foo'))
+        d = self.download_request(request, self.spider)
         d.addCallback(lambda r: r.body)
         d.addCallback(self.assertEquals, body)
         return d
 
     def test_broken_download(self):
         request = Request(self.getURL('broken'))
-        d = self.download_request(request, BaseSpider('foo'))
+        d = self.download_request(request, self.spider)
         return self.assertFailure(d, PartialDownloadError)
 
+    def test_download_aborted_on_headers(self):
+        def headers_received(response, request, spider):
+            self.assertEquals(response.status, 200)
+            self.assertEquals(response.headers['Content-Length'], '10')
+            self.assertEquals(response.body, '')
+            raise IgnoreRequest
+
+        def _test(_):
+            self.assertEquals(stats.get_value( \
+                'downloader/response_aborted_count', spider=self.spider), 1)
+            self.assertEquals(stats.get_value( \
+                'downloader/response_aborted_bytes', spider=self.spider), 10)
+
+        stats.open_spider(self.spider)
+        dispatcher.connect(headers_received, signal=signals.headers_received)
+        request = Request(self.getURL('file'))
+        d = self.download_request(request, self.spider)
+        d = self.assertFailure(d, IgnoreRequest).addCallback(_test)
+        return d.addBoth(lambda r: dispatcher.disconnect(headers_received, \
+            signal=signals.headers_received) or r)
+
+    def test_download_aborted_on_body_size(self):
+        def _test(_):
+            self.assertEquals(stats.get_value( \
+                'downloader/response_aborted_count', spider=self.spider), 2)
+
+        stats.open_spider(self.spider)
+        d = self.download_request(Request(self.getURL('nolength'), \
+            meta={'download_maxsize': 5}), self.spider)
+        d = self.assertFailure(d, IgnoreRequest)
+        d.addCallback(lambda _: self.download_request(Request( \
+            self.getURL('file'), meta={'download_maxsize': 5}), self.spider))
+        d = self.assertFailure(d, IgnoreRequest)
+        d.addCallback(lambda _: self.download_request(Request( \
+            self.getURL('file'), meta={'download_maxsize': 10}), self.spider))
+        d.addCallback(lambda r: self.assertEquals(r.body, '0123456789'))
+        return d.addCallback(_test)
+
+    def test_download_spooled(self):
+        def _test(response):
+            assert response.spooled
+            self.assertEquals(response.body, "0123456789")
+
+        request = Request(self.getURL('file'), meta={'download_spool': True})
+        return self.download_request(request, self.spider).addCallback(_test)
+
+    def test_download_spool_threshold(self):
+        def _test(response):
+            assert response.spooled
+            self.assertEquals(response.body, "0123456789")
+
+        def _restore(result):
+            del settings.overrides['DOWNLOAD_SPOOL_THRESHOLD']
+            return result
+
+        settings.overrides['DOWNLOAD_SPOOL_THRESHOLD'] = 5
+        d = self.download_request(Request(self.getURL('file')), self.spider)
+        d.addCallback(_test)
+        d.addCallback(lambda _: self.download_request( \
+            Request(self.getURL('file'), meta={'download_spool': False}), self.spider))
+        d.addCallback(lambda r: self.failIf(r.spooled))
+        d.addBoth(_restore)
+        return d
+
+
+class Http11TestCase(HttpTestCase):
+
+    download_handler_cls = Http11DownloadHandler
+
+    def setUp(self):
+        super(Http11TestCase, self).setUp()
+        stats.open_spider(self.spider)
+
+    def tearDown(self):
+        d = self.download_handler.pool.close()
+        d.addBoth(lambda _: HttpTestCase.tearDown(self))
+        return d
+
+    def test_broken_download(self):
+        # the server would keep the connection open waiting for the missing
+        # bytes, so ask it to close the connection after the response
+        request = Request(self.getURL('broken'), headers={'Connection': 'close'})
+        d = self.download_request(request, self.spider)
+        return self.assertFailure(d, PartialDownloadError)
+
+    def test_download_nolength(self):
+        # chunked transfer encoding is used for responses without length
+        request = Request(self.getURL('nolength'))
+        d = self.download_request(request, self.spider)
+        d.addCallback(lambda r: r.body)
+        d.addCallback(self.assertEquals, "nolength")
+        return d
+
+    def test_connection_reused(self):
+        pool = self.download_handler.pool
+
+        def _test_first(response):
+            self.assertEquals(response.body, "0123456789")
+            self.assertEquals(pool.connections, 1)
+            self.assertEquals(pool.idle_connections(), 1)
+            return self.download_request(Request(self.getURL('host')), self.spider)
+
+        def _test_second(response):
+            self.assertEquals(response.body, '127.0.0.1:%d' % self.portno)
+            self.assertEquals(pool.connections, 1)
+            self.assertEquals(pool.idle_connections(), 1)
+            self.assertEquals(stats.get_value('downloader/connection_opened_count', \
+                spider=self.spider), 1)
+            self.assertEquals(stats.get_value('downloader/connection_reused_count', \
+                spider=self.spider), 1)
+
+        d = self.download_request(Request(self.getURL('file')), self.spider)
+        d.addCallback(_test_first)
+        d.addCallback(_test_second)
+        return d
+
+    def test_connection_close_requested(self):
+        pool = self.download_handler.pool
+        request = Request(self.getURL('file'), headers={'Connection': 'close'})
+        d = self.download_request(request, self.spider)
+        d.addCallback(lambda r: self.assertEquals(r.body, "0123456789"))
+        d.addCallback(lambda _: self.assertEquals(pool.idle_connections(), 0))
+        return d
+
+    def test_maxsockets(self):
+        pool = self.download_handler.pool
+        pool.maxsockets = 1
+        dfds = [self.download_request(Request(self.getURL('file')), self.spider) \
+            for _ in range(3)]
+        self.assertEquals(pool.connections, 1)
+        d = defer.gatherResults(dfds)
+        d.addCallback(lambda bodies: self.assertEquals([r.body for r in bodies], \
+            ["0123456789"] * 3))
+        return d
+
 
 class UriResource(resource.Resource):
     """Return the full uri that was requested"""
@@ -149,12 +294,16 @@ class UriResource(resource.Resource):
 
 class HttpProxyTestCase(unittest.TestCase):
 
+    download_handler_cls = HttpDownloadHandler
+
     def setUp(self):
         site = server.Site(UriResource(), timeout=None)
         wrapper = WrappingFactory(site)
         self.port = reactor.listenTCP(0, wrapper, interface='127.0.0.1')
         self.portno = self.port.getHost().port
-        self.download_request = HttpDownloadHandler().download_request
+        self.spider = BaseSpider('foo')
+        self.download_handler = self.download_handler_cls()
+        self.download_request = self.download_handler.download_request
 
     def tearDown(self):
         return self.port.stopListening()
@@ -170,7 +319,7 @@ class HttpProxyTestCase(unittest.TestCase):
 
         http_proxy = self.getURL('')
         request = Request('https://example.com', meta={'proxy': http_proxy})
-        return self.download_request(request, BaseSpider('foo')).addCallback(_test)
+        return self.download_request(request, self.spider).addCallback(_test)
 
     def test_download_without_proxy(self):
         def _test(response):
@@ -179,7 +328,21 @@ class HttpProxyTestCase(unittest.TestCase):
             self.assertEquals(response.body, '/path/to/resource')
 
         request = Request(self.getURL('path/to/resource'))
-        return self.download_request(request, BaseSpider('foo')).addCallback(_test)
+        return self.download_request(request, self.spider).addCallback(_test)
+
+
+class Http11ProxyTestCase(HttpProxyTestCase):
+
+    download_handler_cls = Http11DownloadHandler
+
+    def setUp(self):
+        super(Http11ProxyTestCase, self).setUp()
+        stats.open_spider(self.spider)
+
+    def tearDown(self):
+        d = self.download_handler.pool.close()
+        d.addBoth(lambda _: HttpProxyTestCase.tearDown(self))
+        return d
 
 
 class HttpDownloadHandlerMock(object):
@@ -0,0 +1,111 @@
+from twisted.trial import unittest
+from twisted.internet import defer, reactor
+
+from scrapy.core.downloader.middleware import DownloaderMiddlewareManager
+from scrapy.exceptions import IgnoreRequest
+from scrapy.http import Request, Response
+from scrapy.spider import BaseSpider
+from scrapy.utils.signal import send_catch_log, disconnect_all
+from scrapy import signals
+
+
+class HeadersMiddleware(object):
+
+    def __init__(self, abort=False):
+        self.abort = abort
+        self.received = []
+
+    def process_headers(self, request, response, spider):
+        self.received.append(response)
+        if self.abort:
+            raise IgnoreRequest
+
+
+class ProcessHeadersTest(unittest.TestCase):
+
+    def setUp(self):
+        self.spider = BaseSpider('foo')
+        self.request = Request('http://scrapytest.org/')
+        self.response = Response('http://scrapytest.org/')
+
+    def tearDown(self):
+        disconnect_all(signals.headers_received)
+
+    def _send(self):
+        return send_catch_log(signal=signals.headers_received, \
+            response=self.response, request=self.request, spider=self.spider, \
+            dont_log=IgnoreRequest)
+
+    def test_process_headers(self):
+        mw1, mw2 = HeadersMiddleware(), HeadersMiddleware()
+        mwman = DownloaderMiddlewareManager(mw1, mw2)
+        results = self._send()
+        self.assertEqual([r for _, r in results], [None])
+        self.assertEqual(mw1.received, [self.response])
+        self.assertEqual(mw2.received, [self.response])
+
+    def test_process_headers_abort(self):
+        mw1, mw2 = HeadersMiddleware(), HeadersMiddleware(abort=True)
+        mwman = DownloaderMiddlewareManager(mw1, mw2)
+        [(_, failure)] = self._send()
+        assert isinstance(failure.value, IgnoreRequest)
+        # process_headers methods are called in process_response order
+        self.assertEqual(mw1.received, [])
+        self.assertEqual(mw2.received, [self.response])
+
+    def test_not_connected_without_process_headers(self):
+        mwman = DownloaderMiddlewareManager(object())
+        self.assertEqual(self._send(), [])
+
+
+class DeferredMiddleware(object):
+
+    def __init__(self, response=None):
+        self.response = response
+        self.processed = []
+
+    def _later(self, result):
+        d = defer.Deferred()
+        reactor.callLater(0, d.callback, result)
+        return d
+
+    def process_request(self, request, spider):
+        self.processed.append(request)
+        return self._later(self.response)
+
+    def process_response(self, request, response, spider):
+        self.processed.append(response)
+        return self._later(response.replace(body=response.body + '!'))
+
+
+class DeferredResultsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.spider = BaseSpider('foo')
+        self.request = Request('http://scrapytest.org/')
+        self.response = Response('http://scrapytest.org/', body='body')
+
+    def _download(self, request, spider):
+        return defer.succeed(self.response)
+
+    @defer.inlineCallbacks
+    def test_deferred_results(self):
+        mw1, mw2 = DeferredMiddleware(), DeferredMiddleware()
+        mwman = DownloaderMiddlewareManager(mw1, mw2)
+        response = yield mwman.download(self._download, self.request, self.spider)
+        self.assertEqual(response.body, 'body!!')
+        self.assertEqual(mw1.processed[0], self.request)
+        self.assertEqual(mw2.processed[0], self.request)
+        # process_response is called in reverse order
+        self.assertEqual(mw2.processed[1], self.response)
+        self.assertEqual(mw1.processed[1].body, 'body!')
+
+    @defer.inlineCallbacks
+    def test_deferred_response_from_process_request(self):
+        mw1 = DeferredMiddleware(Response('http://scrapytest.org/', body='cached'))
+        mw2 = DeferredMiddleware()
+        mwman = DownloaderMiddlewareManager(mw1, mw2)
+        response = yield mwman.download(self._download, self.request, self.spider)
+        self.assertEqual(response.body, 'cached!!')
+        # the next process_request methods are skipped
+        self.assertEqual(len(mw2.processed), 1)
@@ -1,10 +1,40 @@
+import bz2
+import gzip
+import tarfile
+import zipfile
 from unittest import TestCase, main
-from scrapy.http import Response, XmlResponse, Request
-from scrapy.contrib_exp.downloadermiddleware.decompression import DecompressionMiddleware
+from cStringIO import StringIO
+from scrapy.http import Response, XmlResponse, HtmlResponse, TextResponse, Request
+from scrapy.contrib_exp.downloadermiddleware.decompression import \
+    DecompressionMiddleware, iter_decompressed, sniff_format, MaxSizeExceeded
 from scrapy.spider import BaseSpider
+from scrapy.settings import Settings
+from scrapy.exceptions import IgnoreRequest
+from scrapy.stats import stats
 from scrapy.tests import get_testdata
 
 
+def _zip(members):
+    f = StringIO()
+    zip_file = zipfile.ZipFile(f, 'w', zipfile.ZIP_DEFLATED)
+    for name, data in members:
+        zip_file.writestr(name, data or '')
+    zip_file.close()
+    return Response('http://foo.com/bar', body=f.getvalue())
+
+def _tar(members, mode='w:gz'):
+    f = StringIO()
+    tar_file = tarfile.open(fileobj=f, mode=mode)
+    for name, data in members:
+        info = tarfile.TarInfo(name)
+        if data is None:
+            info.type = tarfile.DIRTYPE
+        else:
+            info.size = len(data)
+        tar_file.addfile(info, StringIO(data or ''))
+    tar_file.close()
+    return Response('http://foo.com/bar', body=f.getvalue())
+
 def _test_data(formats):
     uncompressed_body = get_testdata('compressed', 'feed-sample1.xml')
     test_responses = {}
@@ -22,6 +52,7 @@ class DecompressionMiddlewareTest(TestCase):
     def setUp(self):
         self.mw = DecompressionMiddleware()
         self.spider = BaseSpider('foo')
+        stats.open_spider(self.spider)
 
     def test_known_compression_formats(self):
         for fmt in self.test_formats:
@@ -44,7 +75,106 @@ class DecompressionMiddlewareTest(TestCase):
         assert not rsp.body
         assert not new.body
 
+    def test_dont_decompress(self):
+        rsp = self.test_responses['xml.gz']
+        req = Request('http://foo.com/bar', meta={'dont_decompress': True})
+        assert self.mw.process_response(req, rsp, self.spider) is rsp
+
+    def test_invalid_compressed_response(self):
+        rsp = Response(url='http://test.com', body='\x1f\x8bnot really gzip')
+        self.assertEqual(sniff_format(rsp), 'gz')
+        new = self.mw.process_response(None, rsp, self.spider)
+        assert new is rsp
+
+    def test_corrupt_after_start(self):
+        # the data is only corrupt past the part read to sniff the body type
+        body = ''.join('<p>%d</p>' % n for n in xrange(10000))
+        f = StringIO()
+        gz_file = gzip.GzipFile(fileobj=f, mode='wb')
+        gz_file.write(body)
+        gz_file.close()
+        gz_body = f.getvalue()
+        bz2_body = bz2.compress(body)
+        for corrupt in gz_body[:-8] + 'xxxx' + gz_body[-4:], \
+                gz_body[:-20], bz2_body[:-4] + 'xxxx', bz2_body[:-20]:
+            rsp = Response('http://foo.com/bar', body=corrupt)
+            new = self.mw.process_response(None, rsp, self.spider)
+            assert new is rsp
+
+    def test_spooled(self):
+        mw = DecompressionMiddleware(Settings({'DOWNLOAD_SPOOL_THRESHOLD': 1000}))
+        for fmt in 'xml.bz2', 'xml.gz':
+            new = mw.process_response(None, self.test_responses[fmt], self.spider)
+            assert isinstance(new, XmlResponse)
+            assert new.spooled
+            self.assertEqual(new.body, self.uncompressed_body)
+            req = Request('http://foo.com/bar', meta={'download_spool': False})
+            new = mw.process_response(req, self.test_responses[fmt], self.spider)
+            assert not new.spooled
+            self.assertEqual(new.body, self.uncompressed_body)
+
+    def test_multiple_members(self):
+        members = [('a/', None), ('a/page.html', '<html></html>'), \
+            ('a/feed.xml', self.uncompressed_body), ('notes.txt', 'some notes')]
+        for rsp in _zip(members), _tar(members):
+            responses = list(iter_decompressed(rsp))
+            self.assertEqual([type(r) for r in responses], \
+                [HtmlResponse, XmlResponse, TextResponse])
+            self.assertEqual([r.body for r in responses], \
+                [data for _, data in members[1:]])
+            # the middleware only keeps the first member
+            new = self.mw.process_response(None, rsp, self.spider)
+            assert isinstance(new, HtmlResponse)
+            self.assertEqual(new.body, members[1][1])
+
+    def test_maxsize(self):
+        mw = DecompressionMiddleware(Settings({'HTTPCOMPRESSION_MAXSIZE': \
+            100000}))
+        bomb = '\x00' * 1000000
+        f = StringIO()
+        gz_file = gzip.GzipFile(fileobj=f, mode='wb')
+        gz_file.write(bomb)
+        gz_file.close()
+        gz_rsp = Response('http://foo.com/bar', body=f.getvalue())
+        bz2_rsp = Response('http://foo.com/bar', body=bz2.compress(bomb))
+        for rsp in gz_rsp, bz2_rsp, _tar([('bomb.txt', bomb)], 'w'):
+            self.assertRaises(IgnoreRequest, mw.process_response, None, rsp, \
+                self.spider)
+        self.assertEqual(stats.get_value('decompression/response_aborted_count', \
+            spider=self.spider), 3)
+        # only the members iterated are extracted (and checked)
+        members = [('small.txt', 'small'), ('bomb.txt', bomb)]
+        for rsp in _zip(members), _tar(members, 'w'):
+            self.assertEqual(mw.process_response(None, rsp, self.spider).body, \
+                'small')
+            self.assertRaises(MaxSizeExceeded, list, \
+                iter_decompressed(rsp, maxsize=100000))
+        # but the whole tar file is decompressed from gzip
+        self.assertRaises(IgnoreRequest, mw.process_response, None, \
+            _tar(members), self.spider)
+
+    def test_maxsize_member_size_wrong(self):
+        # the size of the member in the zip archive is a lie
+        rsp = _zip([('bomb.txt', '\x00' * 1000000)])
+        body = rsp.body.replace('\x40\x42\x0f\x00', '\x10\x00\x00\x00')
+        rsp = rsp.replace(body=body)
+        self.assertRaises(MaxSizeExceeded, list, \
+            iter_decompressed(rsp, maxsize=100000))
+
+    def test_tar_without_magic(self):
+        body = self.test_responses['tar'].body
+        header = body[:257] + '\x00' * 8 + body[265:512]
+        chksum = sum(ord(c) for c in header[:148] + ' ' * 8 + header[156:])
+        body = header[:148] + '%06o\x00 ' % chksum + header[156:] + body[512:]
+        rsp = Response('http://foo.com/bar', body=body)
+        self.assertEqual(sniff_format(rsp), None)
+        rsp = Response('http://foo.com/bar', body=body, \
+            headers={'Content-Type': 'application/x-tar'})
+        new = self.mw.process_response(None, rsp, self.spider)
+        self.assertEqual(new.body, self.uncompressed_body)
+
     def tearDown(self):
+        stats.close_spider(self.spider, '')
         del self.mw
 
 
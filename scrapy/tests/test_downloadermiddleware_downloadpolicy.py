@@ -0,0 +1,85 @@
+import unittest
+
+from scrapy.contrib.downloadermiddleware.downloadpolicy import \
+    DownloadPolicyMiddleware
+from scrapy.exceptions import IgnoreRequest, NotConfigured
+from scrapy.settings import Settings
+from scrapy.spider import BaseSpider
+from scrapy.http import Request, Response
+from scrapy.utils.test import get_crawler
+
+
+class DownloadPolicyMiddlewareTest(unittest.TestCase):
+
+    def setUp(self):
+        self.spider = BaseSpider('foo')
+        self.spider.set_crawler(get_crawler())
+        self.request = Request('http://scrapytest.org/')
+        self.mw = DownloadPolicyMiddleware()
+
+    def _headers(self, status=200, **headers):
+        response = Response('http://scrapytest.org/', status=status, \
+            headers=headers)
+        return self.mw.process_headers(self.request, response, self.spider)
+
+    def test_not_configured(self):
+        self.assertRaises(NotConfigured, DownloadPolicyMiddleware.from_settings, \
+            Settings())
+        for name, value in [('DOWNLOAD_MAXSIZE', 100), \
+                ('DOWNLOAD_STATUS_DENIED', [404]), \
+                ('DOWNLOAD_POLICY_ENABLED', True)]:
+            mw = DownloadPolicyMiddleware.from_settings(Settings({name: value}))
+            assert isinstance(mw, DownloadPolicyMiddleware)
+
+    def test_maxsize_sets_request_meta(self):
+        self.mw.process_request(self.request, self.spider)
+        assert 'download_maxsize' not in self.request.meta
+        self.spider.DOWNLOAD_MAXSIZE = 100
+        self.mw = DownloadPolicyMiddleware()
+        self.mw.process_request(self.request, self.spider)
+        self.assertEqual(self.request.meta['download_maxsize'], 100)
+        request = Request('http://scrapytest.org/', \
+            meta={'download_maxsize': 1000})
+        self.mw.process_request(request, self.spider)
+        self.assertEqual(request.meta['download_maxsize'], 1000)
+
+    def test_maxsize(self):
+        self.spider.DOWNLOAD_MAXSIZE = 100
+        assert self._headers(**{'Content-Length': '100'}) is None
+        assert self._headers() is None
+        self.assertRaises(IgnoreRequest, self._headers, \
+            **{'Content-Length': '101'})
+
+    def test_maxsize_request_meta(self):
+        self.spider.DOWNLOAD_MAXSIZE = 100
+        self.request.meta['download_maxsize'] = 1000
+        assert self._headers(**{'Content-Length': '101'}) is None
+        self.request.meta['download_maxsize'] = 10
+        self.assertRaises(IgnoreRequest, self._headers, \
+            **{'Content-Length': '11'})
+
+    def test_mimetypes_allowed(self):
+        self.spider.DOWNLOAD_MIMETYPES_ALLOWED = ['text/*', 'application/xml']
+        assert self._headers(**{'Content-Type': 'text/html; charset=utf-8'}) is None
+        assert self._headers(**{'Content-Type': 'Application/XML'}) is None
+        self.assertRaises(IgnoreRequest, self._headers, \
+            **{'Content-Type': 'application/octet-stream'})
+        self.assertRaises(IgnoreRequest, self._headers)
+
+    def test_mimetypes_denied(self):
+        self.spider.DOWNLOAD_MIMETYPES_DENIED = ['application/octet-stream', 'video/*']
+        assert self._headers(**{'Content-Type': 'text/html'}) is None
+        assert self._headers() is None
+        self.assertRaises(IgnoreRequest, self._headers, \
+            **{'Content-Type': 'video/mp4'})
+        self.assertRaises(IgnoreRequest, self._headers, \
+            **{'Content-Type': 'application/octet-stream'})
+
+    def test_status_denied(self):
+        self.spider.DOWNLOAD_STATUS_DENIED = [404]
+        assert self._headers(status=200) is None
+        self.assertRaises(IgnoreRequest, self._headers, status=404)
+
+
+if __name__ == '__main__':
+    unittest.main()
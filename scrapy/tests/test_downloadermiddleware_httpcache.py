@@ -1,10 +1,19 @@
-import unittest, tempfile, shutil, time
+import os, unittest, tempfile, shutil, time, hashlib
+from email.Utils import formatdate
+
+from twisted.internet import defer
+from twisted.trial.unittest import TestCase
 
 from scrapy.http import Response, HtmlResponse, Request
+from scrapy.core.scheduler import Scheduler
+from scrapy.conf import settings
 from scrapy.spider import BaseSpider
-from scrapy.contrib.downloadermiddleware.httpcache import FilesystemCacheStorage, HttpCacheMiddleware
+from scrapy.contrib.downloadermiddleware.httpcache import FilesystemCacheStorage, \
+    SqliteCacheStorage, ThreadedCacheStorage, HttpCacheMiddleware, RFC2616Policy
 from scrapy.settings import Settings
 from scrapy.exceptions import IgnoreRequest
+from scrapy.stats import stats
+from scrapy.utils.request import request_fingerprint
 
 
 class HttpCacheMiddlewareTest(unittest.TestCase):
@@ -16,8 +25,10 @@ class HttpCacheMiddlewareTest(unittest.TestCase):
         self.tmpdir = tempfile.mkdtemp()
         self.request = Request('http://www.example.com', headers={'User-Agent': 'test'})
         self.response = Response('http://www.example.com', headers={'Content-Type': 'text/html'}, body='test body', status=202)
+        stats.open_spider(self.spider)
 
     def tearDown(self):
+        stats.close_spider(self.spider, '')
         shutil.rmtree(self.tmpdir)
 
     def _get_settings(self, **new_settings):
@@ -26,6 +37,8 @@ class HttpCacheMiddlewareTest(unittest.TestCase):
             'HTTPCACHE_DIR': self.tmpdir,
             'HTTPCACHE_EXPIRATION_SECS': 1,
             'HTTPCACHE_IGNORE_HTTP_CODES': [],
+            'HTTPCACHE_STORAGE': '%s.%s' % (self.storage_class.__module__, \
+                self.storage_class.__name__),
         }
         settings.update(new_settings)
         return Settings(settings)
@@ -54,6 +67,24 @@ class HttpCacheMiddlewareTest(unittest.TestCase):
         time.sleep(0.5) # give the chance to expire
         assert storage.retrieve_response(self.spider, self.request)
 
+    def test_report_and_prune(self):
+        storage = self._get_storage()
+        storage.open_spider(self.spider)
+        storage.store_response(self.spider, self.request, self.response)
+        report = storage.report(self.spider)
+        self.assertEqual((report['entries'], report['expired']), (1, 0))
+        assert report['size'] > 0
+        self.assertEqual(storage.list_spiders(), ['example.com'])
+        time.sleep(2) # wait for cache to expire
+        request2 = Request('http://www.example.com/2')
+        storage.store_response(self.spider, request2, self.response)
+        report = storage.report(self.spider)
+        self.assertEqual((report['entries'], report['expired']), (2, 1))
+        self.assertEqual(storage.prune(self.spider), 1)
+        self.assertEqual(storage.report(self.spider)['entries'], 1)
+        assert storage.retrieve_response(self.spider, request2)
+        storage.close_spider(self.spider)
+
     def test_middleware(self):
         mw = HttpCacheMiddleware(self._get_settings())
         assert mw.process_request(self.request, self.spider) is None
@@ -142,6 +173,435 @@ class HttpCacheMiddlewareTest(unittest.TestCase):
         self.assertEqual(response1.headers, response2.headers)
         self.assertEqual(response1.body, response2.body)
 
+    def test_middleware_doesnt_store_cached(self):
+        mw = self._get_middleware()
+        mw.process_response(self.request, self.response, self.spider)
+        response = mw.process_request(self.request, self.spider)
+        mw.storage.store_response = lambda *a: self.fail("stored again")
+        mw.process_response(self.request, response, self.spider)
+
+
+class RFC2616PolicyTest(HttpCacheMiddlewareTest):
+
+    def setUp(self):
+        super(RFC2616PolicyTest, self).setUp()
+        # the tests of the default policy need a cacheable response
+        self.response = self._response(status=202, Cache_Control='max-age=60')
+
+    def _get_settings(self, **new_settings):
+        new_settings.setdefault('HTTPCACHE_POLICY', \
+            'scrapy.contrib.downloadermiddleware.httpcache.RFC2616Policy')
+        return super(RFC2616PolicyTest, self)._get_settings(**new_settings)
+
+    def _response(self, status=200, body='test body', **headers):
+        headers = dict((k.replace('_', '-'), v) for k, v in headers.items())
+        headers.setdefault('Date', formatdate(usegmt=True))
+        headers.setdefault('Content-Type', 'text/html')
+        return Response(self.request.url, status=status, headers=headers, \
+            body=body)
+
+    def _cache(self, mw, response):
+        assert mw.process_request(self.request, self.spider) is None
+        mw.process_response(self.request, response, self.spider)
+
+    # these tests of the default policy use responses without caching headers
+    def test_different_request_response_urls(self):
+        pass
+
+    def test_middleware_ignore_schemes(self):
+        pass
+
+    def test_fresh(self):
+        mw = self._get_middleware()
+        response = self._response(Cache_Control='max-age=60')
+        self._cache(mw, response)
+        cached = mw.process_request(self.request, self.spider)
+        self.assertEqualResponse(response, cached)
+        assert 'cached' in cached.flags
+
+    def test_expired(self):
+        mw = self._get_middleware()
+        date = formatdate(time.time() - 120, usegmt=True)
+        self._cache(mw, self._response(Date=date, Cache_Control='max-age=60'))
+        assert mw.process_request(self.request, self.spider) is None
+        self._cache(mw, self._response(Expires=date, body='new body'))
+        # Expires is in the past, so the new response isn't fresh either
+        assert mw.process_request(self.request, self.spider) is None
+        expires = formatdate(time.time() + 60, usegmt=True)
+        self._cache(mw, self._response(Expires=expires, body='newer body'))
+        self.assertEqual(mw.process_request(self.request, self.spider).body, \
+            'newer body')
+
+    def test_not_cached(self):
+        mw = self._get_middleware()
+        # no-store, or no expiration and no validators
+        for response in [self._response(Cache_Control='no-store, max-age=60'), \
+                self._response()]:
+            self._cache(mw, response)
+            assert mw.storage.retrieve_response(self.spider, self.request) is None
+
+    def test_no_cache_request(self):
+        mw = self._get_middleware()
+        self._cache(mw, self._response(Cache_Control='max-age=60'))
+        self.request.headers['Cache-Control'] = 'no-cache'
+        assert mw.process_request(self.request, self.spider) is None
+
+    def test_heuristic_freshness(self):
+        # 10% of the time since the last modification
+        mw = self._get_middleware(HTTPCACHE_EXPIRATION_SECS=0)
+        lastmod = formatdate(time.time() - 1000, usegmt=True)
+        self._cache(mw, self._response(Last_Modified=lastmod))
+        assert mw.process_request(self.request, self.spider)
+        self.request = Request('http://www.example.com/2')
+        lastmod = formatdate(time.time() - 10, usegmt=True)
+        self._cache(mw, self._response(Last_Modified=lastmod))
+        time.sleep(1.5)
+        assert mw.process_request(self.request, self.spider) is None
+
+    def test_revalidate_not_modified(self):
+        mw = self._get_middleware()
+        lastmod = formatdate(time.time() - 3600, usegmt=True)
+        date = formatdate(time.time() - 120, usegmt=True)
+        response = self._response(Date=date, ETag='"abc"', Last_Modified=lastmod, \
+            Cache_Control='max-age=60')
+        self._cache(mw, response)
+
+        assert mw.process_request(self.request, self.spider) is None
+        self.assertEqual(self.request.headers['If-None-Match'], '"abc"')
+        self.assertEqual(self.request.headers['If-Modified-Since'], lastmod)
+        notmodified = Response(self.request.url, status=304, \
+            headers={'Cache-Control': 'max-age=600'})
+        cached = mw.process_response(self.request, notmodified, self.spider)
+        self.assertEqual(cached.status, 200)
+        self.assertEqual(cached.body, response.body)
+        self.assertEqual(cached.headers['ETag'], '"abc"')
+        self.assertEqual(cached.headers['Cache-Control'], 'max-age=600')
+        assert 'cached' in cached.flags
+        # the refreshed response is stored, and fresh again
+        cached = mw.process_request(self.request, self.spider)
+        self.assertEqual(cached.body, response.body)
+        assert 'cached' in cached.flags
+
+    def test_revalidate_modified(self):
+        mw = self._get_middleware()
+        self._cache(mw, self._response(ETag='"abc"', Cache_Control='max-age=0'))
+        assert mw.process_request(self.request, self.spider) is None
+        response = self._response(ETag='"def"', body='new body', \
+            Cache_Control='max-age=60')
+        result = mw.process_response(self.request, response, self.spider)
+        assert result is response
+        assert 'cached' not in result.flags
+        self.assertEqualResponse(response, \
+            mw.process_request(self.request, self.spider))
+
+
+class SqliteCacheStorageTest(HttpCacheMiddlewareTest):
+
+    storage_class = SqliteCacheStorage
+
+    def test_migrate(self):
+        source = FilesystemCacheStorage(self._get_settings())
+        source.store_response(self.spider, self.request, self.response)
+        req2 = Request('http://www.example.com/2', method='POST', body='a=1')
+        res2 = Response('http://www.example.com/3', body='other body')
+        source.store_response(self.spider, req2, res2)
+
+        storage = self._get_storage(HTTPCACHE_EXPIRATION_SECS=0)
+        records = list(source.iter_records(self.spider))
+        self.assertEqual(len(records), 2)
+        for record in records:
+            storage.store_record(self.spider, record)
+        self.assertEqualResponse(self.response, \
+            storage.retrieve_response(self.spider, self.request))
+        self.assertEqualResponse(res2, storage.retrieve_response(self.spider, req2))
+        storage.close_spider(self.spider)
+
+    def test_multiple_processes(self):
+        # another storage (ie. from other process) sees the stored entries
+        storage1 = self._get_storage()
+        storage2 = self._get_storage()
+        assert storage2.retrieve_response(self.spider, self.request) is None
+        storage1.store_response(self.spider, self.request, self.response)
+        self.assertEqualResponse(self.response, \
+            storage2.retrieve_response(self.spider, self.request))
+        storage1.close_spider(self.spider)
+        storage2.close_spider(self.spider)
+
+    def test_dedup_and_compression(self):
+        storage = self._get_storage()
+        body = 'test body ' * 1000
+        for n in range(3):
+            request = Request('http://www.example.com/%d' % n)
+            response = Response(request.url, body=body if n < 2 else 'other')
+            storage.store_response(self.spider, request, response)
+            self.assertEqual(storage.retrieve_response(self.spider, request).body, \
+                response.body)
+        conn = storage.dbs[self.spider]
+        # the request bodies (empty) and the two different response bodies
+        self.assertEqual(conn.execute("select count(*) from bodies").fetchone()[0], 3)
+        compressed = conn.execute("select compressed from bodies where " \
+            "length(data) > 1000 or hash=?", (hashlib.sha1('other').hexdigest(),))
+        # bodies are only kept compressed when that saves space
+        self.assertEqual(sorted(x[0] for x in compressed), [0])
+        storage.close_spider(self.spider)
+        self.assertEqual(stats.get_value('httpcache/body_bytes', spider=self.spider), \
+            len(body) * 2 + 5)
+        self.assertEqual(stats.get_value('httpcache/new_body_bytes', \
+            spider=self.spider), len(body) + 5)
+        self.assertEqual(stats.get_value('httpcache/dedup_ratio', \
+            spider=self.spider), round((len(body) * 2 + 5.0) / (len(body) + 5), 2))
+        assert stats.get_value('httpcache/compression_ratio', spider=self.spider) > 10
+
+    def test_maxsize(self):
+        storage = self._get_storage(HTTPCACHE_MAXSIZE=5000)
+        requests = [Request('http://www.example.com/%d' % n) for n in range(10)]
+        for n, request in enumerate(requests):
+            storage.store_response(self.spider, request, Response(request.url, \
+                body=os.urandom(1000)))
+            assert storage.report(self.spider)['size'] <= 5000
+            # keep using the first one
+            assert storage.retrieve_response(self.spider, requests[0])
+        assert storage.retrieve_response(self.spider, requests[-1])
+        assert storage.retrieve_response(self.spider, requests[1]) is None
+        assert stats.get_value('httpcache/evicted_entries', spider=self.spider) > 0
+        # the size kept while crawling must match the stored entries
+        size = storage.report(self.spider)['size']
+        storage.close_spider(self.spider)
+        storage.open_spider(self.spider)
+        self.assertEqual(storage.report(self.spider)['size'], size)
+        # or computed from them, if it's not in the database
+        conn = storage.dbs[self.spider]
+        conn.execute("delete from meta")
+        conn.commit()
+        storage.close_spider(self.spider)
+        storage.open_spider(self.spider)
+        self.assertEqual(storage.report(self.spider)['size'], size)
+        storage.close_spider(self.spider)
+
+    def test_size_multiple_processes(self):
+        # the size changes of other processes aren't lost
+        storage1 = self._get_storage()
+        storage2 = self._get_storage()
+        for n in range(6):
+            request = Request('http://www.example.com/%d' % n)
+            storage = storage2 if n % 2 else storage1
+            storage.store_response(self.spider, request, Response(request.url, \
+                body=os.urandom(1000)))
+        size = storage1.report(self.spider)['size']
+        self.assertEqual(storage2.report(self.spider)['size'], size)
+        conn = storage1.dbs[self.spider]
+        conn.execute("delete from meta")
+        conn.commit()
+        storage1.close_spider(self.spider)
+        storage1.open_spider(self.spider)
+        self.assertEqual(storage1.report(self.spider)['size'], size)
+        storage1.close_spider(self.spider)
+        storage2.close_spider(self.spider)
+
+    def test_accessed_batched(self):
+        storage = self._get_storage(HTTPCACHE_MAXSIZE=100000)
+        storage.accessed_batch = 3
+        storage.store_response(self.spider, self.request, self.response)
+        conn = storage.dbs[self.spider]
+        accessed = conn.execute("select accessed from responses").fetchone()[0]
+        time.sleep(0.01)
+        for _ in range(2):
+            assert storage.retrieve_response(self.spider, self.request)
+        # not written yet
+        self.assertEqual(conn.execute("select accessed from responses").fetchone()[0], \
+            accessed)
+        # it's written when closing the spider, at the latest
+        storage.close_spider(self.spider)
+        storage.open_spider(self.spider)
+        conn = storage.dbs[self.spider]
+        assert conn.execute("select accessed from responses").fetchone()[0] > accessed
+        storage.close_spider(self.spider)
+
+    def test_size_kept_in_database(self):
+        storage = self._get_storage()
+        storage.store_response(self.spider, self.request, self.response)
+        conn = storage.dbs[self.spider]
+        self.assertEqual(conn.execute("select value from meta where " \
+            "name='size'").fetchone()[0], storage.report(self.spider)['size'])
+        # it's not computed again when the database is opened
+        conn.execute("update meta set value=12345")
+        conn.commit()
+        storage.close_spider(self.spider)
+        storage.open_spider(self.spider)
+        self.assertEqual(storage.report(self.spider)['size'], 12345)
+        storage.close_spider(self.spider)
+
+    def test_replace_entry(self):
+        storage = self._get_storage()
+        storage.store_response(self.spider, self.request, self.response)
+        size = storage.report(self.spider)['size']
+        storage.store_response(self.spider, self.request, \
+            self.response.replace(body='other body'))
+        self.assertEqual(storage.report(self.spider)['size'], size + 1)
+        conn = storage.dbs[self.spider]
+        # the old body isn't used anymore
+        self.assertEqual(conn.execute("select count(*) from bodies").fetchone()[0], 2)
+        storage.close_spider(self.spider)
+
+    def test_compact(self):
+        storage = self._get_storage(HTTPCACHE_EXPIRATION_SECS=1)
+        for n in range(20):
+            request = Request('http://www.example.com/%d' % n)
+            storage.store_response(self.spider, request, Response(request.url, \
+                body=os.urandom(5000)))
+        time.sleep(2) # wait for cache to expire
+        self.assertEqual(storage.prune(self.spider), 20)
+        self.assertEqual(storage.report(self.spider)['size'], 0)
+        before, after = storage.compact(self.spider)
+        assert after < before
+        storage.close_spider(self.spider)
+
+    def test_no_compression(self):
+        storage = self._get_storage(HTTPCACHE_COMPRESSION_LEVEL=0)
+        body = 'test body ' * 1000
+        storage.store_response(self.spider, self.request, Response( \
+            self.request.url, body=body))
+        self.assertEqual(storage.retrieve_response(self.spider, self.request).body, body)
+        self.assertEqual(storage.dbs[self.spider].execute("select max(length(data)) " \
+            "from bodies").fetchone()[0], len(body))
+        storage.close_spider(self.spider)
+
+
+class ThreadedCacheStorageTest(TestCase):
+
+    def setUp(self):
+        self.spider = BaseSpider('example.com')
+        self.tmpdir = tempfile.mkdtemp()
+        self.request = Request('http://www.example.com')
+        self.response = Response('http://www.example.com', body='test body')
+        stats.open_spider(self.spider)
+        self.mw = HttpCacheMiddleware(self._get_settings())
+        self.storage = self.mw.storage
+        return self.mw.spider_opened(self.spider)
+
+    @defer.inlineCallbacks
+    def tearDown(self):
+        if self.spider in self.storage.pending:
+            yield self.mw.spider_closed(self.spider)
+        stats.close_spider(self.spider, '')
+        shutil.rmtree(self.tmpdir)
+
+    def _get_settings(self):
+        return Settings({
+            'HTTPCACHE_ENABLED': True,
+            'HTTPCACHE_DIR': self.tmpdir,
+            'HTTPCACHE_STORAGE': 'scrapy.contrib.downloadermiddleware.' \
+                'httpcache.SqliteCacheStorage',
+            'HTTPCACHE_THREADS': 2,
+        })
+
+    @defer.inlineCallbacks
+    def test_middleware(self):
+        assert isinstance(self.storage, ThreadedCacheStorage)
+        response = yield self.mw.process_request(self.request, self.spider)
+        assert response is None
+        # the response goes on while being stored
+        response = self.mw.process_response(self.request, self.response, \
+            self.spider)
+        assert response is self.response
+        yield defer.DeferredList(list(self.storage.pending[self.spider]))
+        response = yield self.mw.process_request(self.request, self.spider)
+        self.assertEqual(response.body, self.response.body)
+        assert 'cached' in response.flags
+
+    @defer.inlineCallbacks
+    def test_close_waits_for_writes(self):
+        self.mw.process_response(self.request, self.response, self.spider)
+        threadpool = self.storage.threadpool
+        yield self.mw.spider_closed(self.spider)
+        assert not threadpool.threads
+        assert self.storage.threadpool is None
+        storage = SqliteCacheStorage(self._get_settings())
+        response = storage.retrieve_response(self.spider, self.request)
+        storage.close_spider(self.spider)
+        self.assertEqual(response.body, self.response.body)
+
+    @defer.inlineCallbacks
+    def test_readahead(self):
+        yield self.storage.store_response(self.spider, self.request, self.response)
+        request2 = Request('http://www.example.com/2')
+        self.mw.request_scheduled(self.request, self.spider)
+        self.mw.request_scheduled(request2, self.spider)
+        self.assertEqual(len(self.storage.prefetched), 2)
+        response = yield self.mw.process_request(self.request, self.spider)
+        self.assertEqual(response.body, self.response.body)
+        response = yield self.mw.process_request(request2, self.spider)
+        assert response is None
+        self.assertEqual(self.storage.prefetched, {})
+
+    def _read_ahead(self, count):
+        self.storage.readahead = 3
+        requests = [Request('http://www.example.com/%d' % n) \
+            for n in range(count)]
+        for request in requests:
+            self.mw.request_scheduled(request, self.spider)
+        return requests
+
+    def test_readahead_limit(self):
+        # the oldest responses are dropped, whatever the scheduler order
+        requests = self._read_ahead(10)
+        self.assertEqual(len(self.storage.prefetched), 3)
+        self.assertEqual(sorted(k for _, k in self.storage.prefetched), \
+            sorted(request_fingerprint(r) for r in requests[-3:]))
+        self.assertEqual(stats.get_value('httpcache/readahead_dropped', \
+            spider=self.spider), 7)
+        return defer.DeferredList(list(self.storage.pending[self.spider]))
+
+    @defer.inlineCallbacks
+    def test_readahead_never_retrieved(self):
+        # responses nobody retrieves (of requests ignored before reaching the
+        # cache) don't stop the read-ahead of the next requests
+        self._read_ahead(3)
+        yield defer.DeferredList(list(self.storage.pending[self.spider]))
+        yield self.storage.store_response(self.spider, self.request, \
+            self.response)
+        self.mw.request_scheduled(self.request, self.spider)
+        assert (self.spider, request_fingerprint(self.request)) in \
+            self.storage.prefetched
+        response = yield self.mw.process_request(self.request, self.spider)
+        self.assertEqual(response.body, self.response.body)
+
+    @defer.inlineCallbacks
+    def test_readahead_discarded_on_exception(self):
+        requests = self._read_ahead(3)
+        self.mw.process_exception(requests[0], IgnoreRequest(), self.spider)
+        self.assertEqual(sorted(k for _, k in self.storage.prefetched), \
+            sorted(request_fingerprint(r) for r in requests[1:]))
+        yield defer.DeferredList(list(self.storage.pending[self.spider]))
+
+    @defer.inlineCallbacks
+    def test_readahead_duplicates_bfo(self):
+        # filtered duplicates aren't read ahead, so they don't fill the
+        # read-ahead of BFO order with entries which are never consumed
+        self.storage.readahead = 3
+        settings.overrides['SCHEDULER_ORDER'] = 'BFO'
+        try:
+            scheduler = Scheduler()
+        finally:
+            del settings.overrides['SCHEDULER_ORDER']
+        yield scheduler.open_spider(self.spider)
+        scheduler.enqueue_request(self.spider, self.request)
+        request, _ = scheduler.next_request(self.spider)
+        response = yield self.mw.process_request(request, self.spider)
+        assert response is None
+        for _ in range(5):
+            yield self.assertFailure(scheduler.enqueue_request(self.spider, \
+                Request(self.request.url)), IgnoreRequest)
+        self.assertEqual(self.storage.prefetched, {})
+        requests = [Request('http://www.example.com/%d' % n) for n in range(3)]
+        for request in requests:
+            scheduler.enqueue_request(self.spider, request)
+        self.assertEqual(sorted(k for _, k in self.storage.prefetched), \
+            sorted(request_fingerprint(r) for r in requests))
+        yield scheduler.close_spider(self.spider)
+        yield defer.DeferredList(list(self.storage.pending[self.spider]))
+
+
 if __name__ == '__main__':
     unittest.main()
 
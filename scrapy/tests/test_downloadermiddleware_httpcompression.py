@@ -1,12 +1,16 @@
 from __future__ import with_statement
 
-from unittest import TestCase
+from twisted.trial.unittest import TestCase
+from twisted.internet import defer
 from os.path import join, abspath, dirname
 from cStringIO import StringIO
 from gzip import GzipFile
 
 from scrapy.spider import BaseSpider
 from scrapy.http import Response, Request, HtmlResponse
+from scrapy.exceptions import IgnoreRequest
+from scrapy.settings import Settings
+from scrapy.stats import stats
 from scrapy.contrib.downloadermiddleware.httpcompression import HttpCompressionMiddleware
 from scrapy.tests import tests_datadir
 from scrapy.utils.encoding import resolve_encoding
@@ -25,6 +29,7 @@ class HttpCompressionTest(TestCase):
     def setUp(self):
         self.spider = BaseSpider('foo')
         self.mw = HttpCompressionMiddleware()
+        stats.open_spider(self.spider)
 
     def _getresponse(self, coding):
         if coding not in FORMAT:
@@ -83,6 +88,90 @@ class HttpCompressionTest(TestCase):
         assert newresponse.body.startswith('<!DOCTYPE')
         assert 'Content-Encoding' not in newresponse.headers
 
+    def _gzipresponse(self, body, **kwargs):
+        f = StringIO()
+        zf = GzipFile(fileobj=f, mode='wb')
+        zf.write(body)
+        zf.close()
+        headers = {'Content-Type': 'text/html', 'Content-Encoding': 'gzip'}
+        response = Response('http://www.example.com/', headers=headers, \
+            body=f.getvalue())
+        response.request = Request('http://www.example.com/', **kwargs)
+        return response
+
+    def test_process_response_spooled(self):
+        mw = HttpCompressionMiddleware(Settings({'DOWNLOAD_SPOOL_THRESHOLD': 1000}))
+        for coding in FORMAT:
+            response = self._getresponse(coding)
+            newresponse = mw.process_response(response.request, response, \
+                self.spider)
+            assert newresponse.spooled, coding
+            assert newresponse.body.startswith('<!DOCTYPE')
+        response = self._getresponse('gzip')
+        response.request.meta['download_spool'] = False
+        newresponse = mw.process_response(response.request, response, \
+            self.spider)
+        assert not newresponse.spooled
+
+    def test_process_response_maxsize(self):
+        mw = HttpCompressionMiddleware(Settings({'HTTPCOMPRESSION_MAXSIZE': 100000}))
+        response = self._gzipresponse('\x00' * 10000000)
+        self.assertRaises(IgnoreRequest, mw.process_response, \
+            response.request, response, self.spider)
+        self.assertEqual(stats.get_value('httpcompression/response_aborted_count', \
+            spider=self.spider), 1)
+
+    @defer.inlineCallbacks
+    def test_process_response_cooperative(self):
+        body = '<html>%s</html>' % ('\x00' * 3000000)
+        response = self._gzipresponse(body)
+        d = self.mw.process_response(response.request, response, self.spider)
+        assert isinstance(d, defer.Deferred)
+        newresponse = yield d
+        self.assertEqual(newresponse.body, body)
+        assert 'Content-Encoding' not in newresponse.headers
+
+        mw = HttpCompressionMiddleware(Settings({'HTTPCOMPRESSION_MAXSIZE': 2000000}))
+        response = self._gzipresponse(body)
+        d = mw.process_response(response.request, response, self.spider)
+        yield self.assertFailure(d, IgnoreRequest)
+
+    def test_compression_ratio(self):
+        response = self._gzipresponse('x' * 100000)
+        newresponse = self.mw.process_response(response.request, response, \
+            self.spider)
+        self.assertEqual(stats.get_value('httpcompression/response_count', \
+            spider=self.spider), 1)
+        self.assertEqual(stats.get_value('httpcompression/decompressed_bytes', \
+            spider=self.spider), 100000)
+        self.assertEqual(stats.get_value('httpcompression/compressed_bytes', \
+            spider=self.spider), len(response.body))
+        self.mw.spider_closed(self.spider)
+        self.assertEqual(stats.get_value('httpcompression/compression_ratio', \
+            spider=self.spider), round(100000. / len(response.body), 2))
+
+    def test_process_response_truncated(self):
+        response = self._getresponse('gzip')
+        response = response.replace(body=response.body[:-20])
+        self.assertRaises(IOError, self.mw.process_response, \
+            response.request, response, self.spider)
+
+    def test_process_response_gzip_multiple_members(self):
+        f = StringIO()
+        for part in ['<html><body>', 'first member', '</body></html>']:
+            zf = GzipFile(fileobj=f, mode='wb')
+            zf.write(part)
+            zf.close()
+        headers = {'Content-Type': 'text/html', 'Content-Encoding': 'gzip'}
+        response = Response('http://www.example.com/', headers=headers, \
+            body=f.getvalue())
+        response.request = Request('http://www.example.com/')
+        newresponse = self.mw.process_response(response.request, response, \
+            self.spider)
+        self.assertEqual(newresponse.body, \
+            '<html><body>first member</body></html>')
+        self.assertEqual(''.join(newresponse.iter_body(5)), newresponse.body)
+
     def test_process_response_plain(self):
         response = Response('http://scrapytest.org', body='<!DOCTYPE...')
         request = Request('http://scrapytest.org')
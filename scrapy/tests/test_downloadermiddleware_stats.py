@@ -1,9 +1,11 @@
 from unittest import TestCase
+from tempfile import TemporaryFile
 
 from scrapy.contrib.downloadermiddleware.stats import DownloaderStats
 from scrapy.http import Request, Response
 from scrapy.spider import BaseSpider
 from scrapy.stats import stats
+from scrapy.utils.response import response_httprepr
 
 
 class TestDownloaderStats(TestCase):
@@ -27,6 +29,15 @@ class TestDownloaderStats(TestCase):
         self.assertEqual(stats.get_value('downloader/response_count', \
             spider=self.spider), 1)
 
+    def test_process_response_spooled(self):
+        body = TemporaryFile()
+        body.write('spooled body')
+        res = Response('scrapytest.org', body=body)
+        self.mw.process_response(self.req, res, self.spider)
+        self.assertEqual(stats.get_value('downloader/response_bytes', \
+            spider=self.spider), len(response_httprepr(res.replace(body='spooled body'))))
+        assert res._body is None, "spooled body was loaded in memory"
+
     def test_process_exception(self):
         self.mw.process_exception(self.req, Exception(), self.spider)
         self.assertEqual(stats.get_value('downloader/exception_count', \
@@ -25,6 +25,7 @@ from scrapy.item import Item, Field
 from scrapy.contrib.linkextractors.sgml import SgmlLinkExtractor
 from scrapy.http import Request
 from scrapy.utils.signal import disconnect_all
+from scrapy.conf import settings
 
 class TestItem(Item):
     name = Field()
@@ -57,13 +58,23 @@ class TestSpider(BaseSpider):
             item['price'] = m.group(1)
         return item
 
-def start_test_site(debug=False):
+class SlowScrapeSpider(TestSpider):
+    """Spider whose item pages take a while to be scraped"""
+
+    scrape_delay = 0.5
+
+    def parse_item(self, response):
+        d = defer.Deferred()
+        reactor.callLater(self.scrape_delay, d.callback, response)
+        return d.addCallback(super(SlowScrapeSpider, self).parse_item)
+
+def start_test_site(debug=False, port=0):
     root_dir = os.path.join(tests_datadir, "test_site")
     r = static.File(root_dir)
     r.putChild("redirect", util.Redirect("/redirected"))
     r.putChild("redirected", static.Data("Redirected here", "text/plain"))
 
-    port = reactor.listenTCP(0, server.Site(r), interface="127.0.0.1")
+    port = reactor.listenTCP(port, server.Site(r), interface="127.0.0.1")
     if debug:
         print "Test server running at http://localhost:%d/ - hit Ctrl-C to finish." \
             % port.getHost().port
@@ -73,7 +84,12 @@ def start_test_site(debug=False):
 class CrawlerRun(object):
     """A class to run the crawler and keep track of events occurred"""
 
+    start_paths = ["/", "/redirect"]
+    portno = 0
+    spider_class = TestSpider
+
     def __init__(self):
+        self.settings = {}
         self.spider = None
         self.respplug = []
         self.reqplug = []
@@ -81,11 +97,11 @@ class CrawlerRun(object):
         self.signals_catched = {}
 
     def run(self):
-        self.port = start_test_site()
+        self.port = start_test_site(port=self.portno)
         self.portno = self.port.getHost().port
 
-        start_urls = [self.geturl("/"), self.geturl("/redirect")]
-        self.spider = TestSpider(start_urls=start_urls)
+        start_urls = [self.geturl(path) for path in self.start_paths]
+        self.spider = self.spider_class(start_urls=start_urls)
 
         for name, signal in vars(signals).items():
             if not name.startswith('_'):
@@ -94,7 +110,7 @@ class CrawlerRun(object):
         dispatcher.connect(self.request_received, signals.request_received)
         dispatcher.connect(self.response_downloaded, signals.response_downloaded)
 
-        self.crawler = get_crawler()
+        self.crawler = get_crawler(self.settings)
         self.crawler.install()
         self.crawler.configure()
         self.crawler.queue.append_spider(self.spider)
@@ -105,12 +121,12 @@ class CrawlerRun(object):
         return self.deferred
 
     def stop(self):
-        self.port.stopListening()
+        stopped = defer.maybeDeferred(self.port.stopListening)
         for name, signal in vars(signals).items():
             if not name.startswith('_'):
                 disconnect_all(signal)
         self.crawler.uninstall()
-        self.deferred.callback(None)
+        stopped.chainDeferred(self.deferred)
 
     def geturl(self, path):
         return "http://localhost:%s%s" % (self.portno, path)
@@ -136,6 +152,61 @@ class CrawlerRun(object):
         self.signals_catched[sig] = signalargs
 
 
+class TwoSpidersCrawlerRun(CrawlerRun):
+    """Run two spiders, recording when they're opened and closed"""
+
+    def run(self):
+        self.events = []
+        dispatcher.connect(self.spider_opened, signals.spider_opened)
+        dispatcher.connect(self.spider_closed, signals.spider_closed)
+        d = super(TwoSpidersCrawlerRun, self).run()
+        self.spider2 = TestSpider(start_urls=[self.geturl("/")])
+        self.crawler.queue.append_spider(self.spider2)
+        return d
+
+    def spider_opened(self, spider):
+        self.events.append(('opened', spider))
+
+    def spider_closed(self, spider):
+        self.events.append(('closed', spider))
+
+
+class SlowScrapeCrawlerRun(CrawlerRun):
+    """Run a spider with slow callbacks, recording when its responses are
+    downloaded and scraped"""
+
+    spider_class = SlowScrapeSpider
+
+    def run(self):
+        self.events = []
+        return super(SlowScrapeCrawlerRun, self).run()
+
+    def item_scraped(self, item, spider, response):
+        super(SlowScrapeCrawlerRun, self).item_scraped(item, spider, response)
+        self.events.append(('scraped', self.getpath(response.url)))
+
+    def response_downloaded(self, response, spider):
+        super(SlowScrapeCrawlerRun, self).response_downloaded(response, spider)
+        self.events.append(('downloaded', self.getpath(response.url)))
+
+
+class JobDirCrawlerRun(CrawlerRun):
+    """Run the crawler with a job directory, optionally stopping it as soon as
+    the first item page is downloaded"""
+
+    def __init__(self, jobdir, start_paths, stop=False):
+        super(JobDirCrawlerRun, self).__init__()
+        self.settings = {'JOBDIR': jobdir}
+        self.start_paths = start_paths
+        self.stop_on_item = stop
+
+    def response_downloaded(self, response, spider):
+        super(JobDirCrawlerRun, self).response_downloaded(response, spider)
+        if self.stop_on_item and 'item' in response.url:
+            self.stop_on_item = False
+            self.crawler.stop()
+
+
 class EngineTest(unittest.TestCase):
 
     @defer.inlineCallbacks
@@ -148,6 +219,63 @@ class EngineTest(unittest.TestCase):
         self._assert_scraped_items()
         self._assert_signals_catched()
 
+    @defer.inlineCallbacks
+    def test_crawler_disk_queue(self):
+        settings.overrides['SCHEDULER_DISK_QUEUE'] = True
+        try:
+            yield self.test_crawler()
+        finally:
+            del settings.overrides['SCHEDULER_DISK_QUEUE']
+
+    @defer.inlineCallbacks
+    def test_download_while_scraping(self):
+        # without a disk queue, finished downloads fill their slot while
+        # their response is being scraped
+        settings.overrides['CONCURRENT_REQUESTS_PER_SPIDER'] = 1
+        try:
+            self.run = SlowScrapeCrawlerRun()
+            yield self.run.run()
+        finally:
+            del settings.overrides['CONCURRENT_REQUESTS_PER_SPIDER']
+        self._assert_scraped_items()
+        first_scraped = [e for e, _ in self.run.events].index('scraped')
+        downloaded = [p for e, p in self.run.events[:first_scraped] \
+            if e == 'downloaded']
+        self.assertEqual(sorted(p for p in downloaded if 'item' in p), \
+            ["/item1.html", "/item2.html", "/item999.html"])
+
+    @defer.inlineCallbacks
+    def test_start_queued_spiders(self):
+        # spiders waiting in the queue are started as soon as there's
+        # capacity, without waiting for other spiders to finish or for the
+        # queue to be polled again
+        self.run = TwoSpidersCrawlerRun()
+        yield self.run.run()
+        self.assertEqual(self.run.events[:2], [('opened', self.run.spider), \
+            ('opened', self.run.spider2)])
+        self.assertEqual(len(self.run.events), 4)
+
+    @defer.inlineCallbacks
+    def test_stop_and_resume(self):
+        # the requests being downloaded when the crawl is stopped are resumed
+        jobdir = settings.overrides['JOBDIR'] = self.mktemp()
+        try:
+            run1 = JobDirCrawlerRun(jobdir, ["/"], stop=True)
+            yield run1.run()
+            run2 = JobDirCrawlerRun(jobdir, [])
+            run2.portno = run1.portno # the resumed requests use its urls
+            yield run2.run()
+        finally:
+            del settings.overrides['JOBDIR']
+        paths1 = [run1.getpath(r.url) for r, _ in run1.respplug]
+        paths2 = [run2.getpath(r.url) for r, _ in run2.respplug]
+        self.assertEqual(paths1[0], "/")
+        self.assertEqual(sorted(set(paths1[1:] + paths2)), \
+            ["/item1.html", "/item2.html", "/item999.html"])
+        # items scraped while stopping may be scraped again on resume
+        items = set(run1.getpath(i['url']) for i, _ in run1.itemresp + run2.itemresp)
+        self.assertEqual(sorted(items), ["/item1.html", "/item2.html"])
+
     def _assert_visited_urls(self):
         must_be_visited = ["/", "/redirect", "/redirected", 
                            "/item1.html", "/item2.html", "/item999.html"]
@@ -73,6 +73,14 @@ class HeadersTest(unittest.TestCase):
         self.assertEqual(h.getlist('Content-Type'), ['text/html'])
         self.assertEqual(h.getlist('X-Forwarded-For'), ['ip1', 'ip2'])
 
+    def test_update_from_headers(self):
+        h1 = Headers({'X-Forwarded-For': ['ip1', 'ip2']})
+        h2 = Headers({'Content-Type': 'text/html'})
+        h2.update(h1)
+        self.assertEqual(h2.getlist('X-Forwarded-For'), ['ip1', 'ip2'])
+        self.assertEqual(h2.getlist('Content-Type'), ['text/html'])
+        assert h1.getlist('X-Forwarded-For') is not h2.getlist('X-Forwarded-For')
+
     def test_copy(self):
         h1 = Headers({'header1': ['value1', 'value2']})
         h2 = copy.copy(h1)
@@ -1,5 +1,6 @@
 import unittest
 import weakref
+from tempfile import TemporaryFile
 
 from scrapy.http import Request, Response, TextResponse, HtmlResponse, XmlResponse, Headers
 from scrapy.utils.encoding import resolve_encoding
@@ -92,6 +93,41 @@ class BaseResponseTest(unittest.TestCase):
         self.assertEqual(r4.body, '')
         self.assertEqual(r4.flags, [])
 
+    def test_spooled_body(self):
+        f = TemporaryFile()
+        f.write('spooled body')
+        r1 = self.response_class("http://www.example.com", body=f)
+        assert r1.spooled
+        self.assertEqual(r1.open_body().read(), 'spooled body')
+        self.assertEqual(list(r1.iter_body(5)), ['spool', 'ed bo', 'dy'])
+
+        # replace() keeps the body file, unless it was already loaded
+        r2 = r1.replace(status=301)
+        assert r2.spooled
+        self.assertEqual(r2.body, 'spooled body')
+        self.assertEqual(r2.replace().body, 'spooled body')
+        assert not r2.replace().spooled
+        assert not r1.replace(body='new').spooled
+
+        r3 = self.response_class("http://www.example.com", body='in memory')
+        assert not r3.spooled
+        self.assertEqual(r3.open_body().read(), 'in memory')
+        self.assertEqual(list(r3.iter_body(5)), ['in me', 'mory'])
+
+    def test_spooled_body_readers(self):
+        f = TemporaryFile()
+        f.write('spooled body')
+        r1 = self.response_class("http://www.example.com", body=f)
+        r2 = r1.replace(status=301)
+        # readers share the file but not their position
+        f1, f2 = r1.open_body(), r2.open_body()
+        self.assertEqual(f1.read(7), 'spooled')
+        self.assertEqual(f2.read(5), 'spool')
+        f2.seek(0, 2)
+        self.assertEqual(f2.tell(), 12)
+        self.assertEqual(f1.read(), ' body')
+        self.assertEqual(list(r2.iter_body(7)), ['spooled', ' body'])
+
     def test_weakref_slots(self):
         """Check that classes are using slots and are weak-referenceable"""
         x = self.response_class('http://www.example.com')
@@ -210,6 +246,40 @@ class TextResponseTest(BaseResponseTest):
         self.assertEqual(r6.encoding, 'utf-8')
         self.assertEqual(r6.body_as_unicode(), u'\ufeffWORD\ufffd\ufffd')
 
+    def test_inferred_encoding(self):
+        for body, encoding, ubody in [
+                ('\xef\xbb\xbfhi', 'utf-8', u'\ufeffhi'),
+                ('\xff\xfeh\x00i\x00', 'utf-16', u'hi'),
+                ('\xfe\xff\x00h\x00i', 'utf-16', u'hi'),
+                ('<\x00?\x00x\x00m\x00l\x00?\x00>\x00', 'utf-16-le', u'<?xml?>'),
+                ('<?xml version="1.0" encoding="cp1251"?><x>\xe9</x>', 'cp1251', \
+                    u'<?xml version="1.0" encoding="cp1251"?><x>\u0439</x>'),
+                ('<meta charset="koi8-r"><p>\xc1', 'koi8-r', u'<meta charset="koi8-r"><p>\u0430'),
+                ('<p>\xc2\xa3</p>', 'utf-8', u'<p>\xa3</p>'),
+                ('<p>\xa3</p>', 'cp1252', u'<p>\xa3</p>')]:
+            r = self.response_class("http://www.example.com", body=body)
+            self.assertEqual(r.encoding, resolve_encoding(encoding))
+            # the body is only decoded when needed
+            self.assertEqual(r._cached_ubody, None)
+            self.assertEqual(r.body_as_unicode(), ubody)
+        # a declaration in ascii text can't be right about utf-16
+        r = self.response_class("http://www.example.com")
+        self.assertEqual(r._sniff_encoding('<?xml version="1.0" encoding="utf-16"?><x/>'), \
+            self.response_class._DEFAULT_ENCODING)
+
+    def test_inferred_encoding_bounded(self):
+        size = self.response_class._SNIFF_SIZE
+        # only the first bytes are looked at, but the ascii default is
+        # avoided when there are more to come
+        r = self.response_class("http://www.example.com", body=' ' * size + '\xc2\xa3')
+        self.assertEqual(r.encoding, 'utf-8')
+        self.assertEqual(r.body_as_unicode()[-1], u'\xa3')
+        r = self.response_class("http://www.example.com", body=' ' * size + '<meta charset="cp1251">')
+        self.assertEqual(r.encoding, 'utf-8')
+        # a multibyte character cut at the end of the sniffed bytes
+        r = self.response_class("http://www.example.com", body=' ' * (size - 1) + '\xc2\xa3')
+        self.assertEqual(r.encoding, 'utf-8')
+
     def test_replace_wrong_encoding(self):
         """Test invalid chars are replaced properly"""
         r = self.response_class("http://www.example.com", encoding='utf-8', body='PREFIX\xe3\xabSUFFIX')
@@ -224,7 +294,7 @@ class TextResponseTest(BaseResponseTest):
                 body='\xf0<span>value</span>')
         assert u'<span>value</span>' in r.body_as_unicode(), repr(r.body_as_unicode())
 
-        # FIXME: This test should pass once we stop using BeautifulSoup's UnicodeDammit in TextResponse
+        # FIXME: This test should pass once invalid utf-8 bodies aren't inferred as cp1252
         #r = self.response_class("http://www.example.com", body='PREFIX\xe3\xabSUFFIX')
         #assert u'\ufffd' in r.body_as_unicode(), repr(r.body_as_unicode())
 
@@ -0,0 +1,262 @@
+import os
+import time
+
+from twisted.trial import unittest
+from twisted.internet import defer, reactor, protocol
+from twisted.internet.error import ProcessTerminated
+
+from scrapy.http import Request, HtmlResponse
+from scrapy.item import Item, Field
+from scrapy.spider import BaseSpider
+from scrapy.utils.decorator import run_in_process
+from scrapy.core.processpool import ProcessPool, runs_in_process, \
+    uses_processes, multiprocessing
+from scrapy.core.scraper import Scraper, SpiderInfo
+from scrapy.conf import settings
+
+
+class TestItem(Item):
+    pid = Field()
+    title = Field()
+    fds = Field()
+
+
+class TestSpider(BaseSpider):
+
+    name = 'processpool'
+
+    def parse(self, response):
+        title = response.body.split('<title>')[1].split('</title>')[0]
+        yield TestItem(pid=os.getpid(), title=title)
+        yield Request('http://www.example.com/2', callback=self.parse_next, \
+            meta={'page': 2})
+
+    @run_in_process
+    def parse_next(self, response):
+        raise KeyError('parse_next')
+
+    def parse_partial(self, response):
+        yield TestItem(title='partial')
+        raise KeyError('parse_partial')
+
+    def parse_lambda(self, response):
+        return Request('http://www.example.com/3', callback=lambda r: None)
+
+    def parse_exit(self, response):
+        os._exit(1)
+
+    def parse_slow(self, response):
+        time.sleep(10)
+
+    def parse_fds(self, response):
+        return TestItem(fds=_open_files())
+
+
+def _open_files():
+    files = {}
+    for fd in os.listdir('/proc/self/fd'):
+        try:
+            files[int(fd)] = os.readlink('/proc/self/fd/%s' % fd)
+        except OSError:
+            pass
+    return files
+
+
+class PlainSpider(BaseSpider):
+
+    name = 'plain'
+
+    def parse(self, response):
+        return TestItem(pid=os.getpid())
+
+
+class RunsInProcessTest(unittest.TestCase):
+
+    def test_precedence(self):
+        spider = TestSpider()
+        request = Request('http://www.example.com')
+        self.failIf(runs_in_process(spider.parse, request, spider))
+        self.failUnless(runs_in_process(spider.parse_next, request, spider))
+        spider.run_in_process = True
+        self.failUnless(runs_in_process(spider.parse, request, spider))
+        request.meta['run_in_process'] = False
+        self.failIf(runs_in_process(spider.parse, request, spider))
+        self.failIf(runs_in_process(spider.parse_next, request, spider))
+
+    def test_uses_processes(self):
+        self.failUnless(uses_processes(TestSpider()))
+        spider = PlainSpider()
+        self.failIf(uses_processes(spider))
+        spider.run_in_process = True
+        self.failUnless(uses_processes(spider))
+
+
+class ProcessPoolTest(unittest.TestCase):
+
+    body = '<html><head><title>Some page</title></head></html>'
+
+    def setUp(self):
+        if multiprocessing is None:
+            raise unittest.SkipTest("multiprocessing module not available")
+        self.spider = TestSpider()
+        self.pool = ProcessPool(self.spider, 2)
+
+    def tearDown(self):
+        self.pool.close()
+
+    def _call(self, callback=None):
+        request = Request('http://www.example.com', callback=callback)
+        response = HtmlResponse(request.url, body=self.body, request=request)
+        return self.pool.call(response, request)
+
+    @defer.inlineCallbacks
+    def test_call(self):
+        item, request = yield self._call()
+        self.assertEqual(item['title'], 'Some page')
+        self.assertNotEqual(item['pid'], os.getpid())
+        self.assertEqual(request.url, 'http://www.example.com/2')
+        self.assertEqual(request.callback, self.spider.parse_next)
+        self.assertEqual(request.meta, {'page': 2})
+        self.assertEqual(self.pool.pending, 0)
+
+    @defer.inlineCallbacks
+    def test_error(self):
+        try:
+            yield self._call(self.spider.parse_next)
+        except KeyError, e:
+            self.failUnless('parse_next' in e.remote_traceback)
+        else:
+            self.fail("KeyError not raised")
+
+    @defer.inlineCallbacks
+    def test_error_after_output(self):
+        output = yield self._call(self.spider.parse_partial)
+        self.assertEqual(output.next()['title'], 'partial')
+        self.assertRaises(KeyError, output.next)
+
+    @defer.inlineCallbacks
+    def test_output_not_sendable(self):
+        try:
+            yield self._call(self.spider.parse_lambda)
+        except ValueError, e:
+            self.failUnless('is not a method of' in e.remote_traceback)
+        else:
+            self.fail("ValueError not raised")
+
+    def test_request_not_sendable(self):
+        self.assertRaises(ValueError, self._call, lambda r: None)
+
+    def test_needs_backout(self):
+        dfds = [self._call() for _ in range(3)]
+        self.failIf(self.pool.needs_backout())
+        dfds.append(self._call())
+        self.failUnless(self.pool.needs_backout())
+        return defer.DeferredList(dfds)
+
+    @defer.inlineCallbacks
+    def test_worker_died(self):
+        dfds = [self._call(self.spider.parse_exit), self._call(), self._call()]
+        try:
+            yield dfds[0]
+        except ProcessTerminated, e:
+            self.assertEqual(e.exitCode, 1)
+        else:
+            self.fail("ProcessTerminated not raised")
+        # the other tasks are run by the remaining and the new worker
+        for dfd in dfds[1:]:
+            item, _ = yield dfd
+            self.assertEqual(item['title'], 'Some page')
+        self.assertEqual(self.pool.pending, 0)
+        self.assertEqual(len(self.pool._workers), 2)
+
+    @defer.inlineCallbacks
+    def test_timeout(self):
+        self.pool.close()
+        self.pool = ProcessPool(self.spider, 1, timeout=0.5)
+        dfd = self._call(self.spider.parse_slow)
+        try:
+            yield dfd
+        except defer.TimeoutError:
+            pass
+        else:
+            self.fail("TimeoutError not raised")
+        self.assertEqual(self.pool.pending, 0)
+        item, _ = yield self._call()
+        self.assertEqual(item['title'], 'Some page')
+
+    @defer.inlineCallbacks
+    def test_inherited_fds_closed(self):
+        if not os.path.isdir('/proc/self/fd'):
+            raise unittest.SkipTest("/proc/self/fd not available")
+        # the replacement workers are forked while the reactor has sockets
+        # open, which they must not keep
+        port = reactor.listenTCP(0, protocol.ServerFactory(), \
+            interface='127.0.0.1')
+        try:
+            yield self._call(self.spider.parse_exit).addErrback(lambda _: None)
+            for _ in range(2):
+                item, = yield self._call(self.spider.parse_fds)
+                self.failIf(_open_files()[port.fileno()] in \
+                    item['fds'].values())
+        finally:
+            yield port.stopListening()
+
+    def test_close(self):
+        dfds = [self._call(self.spider.parse_slow) for _ in range(3)]
+        self.pool.close()
+        self.assertEqual(self.pool.pending, 0)
+        for dfd in dfds:
+            self.assertFailure(dfd, ProcessTerminated)
+        return defer.DeferredList(dfds)
+
+
+class ScraperTest(unittest.TestCase):
+
+    def setUp(self):
+        if multiprocessing is None:
+            raise unittest.SkipTest("multiprocessing module not available")
+        self.spider = TestSpider()
+        self.scraper = Scraper(None, settings)
+        self.scraper.processes = 1
+        dfd = self.scraper.open_spider(self.spider)
+        self.site = self.scraper.sites[self.spider]
+        return dfd
+
+    def tearDown(self):
+        if self.site.pool:
+            self.site.pool.close()
+
+    def _call_spider(self, spider=None, **meta):
+        request = Request('http://www.example.com', meta=meta)
+        response = HtmlResponse(request.url, request=request, \
+            body=ProcessPoolTest.body)
+        return self.scraper.call_spider(response, request, \
+            spider or self.spider)
+
+    @defer.inlineCallbacks
+    def test_call_spider(self):
+        # the workers are started when the spider is opened
+        self.failUnless(self.site.pool)
+        item, _ = yield self._call_spider()
+        self.assertEqual(item['pid'], os.getpid())
+        item, _ = yield self._call_spider(run_in_process=True)
+        self.assertNotEqual(item['pid'], os.getpid())
+
+    @defer.inlineCallbacks
+    def test_spider_without_processes(self):
+        spider = PlainSpider()
+        yield self.scraper.open_spider(spider)
+        site = self.scraper.sites[spider]
+        self.assertEqual(site.pool, None)
+        item, = yield self._call_spider(spider, run_in_process=True)
+        self.assertEqual(item['pid'], os.getpid())
+        self.assertEqual(site.pool, False)
+
+    def test_needs_backout(self):
+        dfds = [self._call_spider(run_in_process=True)]
+        self.failIf(self.site.needs_backout())
+        dfds.append(self._call_spider(run_in_process=True))
+        self.failUnless(self.site.needs_backout())
+        return defer.DeferredList(dfds).addCallback(lambda _: \
+            self.failIf(self.site.needs_backout()))
+
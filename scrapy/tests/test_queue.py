@@ -111,6 +111,19 @@ class ExecutionQueueTest(unittest.TestCase):
         self.assert_(spider.name == 'test123')
         self.assert_(spider.test == 'hello')
 
+    def test_wait(self):
+        fired = []
+        self.queue.wait().addCallback(fired.append)
+        self.assertEqual(fired, [])
+        self.queue.append_spider(self.spider)
+        self.assertEqual(fired, [None])
+        # waiters are only fired once
+        self.queue.append_request(self.request, self.spider)
+        self.assertEqual(fired, [None])
+        self.queue.wait().addCallback(fired.append)
+        self.queue.append_url('http://www.example.com', spider=self.spider)
+        self.assertEqual(fired, [None, None])
+
     def _assert_request_urls(self, requests, urls):
         assert all(isinstance(x, Request) for x in requests)
         self.assertEqual([x.url for x in requests], urls)
@@ -0,0 +1,190 @@
+import os
+
+from twisted.trial import unittest
+
+from scrapy.conf import settings
+from scrapy.core.scheduler import Scheduler
+from scrapy.http import Request
+from scrapy.exceptions import IgnoreRequest
+from scrapy.spider import BaseSpider
+
+
+class TestSpider(BaseSpider):
+
+    name = 'test'
+
+    def parse(self, response):
+        pass
+
+
+class SchedulerTest(unittest.TestCase):
+
+    order = 'BFO'
+    disk_queue = False
+
+    def setUp(self):
+        settings.overrides['SCHEDULER_ORDER'] = self.order
+        settings.overrides['SCHEDULER_DISK_QUEUE'] = self.disk_queue
+        settings.overrides['SCHEDULER_MEMORY_QUEUE_SIZE'] = 2
+        settings.overrides['SCHEDULER_MIDDLEWARES_BASE'] = {}
+        self.spider = TestSpider()
+        self.scheduler = Scheduler()
+        self.scheduler.open_spider(self.spider)
+
+    def tearDown(self):
+        if self.scheduler.spider_is_open(self.spider):
+            self.scheduler.close_spider(self.spider)
+        for name in ['SCHEDULER_ORDER', 'SCHEDULER_DISK_QUEUE', \
+                'SCHEDULER_MEMORY_QUEUE_SIZE', 'SCHEDULER_MIDDLEWARES_BASE']:
+            del settings.overrides[name]
+
+    def _enqueue(self, paths, priority=0, callback=None):
+        dfds = []
+        for path in paths:
+            r = Request('http://www.example.com/%s' % path, priority=priority,
+                callback=callback or self.spider.parse)
+            dfds.append(self.scheduler.enqueue_request(self.spider, r))
+        return dfds
+
+    def _dequeue_all(self):
+        paths = []
+        while self.scheduler.spider_has_pending_requests(self.spider):
+            r, _ = self.scheduler.next_request(self.spider)
+            paths.append(r.url.split('/')[-1])
+        return paths
+
+    def test_order(self):
+        self._enqueue('abcd')
+        self._enqueue('ef', priority=1)
+        expected = list('efabcd') if self.order == 'BFO' else list('fedcba')
+        self.assertEqual(self._dequeue_all(), expected)
+        self.assertEqual(self.scheduler.next_request(self.spider), \
+            (None, None))
+
+    def test_callbacks_kept(self):
+        self._enqueue('abcd')
+        while self.scheduler.spider_has_pending_requests(self.spider):
+            r, _ = self.scheduler.next_request(self.spider)
+            self.assertEqual(r.callback, self.spider.parse)
+
+    def test_unserializable_requests(self):
+        self._enqueue('abcd', callback=lambda x: x)
+        self.assertEqual(sorted(self._dequeue_all()), list('abcd'))
+
+    def test_clear_pending_requests(self):
+        dfds = self._enqueue('abcd')
+        self.scheduler.clear_pending_requests(self.spider)
+        if not self.disk_queue: # their errbacks are called
+            for dfd in dfds:
+                self.assertFailure(dfd, IgnoreRequest)
+        self.failIf(self.scheduler.spider_has_pending_requests(self.spider))
+        self.assertEqual(self.scheduler.next_request(self.spider), \
+            (None, None))
+
+    def test_deferreds(self):
+        r = Request('http://www.example.com/a')
+        dfd = self.scheduler.enqueue_request(self.spider, r)
+        request, deferred = self.scheduler.next_request(self.spider)
+        self.assertEqual(request, r)
+        if self.disk_queue:
+            self.assertEqual(deferred, None)
+        else:
+            self.failUnless(deferred is dfd)
+
+
+class DfoSchedulerTest(SchedulerTest):
+
+    order = 'DFO'
+
+
+class DiskQueueSchedulerTest(SchedulerTest):
+
+    disk_queue = True
+
+    def test_queue_removed_on_close(self):
+        self._enqueue('abcdef')
+        path = self.scheduler.pending_requests[self.spider].path
+        assert os.path.exists(path)
+        self.scheduler.close_spider(self.spider)
+        self.failIf(os.path.exists(path))
+
+
+class DfoDiskQueueSchedulerTest(DiskQueueSchedulerTest):
+
+    order = 'DFO'
+    disk_queue = True
+
+
+class JobDirSchedulerTest(unittest.TestCase):
+
+    order = 'BFO'
+
+    def setUp(self):
+        settings.overrides['SCHEDULER_ORDER'] = self.order
+        settings.overrides['SCHEDULER_MIDDLEWARES_BASE'] = {}
+        settings.overrides['JOBDIR'] = self.mktemp()
+        self.spider = TestSpider()
+
+    def tearDown(self):
+        for name in ['SCHEDULER_ORDER', 'SCHEDULER_MIDDLEWARES_BASE', 'JOBDIR']:
+            del settings.overrides[name]
+
+    def _open(self):
+        scheduler = Scheduler()
+        scheduler.open_spider(self.spider)
+        return scheduler
+
+    def _enqueue(self, scheduler, paths, priority=0):
+        for path in paths:
+            r = Request('http://www.example.com/%s' % path, priority=priority,
+                callback=self.spider.parse)
+            scheduler.enqueue_request(self.spider, r)
+
+    def _dequeue(self, scheduler, count):
+        return [scheduler.next_request(self.spider)[0].url.split('/')[-1] \
+            for _ in range(count)]
+
+    def test_resume(self):
+        scheduler = self._open()
+        self._enqueue(scheduler, 'abcd')
+        self._enqueue(scheduler, 'e', priority=1)
+        self.assertEqual(self._dequeue(scheduler, 2), \
+            list('ea') if self.order == 'BFO' else list('ed'))
+        scheduler.close_spider(self.spider)
+
+        scheduler = self._open()
+        self.assertEqual(self._dequeue(scheduler, 3), \
+            list('bcd') if self.order == 'BFO' else list('cba'))
+        self.assertEqual(scheduler.next_request(self.spider), (None, None))
+        scheduler.close_spider(self.spider)
+
+    def test_resume_from_checkpoint(self):
+        scheduler = self._open()
+        self._enqueue(scheduler, 'abc')
+        scheduler.checkpoint(self.spider)
+        self._enqueue(scheduler, 'd')
+        scheduler.checkpoint_tasks.pop(self.spider).stop() # killed
+
+        scheduler = self._open()
+        self.assertEqual(self._dequeue(scheduler, 3), \
+            list('abc') if self.order == 'BFO' else list('cba'))
+        self.assertEqual(scheduler.next_request(self.spider), (None, None))
+        scheduler.close_spider(self.spider)
+
+    def test_has_disk_queue(self):
+        scheduler = Scheduler()
+        # before opening the spider, ie. from the shell
+        assert scheduler.has_disk_queue(self.spider)
+        scheduler.open_spider(self.spider)
+        jobdir = settings.overrides.pop('JOBDIR')
+        try:
+            # the job directory is only looked up when opening the spider
+            assert scheduler.has_disk_queue(self.spider)
+        finally:
+            settings.overrides['JOBDIR'] = jobdir
+        scheduler.close_spider(self.spider)
+
+
+class DfoJobDirSchedulerTest(JobDirSchedulerTest):
+
+    order = 'DFO'
@@ -2,9 +2,17 @@
 Selectors tests, specific for lxml backend
 """
 
-from scrapy.http import TextResponse, XmlResponse
+import gc
+
+from scrapy.http import Request, TextResponse, XmlResponse
+from scrapy.spider import BaseSpider
+from scrapy.core.scraper import Scraper
+from scrapy.conf import settings
+from scrapy.stats import stats
+from scrapy.utils.datatypes import LruCache
 has_lxml = True
 try:
+    from scrapy.selector import lxmlsel
     from scrapy.selector.lxmlsel import XmlXPathSelector, HtmlXPathSelector, \
         XPathSelector
 except ImportError:
@@ -34,3 +42,74 @@ class LxmlXPathSelectorTestCase(test_selector.XPathSelectorTestCase):
     #    xxs = XmlXPathSelector(text='<root>la\x00la</root>')
     #    self.assertEqual(xxs.extract(),
     #                     u'<root>la</root>')
+
+    def test_compiled_xpath_cache(self):
+        xpath = lxmlsel.compile_xpath('//a/@href')
+        assert lxmlsel.compile_xpath('//a/@href') is xpath
+        ns = {'x': 'http://www.example.com/x'}
+        nsxpath = lxmlsel.compile_xpath('//x:a', ns)
+        assert nsxpath is not lxmlsel.compile_xpath('//x:a', \
+            {'x': 'http://www.example.com/y'})
+        assert nsxpath is lxmlsel.compile_xpath('//x:a', dict(ns))
+        xxs = XmlXPathSelector(text='<root xmlns:x="http://www.example.com/x">' \
+            '<x:a>1</x:a><a>2</a></root>')
+        xxs.register_namespace('x', 'http://www.example.com/x')
+        self.assertEqual(xxs.select('//x:a/text()').extract(), [u'1'])
+        self.assertRaises(ValueError, xxs.select, '//y:a')
+
+    def test_document_cache(self):
+        gc.collect()
+        cached = len(lxmlsel._document_cache)
+        response = TextResponse('http://www.example.com', body='<root><a>1</a></root>')
+        hxs = HtmlXPathSelector(response)
+        assert HtmlXPathSelector(response).root is hxs.root
+        self.assertEqual(lxmlsel.pop_parses_avoided(response), 1)
+        self.assertEqual(lxmlsel.pop_parses_avoided(response), 0)
+        xxs = XmlXPathSelector(response)
+        assert xxs.root is not hxs.root
+        self.assertEqual(xxs.select('//a/text()').extract(), [u'1'])
+        # the trees are freed along with the response
+        del response, hxs, xxs
+        gc.collect()
+        self.assertEqual(len(lxmlsel._document_cache), cached)
+
+    def test_parses_avoided_stat(self):
+        # the stat is collected by the scraper, which knows the spider
+        spider = BaseSpider('foo')
+        def parse(response):
+            HtmlXPathSelector(response).select('//a')
+            HtmlXPathSelector(response).select('//b')
+            HtmlXPathSelector(response).select('//c')
+        request = Request('http://www.example.com', callback=parse)
+        response = TextResponse(request.url, body='<a>1</a>', request=request)
+        scraper = Scraper(None, settings)
+        stats.open_spider(spider)
+        scraper.open_spider(spider)
+        def check(_):
+            self.assertEqual(stats.get_value('selector/parses_avoided', \
+                spider=spider), 2)
+            self.failIf(stats.get_value('selector/parses_avoided'))
+            stats.close_spider(spider, '')
+            return scraper.close_spider(spider)
+        return scraper.enqueue_scrape(response, request, spider).addCallback(check)
+
+    def test_encoding_names(self):
+        # latin-1 and utf_8 are unknown to libxml2, euc_jp to both
+        for encoding in ('latin-1', 'utf_8', 'euc_jp'):
+            response = TextResponse('http://www.example.com', \
+                body=u'<p>\xa1</p>'.encode(encoding), encoding=encoding)
+            self.assertEqual(HtmlXPathSelector(response).select('//p/text()').extract(), \
+                [u'\xa1'])
+
+    def test_compiled_xpath_cache_size(self):
+        old_cache = lxmlsel._xpath_cache
+        lxmlsel._xpath_cache = LruCache(10)
+        try:
+            used = lxmlsel.compile_xpath('//p')
+            for n in range(25):
+                lxmlsel.compile_xpath('//a[%d]' % n)
+                assert len(lxmlsel._xpath_cache) <= 10
+                # the expressions in use aren't discarded
+                assert lxmlsel.compile_xpath('//p') is used
+        finally:
+            lxmlsel._xpath_cache = old_cache
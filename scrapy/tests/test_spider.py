@@ -5,6 +5,7 @@ import warnings
 from twisted.trial import unittest
 
 from scrapy.spider import BaseSpider
+from scrapy.http import XmlResponse
 from scrapy.contrib.spiders.init import InitSpider
 from scrapy.contrib.spiders.crawl import CrawlSpider
 from scrapy.contrib.spiders.feed import XMLFeedSpider, CSVFeedSpider
@@ -44,6 +45,18 @@ class XMLFeedSpiderTest(BaseSpiderTest):
 
     spider_class = XMLFeedSpider
 
+    def test_iterparse_iterator(self):
+        body = '<?xml version="1.0"?><rss xmlns:g="http://base.google.com/ns/1.0">' \
+            '<item><g:id>1</g:id></item><item><g:id>2</g:id></item></rss>'
+        class _XMLSpider(self.spider_class):
+            iterator = 'iterparse'
+            namespaces = (('g', 'http://base.google.com/ns/1.0'),)
+            def parse_node(self, response, selector):
+                return [selector.select('g:id/text()').extract()[0]]
+        spider = _XMLSpider('example.com')
+        response = XmlResponse('http://www.example.com/feed.xml', body=body)
+        self.assertEqual(list(spider.parse(response)), [u'1', u'2'])
+
 class CSVFeedSpiderTest(BaseSpiderTest):
 
     spider_class = CSVFeedSpider
@@ -1,7 +1,8 @@
 import copy
 import unittest
 
-from scrapy.utils.datatypes import PriorityQueue, PriorityStack, CaselessDict
+from scrapy.utils.datatypes import PriorityQueue, PriorityStack, CaselessDict, \
+    LruCache
 
 __doctests__ = ['scrapy.utils.datatypes']
 
@@ -200,6 +201,38 @@ class CaselessDictTest(unittest.TestCase):
         assert isinstance(h2, CaselessDict)
 
 
+class LruCacheTest(unittest.TestCase):
+
+    def test_limit(self):
+        c = LruCache(10)
+        for n in range(100):
+            c[n] = str(n)
+            self.assert_(len(c) <= 10)
+        self.assertEqual(c[99], '99')
+        self.assertRaises(KeyError, c.__getitem__, 0)
+        self.assertEqual(c.get(0), None)
+        self.assertEqual(c.get(0, 'x'), 'x')
+
+    def test_recently_used_kept(self):
+        c = LruCache(10)
+        c['hot'] = 1
+        for n in range(100):
+            c[n] = n
+            self.assertEqual(c['hot'], 1)
+        c.clear()
+        self.assertEqual(len(c), 0)
+        assert 'hot' not in c
+
+    def test_overwrite_old_item(self):
+        c = LruCache(10)
+        for n in range(5):
+            c[n] = n
+        c[0] = 'new'
+        self.assertEqual(len(c), 5)
+        self.assertEqual(c[0], 'new')
+        self.assertEqual([n for n in range(10) if n in c], range(5))
+
+
 if __name__ == "__main__":
     unittest.main()
 
@@ -0,0 +1,246 @@
+import os
+
+from twisted.trial import unittest
+
+from scrapy.utils.diskqueue import DiskFifoQueue, DiskLifoQueue, \
+    DiskBackedPriorityQueue
+
+
+class DiskFifoQueueTest(unittest.TestCase):
+
+    def setUp(self):
+        self.path = self.mktemp()
+
+    def test_push_pop(self):
+        q = DiskFifoQueue(self.path, chunksize=3)
+        for x in 'abcdefg':
+            q.push(x)
+        self.assertEqual(len(q), 7)
+        self.assertEqual([q.pop() for _ in range(4)], list('abcd'))
+        q.push('h')
+        self.assertEqual([q.pop() for _ in range(4)], list('efgh'))
+        self.assertEqual(q.pop(), None)
+        self.assertEqual(len(q), 0)
+        q.close()
+
+    def test_consumed_chunks_removed(self):
+        q = DiskFifoQueue(self.path, chunksize=2)
+        for x in 'abcde':
+            q.push(x)
+        self.assertEqual(len([f for f in os.listdir(self.path) if f.startswith('q')]), 3)
+        q.pop(); q.pop(); q.pop()
+        self.assertEqual(len([f for f in os.listdir(self.path) if f.startswith('q')]), 2)
+        q.close()
+
+    def test_close_reopen(self):
+        q = DiskFifoQueue(self.path, chunksize=2)
+        for x in ['a', '', 'c' * 1000, 'd']:
+            q.push(x)
+        self.assertEqual(q.pop(), 'a')
+        q.close()
+        q = DiskFifoQueue(self.path)
+        self.assertEqual(len(q), 3)
+        self.assertEqual([q.pop() for _ in range(3)], ['', 'c' * 1000, 'd'])
+        q.close()
+        assert not os.path.exists(self.path), "empty queue not removed on close"
+
+
+    def test_flush_restore(self):
+        q = DiskFifoQueue(self.path, chunksize=2)
+        for x in 'abcde':
+            q.push(x)
+        self.assertEqual(q.pop(), 'a')
+        q.flush()
+        # pushed/popped after the flush, then the process is killed
+        self.assertEqual([q.pop() for _ in range(3)], list('bcd'))
+        q.push('f')
+        q.push('g')
+        q = DiskFifoQueue(self.path, chunksize=2)
+        self.assertEqual(len(q), 4)
+        q.push('h')
+        self.assertEqual([q.pop() for _ in range(5)], list('bcdeh'))
+        q.close()
+
+
+class DiskLifoQueueTest(unittest.TestCase):
+
+    def setUp(self):
+        self.path = self.mktemp()
+
+    def test_push_pop(self):
+        q = DiskLifoQueue(self.path)
+        for x in 'abc':
+            q.push(x)
+        self.assertEqual(q.pop(), 'c')
+        q.push('d')
+        self.assertEqual([q.pop() for _ in range(3)], list('dba'))
+        self.assertEqual(q.pop(), None)
+        q.close()
+
+    def test_close_reopen(self):
+        q = DiskLifoQueue(self.path)
+        for x in ['a', '', 'c' * 1000, 'd' * 1000]:
+            q.push(x)
+        self.assertEqual(q.pop(), 'd' * 1000)
+        q.push('d')
+        q.close()
+        q = DiskLifoQueue(self.path)
+        self.assertEqual(len(q), 4)
+        self.assertEqual([q.pop() for _ in range(4)], ['d', 'c' * 1000, '', 'a'])
+        q.close()
+        assert not os.path.exists(self.path), "empty queue not removed on close"
+
+
+    def test_flush_restore(self):
+        q = DiskLifoQueue(self.path)
+        for x in 'abcd':
+            q.push(x)
+        q.flush()
+        # popped after the flush, then the process is killed
+        self.assertEqual([q.pop() for _ in range(3)], list('dcb'))
+        q = DiskLifoQueue(self.path)
+        self.assertEqual(len(q), 4)
+        self.assertEqual([q.pop() for _ in range(3)], list('dcb'))
+        # pushing over popped items doesn't save the state
+        q.push('e' * 10)
+        q.push('f')
+        q = DiskLifoQueue(self.path)
+        self.assertEqual(len(q), 4)
+        self.assertEqual([q.pop() for _ in range(4)], list('dcba'))
+        q.close()
+
+    def test_push_after_pop_killed(self):
+        q = DiskLifoQueue(self.path)
+        for x in 'abc':
+            q.push(x)
+        q.flush()
+        self.assertEqual(q.pop(), 'c')
+        q.push('d')
+        # the process is killed while 'c' is still being processed
+        q = DiskLifoQueue(self.path)
+        self.assertEqual(len(q), 3)
+        self.assertEqual(q.pop(), 'c')
+        q.push('d')
+        q.flush()
+        self.assertEqual([q.pop() for _ in range(2)], list('db'))
+        q.push('e' * 100)
+        q.flush()
+        self.assertEqual([q.pop() for _ in range(2)], ['e' * 100, 'a'])
+        q.push('f')
+        q = DiskLifoQueue(self.path)
+        self.assertEqual(len(q), 2)
+        self.assertEqual([q.pop() for _ in range(2)], ['e' * 100, 'a'])
+        q.close()
+        assert not os.path.exists(self.path), "empty queue not removed on close"
+
+
+class DiskBackedPriorityQueueTest(unittest.TestCase):
+
+    lifo = False
+
+    def setUp(self):
+        self.path = self.mktemp()
+        self.serialized = []
+        self.q = DiskBackedPriorityQueue(self.path, self._serialize, \
+            lambda x: x, lifo=self.lifo, memsize=2)
+
+    def tearDown(self):
+        self.q.close()
+
+    def _serialize(self, item):
+        if item.startswith('mem'):
+            return
+        self.serialized.append(item)
+        return item
+
+    def _popall(self):
+        l = []
+        while self.q:
+            l.append(self.q.pop())
+        return l
+
+    def test_order(self):
+        for item, priority in [('a', 0), ('b', 0), ('c', 1), ('d', 0), \
+                ('e', -1), ('f', 0)]:
+            self.q.push(item, priority)
+        self.assertEqual(len(self.q), 6)
+        self.assertEqual(self._popall(), [('e', -1), ('a', 0), ('b', 0), \
+            ('d', 0), ('f', 0), ('c', 1)])
+        self.assertEqual(self.serialized, ['d', 'f'])
+        self.assertRaises(IndexError, self.q.pop)
+
+    def test_unserializable_kept_in_memory(self):
+        for item in ['a', 'b', 'c', 'mem1', 'd']:
+            self.q.push(item)
+        self.assertEqual(self._popall(), [('a', 0), ('b', 0), ('c', 0), \
+            ('mem1', 0), ('d', 0)])
+        self.assertEqual(self.serialized, ['c', 'd'])
+
+    def test_unserializable_order(self):
+        for item in ['a', 'mem1', 'b', 'c', 'mem2', 'mem3', 'd']:
+            self.q.push(item)
+        self.assertEqual(self.q.pop(), ('a', 0))
+        self.q.push('e')
+        self.assertEqual([x for x, _ in self._popall()], \
+            ['mem1', 'b', 'c', 'mem2', 'mem3', 'd', 'e'])
+
+    def test_unserializable_memory_bounded(self):
+        self.q.push('mem1')
+        for i in range(100):
+            self.q.push(str(i))
+        self.assertEqual(len(self.q), 101)
+        self.failUnless(self.q.close() <= 3) # memsize + 'mem1'
+
+    def test_nothing_written_below_memsize(self):
+        self.q.push('a', 0)
+        self.q.push('b', 1)
+        assert not os.path.exists(self.path)
+
+    def test_close_reopen(self):
+        q = DiskBackedPriorityQueue(self.mktemp(), str, str, lifo=self.lifo, \
+            memsize=0)
+        for item, priority in [('a', 0), ('b', 1), ('c', -1), ('d', 1)]:
+            q.push(item, priority)
+        self.assertEqual(q.pop(), ('c', -1))
+        self.assertEqual(q.close(), 0)
+        q = DiskBackedPriorityQueue(q.path, str, str, lifo=self.lifo, memsize=0)
+        self.assertEqual(len(q), 3)
+        expected = [('a', 0), ('d', 1), ('b', 1)] if self.lifo else \
+            [('a', 0), ('b', 1), ('d', 1)]
+        self.assertEqual([q.pop() for _ in range(3)], expected)
+        self.failIf(q)
+        q.close()
+
+    def test_close_memory_items_lost(self):
+        for item in ['mem1', 'a', 'mem2']:
+            self.q.push(item)
+        self.assertEqual(self.q.close(), 3)
+
+
+class LifoDiskBackedPriorityQueueTest(DiskBackedPriorityQueueTest):
+
+    lifo = True
+
+    def test_order(self):
+        for item, priority in [('a', 0), ('b', 0), ('c', 1), ('d', 0), \
+                ('e', -1), ('f', 0)]:
+            self.q.push(item, priority)
+        self.assertEqual(len(self.q), 6)
+        self.assertEqual(self._popall(), [('e', -1), ('f', 0), ('d', 0), \
+            ('b', 0), ('a', 0), ('c', 1)])
+        self.assertEqual(self.serialized, ['a', 'b'])
+
+    def test_unserializable_kept_in_memory(self):
+        for item in ['mem1', 'a', 'b', 'c']:
+            self.q.push(item)
+        self.assertEqual(self._popall(), [('c', 0), ('b', 0), ('a', 0), \
+            ('mem1', 0)])
+        self.assertEqual(self.serialized, ['a'])
+
+    def test_unserializable_order(self):
+        for item in ['a', 'mem1', 'b', 'c', 'mem2', 'mem3', 'd']:
+            self.q.push(item)
+        self.assertEqual(self.q.pop(), ('d', 0))
+        self.q.push('e')
+        self.assertEqual([x for x, _ in self._popall()], \
+            ['e', 'mem3', 'mem2', 'c', 'b', 'mem1', 'a'])
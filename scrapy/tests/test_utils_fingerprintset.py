@@ -0,0 +1,116 @@
+import os
+import hashlib
+
+from twisted.trial import unittest
+
+from scrapy.utils.fingerprintset import FingerprintSet, BloomFilter, \
+    ScalableBloomFilter, DiskFingerprintSet
+
+
+def fingerprints(start, stop):
+    return [hashlib.sha1(str(x)).digest() for x in xrange(start, stop)]
+
+
+class FingerprintSetTest(unittest.TestCase):
+
+    def new_set(self):
+        return FingerprintSet(capacity=8)
+
+    def test_add(self):
+        s = self.new_set()
+        fps = fingerprints(0, 1000)
+        for fp in fps:
+            self.failIf(s.add(fp))
+        self.assertEqual(len(s), 1000)
+        for fp in fps:
+            assert s.add(fp)
+            assert fp in s
+        for fp in fingerprints(1000, 2000):
+            self.failIf(fp in s)
+        self.assertEqual(len(s), 1000)
+        s.close()
+
+    def test_empty_key(self):
+        s = self.new_set()
+        self.failIf('\x00' * 20 in s)
+        self.failIf(s.add('\x00' * 20))
+        assert '\x00' * 20 in s
+
+
+class FingerprintSetResizeTest(unittest.TestCase):
+
+    def test_resize(self):
+        s = FingerprintSet(capacity=8)
+        for fp in fingerprints(0, 100):
+            s.add(fp)
+        assert s.capacity >= 100 / s.max_load
+        self.assertEqual(len(s), 100)
+        for fp in fingerprints(0, 100):
+            assert fp in s
+
+
+class DiskFingerprintSetTest(FingerprintSetTest):
+
+    def new_set(self):
+        return DiskFingerprintSet(self.mktemp(), batchsize=100)
+
+    def test_empty_key(self):
+        pass
+
+    def test_close_reopen(self):
+        path = self.mktemp()
+        s = DiskFingerprintSet(path, batchsize=100)
+        for fp in fingerprints(0, 250):
+            s.add(fp)
+        s.close()
+        self.assertEqual(os.path.getsize(path), 250 * 8)
+        s = DiskFingerprintSet(path, batchsize=100)
+        self.assertEqual(len(s), 250)
+        for fp in fingerprints(0, 250):
+            assert fp in s
+        self.failIf(fingerprints(250, 251)[0] in s)
+        s.close()
+
+    def test_close_without_flush(self):
+        path = self.mktemp()
+        s = DiskFingerprintSet(path, batchsize=100)
+        for fp in fingerprints(0, 150):
+            s.add(fp)
+        s.close(flush=False)
+        self.assertEqual(os.path.getsize(path), 100 * 8)
+
+    def test_file_sorted(self):
+        path = self.mktemp()
+        s = DiskFingerprintSet(path, batchsize=10)
+        for fp in fingerprints(0, 95):
+            s.add(fp)
+        s.close()
+        data = open(path, 'rb').read()
+        keys = [data[i:i+8] for i in range(0, len(data), 8)]
+        self.assertEqual(keys, sorted(fp[:8] for fp in fingerprints(0, 95)))
+
+
+class BloomFilterTest(unittest.TestCase):
+
+    def test_error_rate(self):
+        f = BloomFilter(10000, 0.01)
+        for fp in fingerprints(0, 10000):
+            f.add(fp)
+        for fp in fingerprints(0, 10000):
+            assert fp in f
+        false_positives = sum(1 for fp in fingerprints(10000, 20000) if fp in f)
+        assert false_positives < 150, false_positives
+
+
+class ScalableBloomFilterTest(unittest.TestCase):
+
+    def test_add(self):
+        f = ScalableBloomFilter(error_rate=0.01, initial_capacity=100)
+        added = [fp for fp in fingerprints(0, 2000) if not f.add(fp)]
+        assert len(added) > 1950, len(added)
+        assert len(f.filters) > 1
+        self.assertEqual(len(f), len(added))
+        for fp in fingerprints(0, 2000):
+            assert f.add(fp)
+        false_positives = sum(1 for fp in fingerprints(2000, 12000) if fp in f)
+        assert false_positives < 150, false_positives
@@ -1,8 +1,8 @@
 import os
+from tempfile import TemporaryFile
 from twisted.trial import unittest
 
-from scrapy.utils.iterators import csviter, xmliter
-from scrapy.contrib_exp.iterators import xmliter_lxml
+from scrapy.utils.iterators import csviter, xmliter, xmliter_lxml
 from scrapy.http import XmlResponse, TextResponse
 from scrapy.tests import get_testdata
 
@@ -89,6 +89,20 @@ class XmliterTestCase(unittest.TestCase):
             u'<item>Some Turkish Characters \xd6\xc7\u015e\u0130\u011e\xdc \xfc\u011f\u0131\u015f\xe7\xf6</item>'
         )
 
+    def test_xmliter_spooled(self):
+        body = '<?xml version="1.0" encoding="ISO-8859-9"?>\n<xml>\n' + \
+            '<item id="%d">Some Turkish Characters \xd6\xc7\xde\xdd\xd0\xdc</item>\n' * 500 + \
+            '</xml>\n'
+        f = TemporaryFile()
+        f.write(body % tuple(range(500)))
+        response = XmlResponse('http://www.example.com', body=f)
+        nodes = list(self.xmliter(response, 'item'))
+        self.assertEqual(len(nodes), 500)
+        self.assertEqual(nodes[499].select('@id').extract(), [u'499'])
+        self.assertEqual(nodes[0].select('text()').extract(),
+            [u'Some Turkish Characters \xd6\xc7\u015e\u0130\u011e\xdc'])
+        assert response._body is None, "spooled body was loaded in memory"
+
 
 class LxmlXmliterTestCase(XmliterTestCase):
     xmliter = staticmethod(xmliter_lxml)
@@ -97,6 +111,23 @@ class LxmlXmliterTestCase(XmliterTestCase):
     except ImportError:
         skip = "lxml not available"
 
+    def test_xmliter_default_namespace(self):
+        body = '<?xml version="1.0"?><feed xmlns="http://www.w3.org/2005/Atom">' \
+            '<entry><id>1</id></entry><entry><id>2</id></entry></feed>'
+        nodes = list(self.xmliter(XmlResponse('http://www.example.com', body=body), 'entry'))
+        self.assertEqual(len(nodes), 2)
+        nodes[1].register_namespace('a', 'http://www.w3.org/2005/Atom')
+        self.assertEqual(nodes[1].select('a:id/text()').extract(), [u'2'])
+
+    def test_xmliter_nodes_copied(self):
+        body = '<products>%s</products>' % ' '.join('<product id="%d"/>' % n \
+            for n in range(10))
+        nodes = list(self.xmliter(body, 'product'))
+        # the nodes are still usable after iterating (and freeing) them
+        self.assertEqual([x.extract() for x in nodes[:2]], \
+            [u'<product id="0"/>', u'<product id="1"/>'])
+        assert nodes[0].root.getparent() is None
+
 
 class UtilsCsvTestCase(unittest.TestCase):
     sample_feeds_dir = os.path.join(os.path.abspath(os.path.dirname(__file__)), 'sample_data', 'feeds')
@@ -158,6 +189,16 @@ class UtilsCsvTestCase(unittest.TestCase):
                           {u'id': u'3', u'name': u'multi',   u'value': u'foo\nbar'},
                           {u'id': u'4', u'name': u'empty',   u'value': u''}])
 
+    def test_csviter_spooled(self):
+        body = get_testdata('feeds', 'feed-sample3.csv')
+        f = TemporaryFile()
+        f.write(body)
+        response = TextResponse(url="http://example.com/", body=f,
+            headers={'Content-Type': 'text/csv; charset=utf-8'})
+        self.assertEqual(list(csviter(response)),
+            list(csviter(TextResponse(url="http://example.com/", body=body))))
+        assert response._body is None, "spooled body was loaded in memory"
+
     def test_csviter_exception(self):
         body = get_testdata('feeds', 'feed-sample3.csv')
 
@@ -278,6 +278,53 @@ class UrlUtilsTest(unittest.TestCase):
         self.assertEqual(canonicalize_url("http://www.EXAMPLE.com"),
                                           "http://www.example.com")
 
+    def test_canonicalize_url_canonical(self):
+        # urls already canonical (or nearly) are returned as the full
+        # canonicalization would
+        for url, canonical in [
+                ("http://www.example.com/a/b.html?a=1&b=", "http://www.example.com/a/b.html?a=1&b="),
+                ("http://www.example.com/do?a=1&a=1", "http://www.example.com/do?a=1&a=1"),
+                ("http://www.example.com/do?a=2&a=10", "http://www.example.com/do?a=10&a=2"),
+                ("http://www.example.com/do?a=1&", "http://www.example.com/do?a=1"),
+                ("http://www.example.com/do?a=1=2", "http://www.example.com/do?a=1%3D2"),
+                ("http://www.example.com/do?a=1;b=2", "http://www.example.com/do?a=1&b=2"),
+                ("http://www.example.com/do?", "http://www.example.com/do"),
+                ("http://www.example.com/a%2Fb%41", "http://www.example.com/a/bA"),
+                ("http://www.example.com/a~b", "http://www.example.com/a%7Eb")]:
+            self.assertEqual(canonicalize_url(url), canonical)
+            self.assertEqual(canonicalize_url(canonical), canonical)
+        self.assertEqual(canonicalize_url("http://www.example.com/do?b=&a=1", keep_blank_values=False),
+                                          "http://www.example.com/do?a=1")
+        self.assertEqual(canonicalize_url("http://www.example.com/do?a=1&b=", keep_blank_values=False),
+                                          "http://www.example.com/do?a=1")
+
+    def test_urljoin_rfc_cached(self):
+        # cached results are shared by the bases the result doesn't depend on
+        for base, ref, url in [
+                ('http://www.example.com/a/b.html', 'c.html', 'http://www.example.com/a/c.html'),
+                ('http://www.example.com/a/d.html?x=1', 'c.html', 'http://www.example.com/a/c.html'),
+                ('http://www.example.com/e/b.html', 'c.html', 'http://www.example.com/e/c.html'),
+                ('http://www.example.com/a/b.html', '?y=2', 'http://www.example.com/a/b.html?y=2'),
+                ('http://www.example.com/a/d.html', '?y=2', 'http://www.example.com/a/d.html?y=2'),
+                ('http://www.example.com/a/b.html', '/c.html', 'http://www.example.com/c.html'),
+                ('http://www.example.org/a/b.html', '/c.html', 'http://www.example.org/c.html'),
+                ('http://www.example.com/a/b.html', '//www.example.net/', 'http://www.example.net/'),
+                ('https://www.example.com/a/b.html', '//www.example.net/', 'https://www.example.net/'),
+                ('http://www.example.com/a/b.html', '//', 'http://www.example.com/a/b.html'),
+                ('http://www.example.org/a/b.html', '//', 'http://www.example.org/a/b.html'),
+                ('http://www.example.com/a/b;p/c', 'd', 'http://www.example.com/a/b;p/d'),
+                ('http://www.example.com/a/b.html', 'd', 'http://www.example.com/a/d'),
+                ('http://www.example.com/a/b;p', 'd', 'http://www.example.com/a/d')]:
+            self.assertEqual(urljoin_rfc(base, ref), url)
+
+    def test_url_caches_bounded(self):
+        from scrapy.utils import url as url_module
+        for n in xrange(url_module.URL_CACHE_SIZE * 2):
+            canonicalize_url('http://www.example.com/%d' % n)
+            urljoin_rfc('http://www.example.com/', '%d' % n)
+        self.assert_(len(url_module._canonicalize_cache) <= url_module.URL_CACHE_SIZE)
+        self.assert_(len(url_module._urljoin_cache) <= url_module.URL_CACHE_SIZE)
+
     def test_path_to_file_uri(self):
         if os.name == 'nt':
             self.assertEqual(path_to_file_uri("C:\\windows\clock.avi"),
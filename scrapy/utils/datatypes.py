@@ -337,3 +337,61 @@ class PriorityStack(PriorityQueue):
         else:
             self.positems[priority].append(item)
 
+
+class LruCache(object):
+    """A dict-like cache which keeps up to `limit` items, discarding the least
+    recently used ones when it's full.
+
+    It's an approximation: the items are kept in two generations of up to
+    limit/2 items each. When the newer generation gets full it becomes the
+    older one, and the items of the previous older generation which weren't
+    used since then (and thus moved to the newer one) are discarded. This
+    makes reads and writes about as cheap as dict lookups.
+
+    >>> c = LruCache(4)
+    >>> c['a'], c['b'] = 1, 2
+    >>> c['a']
+    1
+    >>> c['c'] = 3
+    >>> 'a' in c, 'b' in c, 'c' in c
+    (True, False, True)
+    """
+
+    def __init__(self, limit):
+        self.limit = limit
+        self.recent = {}
+        self.old = {}
+
+    def __getitem__(self, key):
+        value = self.get(key, self)
+        if value is self:
+            raise KeyError(key)
+        return value
+
+    def __setitem__(self, key, value):
+        self.old.pop(key, None) # or its old value would be kept too
+        self.recent[key] = value
+        if len(self.recent) >= self.limit // 2:
+            self.old = self.recent
+            self.recent = {}
+
+    def __contains__(self, key):
+        return key in self.recent or key in self.old
+
+    def __len__(self):
+        return len(self.recent) + len(self.old)
+
+    def get(self, key, default=None):
+        # self is used as marker of missing keys, as raising and catching
+        # KeyError would double the cost of misses
+        value = self.recent.get(key, self)
+        if value is self:
+            value = self.old.pop(key, self)
+            if value is self:
+                return default
+            self[key] = value
+        return value
+
+    def clear(self):
+        self.recent.clear()
+        self.old.clear()
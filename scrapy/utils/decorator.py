@@ -35,3 +35,9 @@ def inthread(func):
     def wrapped(*a, **kw):
         return threads.deferToThread(func, *a, **kw)
     return wrapped
+
+def run_in_process(func):
+    """Decorator to mark a spider callback to be called in a worker process
+    (see SCRAPER_PROCESSES setting). The function itself is not changed."""
+    func.run_in_process = True
+    return func
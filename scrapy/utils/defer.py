@@ -98,3 +98,20 @@ def iter_errback(iterable, errback, *a, **kw):
             break
         except:
             errback(failure.Failure(), *a, **kw)
+
+def defer_to_threadpool(threadpool, f, *args, **kw):
+    """Call the given function in a thread of the given ThreadPool and return
+    a Deferred fired (in the reactor thread) with its result. Same as
+    twisted.internet.threads.deferToThreadPool, which is not available on all
+    supported Twisted versions.
+    """
+    d = defer.Deferred()
+    def _run():
+        try:
+            result = f(*args, **kw)
+        except:
+            reactor.callFromThread(d.errback, failure.Failure())
+        else:
+            reactor.callFromThread(d.callback, result)
+    threadpool.callInThread(_run)
+    return d
@@ -0,0 +1,432 @@
+"""
+Queues which keep their items on disk, to support crawls with more pending
+requests than what fits in memory.
+
+DiskFifoQueue and DiskLifoQueue only store str items. DiskBackedPriorityQueue
+keeps a window of (any) items in memory and spills the rest to disk queues,
+using the given serialize/deserialize functions.
+
+This module must not depend on any module outside the Standard Library.
+"""
+
+from __future__ import with_statement
+
+import os
+import struct
+import shutil
+from collections import deque
+from bisect import insort
+
+try:
+    import json
+except ImportError:
+    import simplejson as json
+
+
+class DiskFifoQueue(object):
+    """FIFO queue of str items stored in a directory of chunk files with (at
+    most) chunksize items each. Chunks are removed as soon as all their items
+    were popped.
+
+    The queue state is saved on close() and flush(). Once flush() has been
+    called, the queue can be restored to the state of the last flush() even
+    if the process was killed before closing it: items pushed after it are
+    lost, and items popped after it are popped again. To allow that, consumed
+    chunks are kept until the next flush().
+    """
+
+    szhdr_format = '>L'
+    szhdr_size = struct.calcsize(szhdr_format)
+
+    def __init__(self, path, chunksize=100000):
+        self.path = path
+        if not os.path.exists(path):
+            os.makedirs(path)
+        self.info = self._loadinfo(chunksize)
+        self.chunksize = self.info['chunksize']
+        self.flushed = False
+        self.consumed = [] # chunks to remove on the next flush
+        self._restore()
+        self.headf = self._openchunk(self.info['head'][0], 'ab+')
+        self.tailf = self._openchunk(self.info['tail'][0])
+        self.tailf.seek(self.info['tail'][2])
+
+    def push(self, string):
+        hnum, hpos = self.info['head'][:2]
+        hpos += 1
+        self.headf.write(struct.pack(self.szhdr_format, len(string)))
+        self.headf.write(string)
+        if hpos == self.chunksize:
+            hpos = 0
+            hnum += 1
+            self.headf.close()
+            self.headf = self._openchunk(hnum, 'ab+')
+        self.info['size'] += 1
+        self.info['head'] = [hnum, hpos]
+
+    def pop(self):
+        if not self.info['size']:
+            return
+        tnum, tcnt, toffset = self.info['tail']
+        if tnum == self.info['head'][0]:
+            self.headf.flush() # the tail chunk is still being written
+        szhdr = self.tailf.read(self.szhdr_size)
+        size, = struct.unpack(self.szhdr_format, szhdr)
+        data = self.tailf.read(size)
+        tcnt += 1
+        toffset += self.szhdr_size + size
+        if tcnt == self.chunksize and tnum < self.info['head'][0]:
+            self.tailf.close()
+            if self.flushed:
+                self.consumed.append(tnum)
+            else:
+                os.remove(self._chunkpath(tnum))
+            tnum += 1
+            tcnt = toffset = 0
+            self.tailf = self._openchunk(tnum)
+        self.info['size'] -= 1
+        self.info['tail'] = [tnum, tcnt, toffset]
+        return data
+
+    def flush(self):
+        """Save the queue state, so that it can be restored from here if the
+        process is killed"""
+        self.headf.flush()
+        os.fsync(self.headf.fileno())
+        self._saveinfo()
+        self.flushed = True
+        for num in self.consumed:
+            os.remove(self._chunkpath(num))
+        self.consumed = []
+
+    def close(self):
+        self.headf.flush()
+        self._saveinfo()
+        self.headf.close()
+        self.tailf.close()
+        for num in self.consumed:
+            os.remove(self._chunkpath(num))
+        if len(self) == 0:
+            self._cleanup()
+
+    def __len__(self):
+        return self.info['size']
+
+    def _openchunk(self, number, mode='rb'):
+        path = self._chunkpath(number)
+        if mode == 'rb' and not os.path.exists(path):
+            open(path, 'ab').close()
+        return open(path, mode)
+
+    def _chunkpath(self, number):
+        return os.path.join(self.path, 'q%05d' % number)
+
+    def _restore(self):
+        """Discard the data pushed after the state was saved (ie. if the
+        process was killed)"""
+        hnum, _, hoffset = self.info['head']
+        path = self._chunkpath(hnum)
+        if os.path.exists(path) and os.path.getsize(path) > hoffset:
+            with open(path, 'r+b') as f:
+                f.truncate(hoffset)
+        num = hnum + 1
+        while os.path.exists(self._chunkpath(num)):
+            os.remove(self._chunkpath(num))
+            num += 1
+
+    def _loadinfo(self, chunksize):
+        infopath = self._infopath()
+        if os.path.exists(infopath):
+            with open(infopath) as f:
+                return json.load(f)
+        return {
+            'chunksize': chunksize,
+            'size': 0,
+            'tail': [0, 0, 0],
+            'head': [0, 0, 0],
+        }
+
+    def _saveinfo(self):
+        hnum, hpos = self.info['head'][:2]
+        self.info['head'] = [hnum, hpos, os.fstat(self.headf.fileno()).st_size]
+        _dumpjson(self.info, self._infopath())
+
+    def _infopath(self):
+        return os.path.join(self.path, 'info.json')
+
+    def _cleanup(self):
+        shutil.rmtree(self.path, ignore_errors=True)
+
+
+class DiskLifoQueue(object):
+    """LIFO queue of str items stored in a single file. Each item is followed
+    by its size, so that items can be popped from the end. Popped items are
+    only truncated from the file when the queue is closed.
+
+    Like DiskFifoQueue, once flush() has been called the queue can be
+    restored to the state of the last flush() if the process is killed. To
+    allow that, the file region of the saved state is never written before
+    the next flush(): items pushed after popping into it are written after
+    its end, so the queue is kept as a list of [start, end) file segments.
+    """
+
+    szhdr_format = '>L'
+    szhdr_size = struct.calcsize(szhdr_format)
+
+    def __init__(self, path):
+        self.path = path
+        if not os.path.exists(path):
+            os.makedirs(path)
+        qpath = os.path.join(path, 'q')
+        if not os.path.exists(qpath):
+            open(qpath, 'wb').close()
+        self.f = open(qpath, 'r+b')
+        self.size, self.segments = self._loadinfo()
+        self.flushed_end = self._end()
+
+    def push(self, string):
+        if self.segments and self.segments[-1][1] >= self.flushed_end:
+            segment = self.segments[-1]
+        else:
+            # don't overwrite the (already popped) items of the saved state
+            segment = [self.flushed_end, self.flushed_end]
+            self.segments.append(segment)
+        self.f.seek(segment[1])
+        self.f.write(string)
+        self.f.write(struct.pack(self.szhdr_format, len(string)))
+        segment[1] += len(string) + self.szhdr_size
+        self.size += 1
+
+    def pop(self):
+        if not self.size:
+            return
+        segment = self.segments[-1]
+        self.f.seek(segment[1] - self.szhdr_size)
+        size, = struct.unpack(self.szhdr_format, self.f.read(self.szhdr_size))
+        segment[1] -= size + self.szhdr_size
+        self.f.seek(segment[1])
+        data = self.f.read(size)
+        if segment[1] == segment[0]:
+            self.segments.pop()
+        self.size -= 1
+        return data
+
+    def flush(self):
+        """Save the queue state, so that it can be restored from here if the
+        process is killed"""
+        self.f.flush()
+        os.fsync(self.f.fileno())
+        self._saveinfo()
+
+    def close(self):
+        self.f.flush()
+        self._saveinfo()
+        self.f.truncate(self._end())
+        self.f.close()
+        if not self.size:
+            shutil.rmtree(self.path, ignore_errors=True)
+
+    def __len__(self):
+        return self.size
+
+    def _end(self):
+        return self.segments[-1][1] if self.segments else 0
+
+    def _loadinfo(self):
+        infopath = os.path.join(self.path, 'info.json')
+        if os.path.exists(infopath):
+            with open(infopath) as f:
+                info = json.load(f)
+            return info['size'], info['segments']
+        return 0, []
+
+    def _saveinfo(self):
+        self.flushed_end = self._end()
+        _dumpjson({'size': self.size, 'segments': self.segments}, \
+            os.path.join(self.path, 'info.json'))
+
+
+class DiskBackedPriorityQueue(object):
+    """Priority queue (with the same interface as
+    scrapy.utils.datatypes.PriorityQueue) which keeps, for each priority, up to
+    memsize items in memory and spills the rest to a disk queue in a
+    subdirectory of the given path.
+
+    FIFO order (or LIFO, if lifo is True) is kept within each priority. Items
+    for which serialize() returns None are always kept in memory.
+
+    Only the items on disk are kept when the queue is closed (or killed, after
+    calling flush()), and they're loaded again when a queue is created on the
+    same path. Use memsize=0 to store all (serializable) items on disk.
+    """
+
+    def __init__(self, path, serialize, deserialize, lifo=False, memsize=1000):
+        self.path = path
+        self.serialize = serialize
+        self.deserialize = deserialize
+        self.lifo = lifo
+        self.memsize = memsize
+        self.queues = {}
+        self.priorities = []
+        self.flushed = False
+        if os.path.isdir(path):
+            self._load()
+
+    def push(self, item, priority=0):
+        q = self.queues.get(priority)
+        if q is None:
+            q = self.queues[priority] = self._newqueue(priority)
+        q.push(item)
+        if len(q) == 1:
+            insort(self.priorities, priority)
+
+    def pop(self):
+        for priority in self.priorities:
+            q = self.queues[priority]
+            item = q.pop()
+            if not q:
+                self.priorities.remove(priority)
+                # once flushed, empty queues are kept (on disk) until the
+                # next flush
+                if not self.flushed:
+                    q.close()
+                    del self.queues[priority]
+            return (item, priority)
+        raise IndexError("pop from an empty queue")
+
+    def flush(self):
+        """Save the state of all disk queues, see DiskFifoQueue.flush()"""
+        self.flushed = True
+        for priority, q in self.queues.items():
+            q.flush()
+            if not q:
+                q.close()
+                del self.queues[priority]
+
+    def close(self):
+        """Close the queue and return the number of items lost, ie. the ones
+        which were kept in memory"""
+        lost = sum([q.close() for q in self.queues.values()])
+        self.queues.clear()
+        self.priorities = []
+        return lost
+
+    def __len__(self):
+        return sum(len(q) for q in self.queues.itervalues())
+
+    def __nonzero__(self):
+        return bool(self.priorities)
+
+    def _load(self):
+        for name in os.listdir(self.path):
+            if name.startswith('p'):
+                priority = int(name[1:])
+                q = self._newqueue(priority)
+                if q:
+                    self.queues[priority] = q
+                    insort(self.priorities, priority)
+                else:
+                    q.close()
+
+    def _newqueue(self, priority):
+        path = os.path.join(self.path, 'p%d' % priority)
+        if self.lifo:
+            return _LifoSpillQueue(path, self.serialize, self.deserialize, \
+                self.memsize)
+        return _FifoSpillQueue(path, self.serialize, self.deserialize, \
+            self.memsize)
+
+
+class _FifoSpillQueue(object):
+    """Memory holds the oldest items, so new items go to disk as soon as
+    there's anything there (or the memory is full).
+
+    Items which can't be serialized are kept aside in memory, along with
+    their position in the disk queue, so that they're popped in order.
+    """
+
+    diskqueue_class = DiskFifoQueue
+
+    def __init__(self, path, serialize, deserialize, memsize):
+        self.path = path
+        self.mem = deque()
+        self.kept = deque() # (disk position, item) of unserializable items
+        self.disk = None # created on the first spill
+        self.pushed = self.popped = 0 # items pushed to (popped from) disk
+        if os.path.exists(path):
+            self.disk = self.diskqueue_class(path)
+            self.pushed = len(self.disk)
+        self.serialize = serialize
+        self.deserialize = deserialize
+        self.memsize = memsize
+
+    def push(self, item):
+        if not (self.disk or self.kept) and len(self.mem) < self.memsize:
+            self.mem.append(item)
+        else:
+            self._spill(item)
+
+    def pop(self):
+        if self.mem:
+            return self.mem.popleft()
+        if self.kept and self.kept[0][0] == self.popped:
+            return self.kept.popleft()[1]
+        self.popped += 1
+        return self.deserialize(self.disk.pop())
+
+    def flush(self):
+        if self.disk is not None:
+            self.disk.flush()
+
+    def close(self):
+        if self.disk is not None:
+            self.disk.close()
+        return len(self.mem) + len(self.kept)
+
+    def _spill(self, item):
+        data = self.serialize(item)
+        if data is None:
+            self.kept.append((self._position(), item))
+            return
+        if self.disk is None:
+            self.disk = self.diskqueue_class(self.path)
+        self.disk.push(data)
+        self.pushed += 1
+
+    def _position(self):
+        return self.pushed
+
+    def __len__(self):
+        return len(self.mem) + len(self.kept) + \
+            (len(self.disk) if self.disk else 0)
+
+
+class _LifoSpillQueue(_FifoSpillQueue):
+    """Memory holds the newest items, the oldest ones are moved to disk when
+    the memory gets full"""
+
+    diskqueue_class = DiskLifoQueue
+
+    def push(self, item):
+        self.mem.append(item)
+        if len(self.mem) > self.memsize:
+            self._spill(self.mem.popleft())
+
+    def pop(self):
+        if self.mem:
+            return self.mem.pop()
+        if self.kept and self.kept[-1][0] == self._position():
+            return self.kept.pop()[1]
+        return self.deserialize(self.disk.pop())
+
+    def _position(self):
+        return len(self.disk) if self.disk else 0
+
+
+def _dumpjson(obj, path):
+    # write to a temporary file first, so that the file is never left half
+    # written
+    tmppath = path + '.tmp'
+    with open(tmppath, 'w') as f:
+        json.dump(obj, f)
+    os.rename(tmppath, path)
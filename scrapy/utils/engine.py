@@ -25,9 +25,11 @@ def get_engine_status(engine=None):
         "engine.closing.get(spider)",
         "engine.scheduler.spider_has_pending_requests(spider)",
         "len(engine.scheduler.pending_requests[spider])",
-        "len(engine.downloader.sites[spider].queue)",
+        "engine.downloader.sites[spider].queue_size()",
         "len(engine.downloader.sites[spider].active)",
         "len(engine.downloader.sites[spider].transferring)",
+        "len(engine.downloader.sites[spider].slots)",
+        "engine.downloader.sites[spider].throttle_status()",
         "engine.downloader.sites[spider].closing",
         "engine.downloader.sites[spider].lastseen",
         "len(engine.scraper.sites[spider].queue)",
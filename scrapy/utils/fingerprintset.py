@@ -0,0 +1,295 @@
+"""
+Compact sets of fingerprints (binary digests, like the ones returned by
+hashlib.sha1().digest()), to keep track of millions of seen requests using a
+fraction of the memory required by a set of hex digests.
+
+FingerprintSet is an exact set, ScalableBloomFilter trades a (configurable)
+false positive rate for even less memory, and DiskFingerprintSet keeps most of
+the fingerprints in a sorted file on disk.
+
+Fingerprints are assumed to be uniformly distributed, so their first bytes are
+used directly as hashes.
+
+This module must not depend on any module outside the Standard Library.
+"""
+
+from __future__ import with_statement
+
+import os
+import math
+import mmap
+import struct
+from array import array
+
+_unpack_key = struct.Struct('l').unpack_from
+_unpack_hashes = struct.Struct('>QQL').unpack_from
+
+
+class FingerprintSet(object):
+    """Set of fingerprints stored in an open addressing hash table backed by
+    an array of C longs. Only the first bytes of each fingerprint (8 on most
+    platforms, the size of a C long) are kept, so two fingerprints sharing
+    them are considered equal (with 8 bytes and 10 million fingerprints the
+    probability of that happening is about 3 in a million).
+    """
+
+    max_load = 0.7
+
+    def __init__(self, capacity=1024):
+        self.capacity = capacity
+        self.table = array('l', [0]) * capacity
+        self.count = 0
+
+    def add(self, fingerprint):
+        """Add the given fingerprint to the set. Return True if it was
+        already there, or False otherwise"""
+        key = _key(fingerprint)
+        idx = self._lookup(key)
+        if self.table[idx]:
+            return True
+        self.table[idx] = key
+        self.count += 1
+        if self.count > self.capacity * self.max_load:
+            self._resize(self.capacity * 2)
+        return False
+
+    def __contains__(self, fingerprint):
+        return bool(self.table[self._lookup(_key(fingerprint))])
+
+    def __len__(self):
+        return self.count
+
+    def close(self):
+        pass
+
+    def _lookup(self, key):
+        """Return the index of the given key in the table, or the index of
+        the empty slot where it should be stored (linear probing)"""
+        table, capacity = self.table, self.capacity
+        idx = key % capacity
+        while True:
+            k = table[idx]
+            if k == key or not k:
+                return idx
+            idx += 1
+            if idx == capacity:
+                idx = 0
+
+    def _resize(self, capacity):
+        oldtable = self.table
+        self.capacity = capacity
+        self.table = array('l', [0]) * capacity
+        for key in oldtable:
+            if key:
+                self.table[self._lookup(key)] = key
+
+
+def _key(fingerprint):
+    # 0 is reserved for empty slots
+    return _unpack_key(fingerprint)[0] or 1
+
+
+class BloomFilter(object):
+    """Bloom filter for (at most) `capacity` fingerprints with the given false
+    positive rate. Fingerprints must be at least 20 bytes long."""
+
+    def __init__(self, capacity, error_rate):
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.hashes = int(math.ceil(math.log(1.0 / error_rate, 2)))
+        # bits per hash function, following the optimal bits per element
+        # formula: m/n = -ln(p) / ln(2)^2
+        bits = -capacity * math.log(error_rate) / (math.log(2) ** 2)
+        self.bits_per_hash = int(math.ceil(bits / self.hashes))
+        self.bits = bytearray((self.bits_per_hash * self.hashes + 7) // 8)
+        self.count = 0
+
+    def add(self, fingerprint):
+        """Add the given fingerprint. Return True if it was (probably)
+        already in the filter, or False otherwise"""
+        bits, found = self.bits, True
+        for pos in self._positions(fingerprint):
+            byte, mask = pos >> 3, 1 << (pos & 7)
+            if not bits[byte] & mask:
+                found = False
+                bits[byte] |= mask
+        if not found:
+            self.count += 1
+        return found
+
+    def __contains__(self, fingerprint):
+        # same as _positions(), but stopping at the first unset bit
+        bits, m = self.bits, self.bits_per_hash
+        h1, h2, h3 = _unpack_hashes(fingerprint)
+        x, y, z = h1 % m, h2 % m, h3 % m
+        for offset in xrange(0, m * self.hashes, m):
+            pos = offset + x
+            if not bits[pos >> 3] & (1 << (pos & 7)):
+                return False
+            x = (x + y) % m
+            y = (y + z) % m
+        return True
+
+    def __len__(self):
+        return self.count
+
+    def _positions(self, fingerprint):
+        # triple hashing, with one slice of bits for each hash function. With
+        # double hashing two fingerprints collide in all slices with 1/m^2
+        # probability, which is significant for small filters
+        h1, h2, h3 = _unpack_hashes(fingerprint)
+        m = self.bits_per_hash
+        x, y, z = h1 % m, h2 % m, h3 % m
+        positions = []
+        for offset in xrange(0, m * self.hashes, m):
+            positions.append(offset + x)
+            x = (x + y) % m
+            y = (y + z) % m
+        return positions
+
+
+class ScalableBloomFilter(object):
+    """Bloom filter which grows as needed, by adding new (bigger) filters with
+    tighter error rates, so that the overall false positive rate stays below
+    error_rate regardless of the number of fingerprints added.
+
+    See "Scalable Bloom Filters" (Almeida et al, 2007).
+    """
+
+    growth = 2
+    tightening = 0.8
+
+    def __init__(self, error_rate=0.001, initial_capacity=100000):
+        self.error_rate = error_rate
+        self.initial_capacity = initial_capacity
+        self.filters = []
+
+    def add(self, fingerprint):
+        """Add the given fingerprint. Return True if it was (probably)
+        already added, or False otherwise"""
+        for f in self.filters[:-1]:
+            if fingerprint in f:
+                return True
+        if self.filters:
+            last = self.filters[-1]
+            if last.count < last.capacity:
+                return last.add(fingerprint)
+            if fingerprint in last:
+                return True
+        self._add_filter()
+        return self.filters[-1].add(fingerprint)
+
+    def __contains__(self, fingerprint):
+        for f in reversed(self.filters):
+            if fingerprint in f:
+                return True
+        return False
+
+    def __len__(self):
+        return sum(len(f) for f in self.filters)
+
+    def close(self):
+        pass
+
+    def _add_filter(self):
+        n = len(self.filters)
+        capacity = self.initial_capacity * self.growth ** n
+        # the error rates of the filters form a geometric series whose sum is
+        # error_rate
+        error_rate = self.error_rate * (1 - self.tightening) * self.tightening ** n
+        self.filters.append(BloomFilter(capacity, error_rate))
+
+
+class DiskFingerprintSet(object):
+    """Exact set of fingerprints which keeps the most recent ones (up to
+    batchsize) in memory and the rest in a file, sorted, where they're looked
+    up with a binary search. Batches are merged into the file when the memory
+    gets full.
+    """
+
+    def __init__(self, path, size=8, batchsize=100000):
+        self.path = path
+        self.size = size
+        self.batchsize = batchsize
+        self.batch = set()
+        if not os.path.exists(path):
+            open(path, 'wb').close()
+        self._open()
+
+    def add(self, fingerprint):
+        """Add the given fingerprint to the set. Return True if it was
+        already there, or False otherwise"""
+        key = fingerprint[:self.size]
+        if key in self.batch or self._ondisk(key):
+            return True
+        self.batch.add(key)
+        if len(self.batch) >= self.batchsize:
+            self.flush()
+        return False
+
+    def __contains__(self, fingerprint):
+        key = fingerprint[:self.size]
+        return key in self.batch or self._ondisk(key)
+
+    def __len__(self):
+        return self.disk_count + len(self.batch)
+
+    def flush(self):
+        """Merge the fingerprints kept in memory into the file"""
+        if not self.batch:
+            return
+        size = self.size
+        tmppath = self.path + '.tmp'
+        with open(tmppath, 'wb') as f:
+            # copy the file in blocks, inserting each new key in its place
+            pos = 0
+            for key in sorted(self.batch):
+                idx = self._bisect(key)
+                if idx > pos:
+                    f.write(self.map[pos*size:idx*size])
+                f.write(key)
+                pos = idx
+            if self.disk_count > pos:
+                f.write(self.map[pos*size:])
+        self._close()
+        os.rename(tmppath, self.path)
+        self.batch = set()
+        self._open()
+
+    def close(self, flush=True):
+        """Close the file, merging the fingerprints kept in memory into it
+        first, unless flush is False (when the file is going to be removed)"""
+        if flush:
+            self.flush()
+        self._close()
+
+    def _open(self):
+        self.file = open(self.path, 'rb')
+        self.disk_count = os.path.getsize(self.path) // self.size
+        self.map = None
+        if self.disk_count:
+            self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def _close(self):
+        if self.map is not None:
+            self.map.close()
+        self.file.close()
+
+    def _bisect(self, key):
+        """Return the index of the first key in the file which is greater or
+        equal than the given key"""
+        m, size = self.map, self.size
+        lo, hi = 0, self.disk_count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            pos = mid * size
+            if m[pos:pos+size] < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def _ondisk(self, key):
+        idx = self._bisect(key)
+        pos = idx * self.size
+        return idx < self.disk_count and self.map[pos:pos+self.size] == key
@@ -0,0 +1,170 @@
+"""
+File-like objects to read decompressed gzip, deflate and bz2 data from
+another file-like object
+"""
+
+import zlib
+
+
+def gunzip_file(fileobj):
+    """Return a file-like object to read the decompressed gzip data of
+    fileobj"""
+    return ZlibFile(fileobj, 16 + zlib.MAX_WBITS)
+
+def inflate_file(fileobj):
+    """Return a file-like object to read the decompressed deflate data of
+    fileobj (with or without the zlib header)"""
+    return ZlibFile(fileobj, zlib.MAX_WBITS)
+
+
+class ZlibFile(object):
+    """File-like object to read the data of fileobj decompressed with zlib,
+    without decompressing more than chunk_size bytes at once, so reading
+    small chunks of a decompression bomb doesn't expand it all.
+
+    wbits is the zlib.decompressobj() argument: with 16 + zlib.MAX_WBITS it
+    reads gzip data (all its members) and with zlib.MAX_WBITS deflate data,
+    with or without the zlib header. Invalid or truncated data raises
+    IOError.
+    """
+
+    def __init__(self, fileobj, wbits=zlib.MAX_WBITS, chunk_size=65536):
+        self.fileobj = fileobj
+        self.wbits = wbits
+        self.chunk_size = chunk_size
+        self.decompressor = zlib.decompressobj(wbits)
+        self.input = ''
+        self.output = ''
+        self.started = False
+        self.between_members = False
+        self.finished = False
+
+    def read(self, size=-1):
+        chunks = [self.output]
+        length = len(self.output)
+        while not self.finished and (size < 0 or length < size):
+            max_length = self.chunk_size if size < 0 else \
+                min(self.chunk_size, size - length)
+            chunk = self._decompress(max_length)
+            chunks.append(chunk)
+            length += len(chunk)
+        data = ''.join(chunks)
+        if 0 <= size < length:
+            # the data flushed at the end may be more than asked for
+            data, self.output = data[:size], data[size:]
+        else:
+            self.output = ''
+        return data
+
+    def _decompress(self, max_length):
+        if not self.input:
+            self.input = self.fileobj.read(self.chunk_size)
+            if not self.input:
+                self.finished = True
+                self._check_end()
+                return self.decompressor.flush()
+            while not self.started and len(self.input) < 2:
+                # the zlib header check needs its 2 bytes
+                data = self.fileobj.read(self.chunk_size)
+                if not data:
+                    break
+                self.input += data
+        if self.between_members:
+            # gzip files can be padded with zeroes
+            self.input = self.input.lstrip('\x00')
+            if not self.input:
+                return ''
+            self.between_members = False
+        data, self.input = self.input, ''
+        try:
+            try:
+                out = self.decompressor.decompress(data, max_length)
+            except zlib.error:
+                if self.started or self.wbits != zlib.MAX_WBITS:
+                    raise
+                # raw deflate data, without the zlib header, may be sent by
+                # microsoft servers. For more information, see:
+                # http://carsten.codimi.de/gzip.yaws/
+                # http://www.port80software.com/200ok/archive/2005/10/31/868.aspx
+                # http://www.gzip.org/zlib/zlib_faq.html#faq38
+                self.decompressor = zlib.decompressobj(-15)
+                out = self.decompressor.decompress(data, max_length)
+        except zlib.error, e:
+            raise IOError("Invalid compressed data: %s" % e)
+        self.started = True
+        self.input = self.decompressor.unconsumed_tail
+        if self.decompressor.unused_data:
+            # end of the compressed data, but gzip data can have more members
+            if self.wbits > zlib.MAX_WBITS:
+                self.input = self.decompressor.unused_data
+                self.decompressor = zlib.decompressobj(self.wbits)
+                self.between_members = True
+            else:
+                self.finished = True
+        return out
+
+    def _check_end(self):
+        if not self.started or self.between_members or \
+                self.decompressor.unused_data:
+            return
+        # the decompressor doesn't tell when it reaches the end of the data
+        # unless there's more data after it
+        probe = self.decompressor.copy()
+        try:
+            probe.decompress('\x00')
+        except zlib.error:
+            pass
+        if not probe.unused_data:
+            raise IOError("Compressed data ended before the end-of-stream " \
+                "marker was reached")
+
+    def close(self):
+        self.fileobj = None
+        self.input = self.output = ''
+
+
+class DecompressorFile(object):
+    """File-like object to read the data of fileobj decompressed by
+    decompressor, an object with a decompress() method like the ones returned
+    by bz2.BZ2Decompressor() (see ZlibFile for zlib data). Invalid or
+    truncated data raises IOError."""
+
+    def __init__(self, fileobj, decompressor, chunk_size=65536):
+        self.fileobj = fileobj
+        self.decompressor = decompressor
+        self.chunk_size = chunk_size
+        self.buffer = ''
+
+    def read(self, size=-1):
+        chunks = [self.buffer]
+        length = len(self.buffer)
+        while self.fileobj is not None and (size < 0 or length < size):
+            chunk = self._decompress()
+            chunks.append(chunk)
+            length += len(chunk)
+        data = ''.join(chunks)
+        if size < 0:
+            size = len(data)
+        self.buffer = data[size:]
+        return data[:size]
+
+    def _decompress(self):
+        data = self.fileobj.read(self.chunk_size)
+        if data:
+            return self.decompressor.decompress(data)
+        self.fileobj = None
+        flush = getattr(self.decompressor, 'flush', None)
+        if flush:
+            return flush()
+        # bz2 decompressors only refuse more data after the end-of-stream
+        # marker
+        try:
+            self.decompressor.decompress('')
+        except EOFError:
+            return ''
+        raise IOError("Compressed data ended before the end-of-stream " \
+            "marker was reached")
+
+    def close(self):
+        self.fileobj = None
+        self.buffer = ''
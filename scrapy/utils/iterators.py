@@ -1,11 +1,13 @@
-import re, csv
+import re, csv, codecs
+from copy import deepcopy
 from cStringIO import StringIO
 
-from scrapy.http import Response
+from scrapy.http import Response, TextResponse
 from scrapy.selector import XmlXPathSelector
 from scrapy import log
 from scrapy.utils.python import re_rsearch, str_to_unicode
 from scrapy.utils.response import body_or_str
+from scrapy.utils.encoding import encoding_exists
 
 
 def xmliter(obj, nodename):
@@ -16,10 +18,18 @@ def xmliter(obj, nodename):
     - a Response object
     - a unicode string
     - a string encoded as utf-8
+
+    The body of spooled responses is read in chunks, instead of being
+    loaded in memory.
     """
+    if isinstance(obj, Response) and obj.spooled:
+        return _xmliter_spooled(obj, nodename)
+    return _xmliter_text(body_or_str(obj), nodename)
+
+
+def _xmliter_text(text, nodename):
     HEADER_START_RE = re.compile(r'^(.*?)<\s*%s(?:\s|>)' % nodename, re.S)
     HEADER_END_RE = re.compile(r'<\s*/%s\s*>' % nodename, re.S)
-    text = body_or_str(obj)
 
     header_start = re.search(HEADER_START_RE, text)
     header_start = header_start.group(1).strip() if header_start else ''
@@ -32,6 +42,95 @@ def xmliter(obj, nodename):
         yield XmlXPathSelector(text=nodetext).select('//' + nodename)[0]
 
 
+def _xmliter_spooled(response, nodename, chunk_size=65536):
+    HEADER_START_RE = re.compile(r'^(.*?)<\s*%s(?:\s|>)' % nodename, re.S)
+    HEADER_END_RE = re.compile(r'<\s*/%s\s*>' % nodename, re.S)
+    encoding = response.encoding
+
+    # the document footer is taken from the tail of the body
+    f = response.open_body()
+    f.seek(0, 2)
+    f.seek(max(0, f.tell() - chunk_size))
+    tail = f.read().decode(encoding, 'scrapy_replace')
+    header_end = re_rsearch(HEADER_END_RE, tail)
+    header_end = tail[header_end[1]:].strip() if header_end else ''
+
+    r = re.compile(r"<%s[\s>].*?</%s>" % (nodename, nodename), re.DOTALL)
+    decoder = codecs.getincrementaldecoder(encoding)('scrapy_replace')
+    header_start = None
+    text = u''
+    for chunk in response.iter_body(chunk_size):
+        text += decoder.decode(chunk)
+        if header_start is None:
+            header_start = re.search(HEADER_START_RE, text)
+            if header_start is None:
+                continue
+            header_start = header_start.group(1).strip()
+        pos = 0
+        for match in r.finditer(text):
+            nodetext = header_start + match.group() + header_end
+            yield XmlXPathSelector(text=nodetext).select('//' + nodename)[0]
+            pos = match.end()
+        text = text[pos:]
+
+
+def xmliter_lxml(obj, nodename):
+    """Same as xmliter, but parsing the document incrementally with lxml
+    (iterparse) instead of using regular expressions. The body is read in
+    chunks (from its file, for spooled responses) and the nodes already
+    iterated are freed, so big feeds are parsed in constant memory.
+
+    Each node is yielded as an (lxml) XmlXPathSelector over a copy of it, so
+    it can still be used once the iteration goes on. nodename matches nodes
+    in any namespace, unless it has a prefix (like "g:item").
+    """
+    from lxml import etree
+    from scrapy.selector.lxmlsel import XmlXPathSelector as LxmlXPathSelector
+    if isinstance(obj, TextResponse):
+        # inferring the encoding would load the whole body, so only the
+        # declared one is used, otherwise lxml detects it by itself
+        chunks, encoding = obj.iter_body(), obj._declared_encoding()
+        if encoding and not encoding_exists(encoding):
+            encoding = None
+    elif isinstance(obj, Response):
+        chunks, encoding = obj.iter_body(), None
+    else:
+        chunks, encoding = [body_or_str(obj, unicode=False)], 'utf-8'
+    reader = _ChunksReader(chunks)
+    for _, node in etree.iterparse(reader, encoding=encoding):
+        name = node.tag.rsplit('}', 1)[-1]
+        if node.prefix and ':' in nodename:
+            name = '%s:%s' % (node.prefix, name)
+        if name != nodename:
+            continue
+        copy = deepcopy(node)
+        copy.tail = None
+        # free the node and the (already iterated) previous ones
+        node.clear()
+        while node.getprevious() is not None:
+            del node.getparent()[0]
+        yield LxmlXPathSelector(root=copy)
+
+
+class _ChunksReader(object):
+    """File-like object to read (with no size guarantees) the given chunks"""
+
+    def __init__(self, chunks):
+        self._chunks = iter(chunks)
+        self._started = False
+
+    def read(self, n=None):
+        for chunk in self._chunks:
+            if not self._started:
+                # the XML declaration must be at the very beginning
+                chunk = chunk.lstrip()
+                if not chunk:
+                    continue
+                self._started = True
+            return chunk
+        return ''
+
+
 def csviter(obj, delimiter=None, headers=None, encoding=None):
     """ Returns an iterator of dictionaries from the given csv object
 
@@ -49,7 +148,10 @@ def csviter(obj, delimiter=None, headers=None, encoding=None):
     def _getrow(csv_r):
         return [str_to_unicode(field, encoding) for field in csv_r.next()]
 
-    lines = StringIO(body_or_str(obj, unicode=False))
+    if isinstance(obj, Response) and obj.spooled:
+        lines = _iter_lines(obj.iter_body())
+    else:
+        lines = StringIO(body_or_str(obj, unicode=False))
     if delimiter:
         csv_r = csv.reader(lines, delimiter=delimiter)
     else:
@@ -66,3 +168,14 @@ def csviter(obj, delimiter=None, headers=None, encoding=None):
         else:
             yield dict(zip(headers, row))
 
+
+def _iter_lines(chunks):
+    """Split an iterable of str chunks into lines, keeping line endings"""
+    pending = ''
+    for chunk in chunks:
+        lines = (pending + chunk).split('\n')
+        pending = lines.pop()
+        for line in lines:
+            yield line + '\n'
+    if pending:
+        yield pending
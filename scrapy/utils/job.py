@@ -0,0 +1,18 @@
+"""
+Helper functions for crawl jobs which persist their state in a directory
+(JOBDIR setting), so that they can be stopped and resumed later.
+"""
+
+import os
+
+
+def job_dir(settings, spider):
+    """Return the directory where the given spider keeps its job state,
+    creating it if it doesn't exist, or None if JOBDIR is not set"""
+    path = settings['JOBDIR']
+    if not path:
+        return
+    path = os.path.join(path, spider.name)
+    if not os.path.exists(path):
+        os.makedirs(path)
+    return path
@@ -9,7 +9,7 @@ import fnmatch
 import pkgutil
 from shutil import copy2, copystat
 
-__all__ = ['cpu_count', 'copytree', 'ignore_patterns']
+__all__ = ['cpu_count', 'copytree', 'ignore_patterns', 'SpooledTemporaryFile']
 
 try:
     import multiprocessing
@@ -99,6 +99,15 @@ else:
         if errors:
             raise Error, errors
 
+try:
+    from tempfile import SpooledTemporaryFile
+except ImportError:
+    from tempfile import TemporaryFile
+
+    def SpooledTemporaryFile(max_size=0, *args, **kwargs):
+        # no in-memory spooling available, go straight to disk
+        return TemporaryFile(*args, **kwargs)
+
 try:
     import json
 except ImportError:
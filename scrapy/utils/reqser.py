@@ -0,0 +1,68 @@
+"""
+Helper functions for serializing (and deserializing) requests, so that they
+can be stored outside memory (on disk queues, for example). Callbacks and
+errbacks must be methods of the spider, as they're stored by name.
+"""
+
+from scrapy.http import Request
+from scrapy.utils.misc import load_object
+
+
+def request_to_dict(request, spider=None):
+    """Convert Request object to a dict. Raises ValueError if the request
+    callback or errback are not methods of the given spider.
+    """
+    d = {
+        'url': request.url, # urls are safe (str) already
+        'callback': _find_method(spider, request.callback),
+        'errback': _find_method(spider, request.errback),
+        'method': request.method,
+        'headers': dict(request.headers),
+        'body': request.body,
+        'cookies': request.cookies,
+        'meta': request._meta,
+        '_encoding': request._encoding,
+        'priority': request.priority,
+        'dont_filter': request.dont_filter,
+    }
+    if type(request) is not Request:
+        d['_class'] = '%s.%s' % (type(request).__module__, type(request).__name__)
+    return d
+
+
+def request_from_dict(d, spider=None):
+    """Create Request object from a dict built with request_to_dict(). The
+    callback and errback are looked up by name in the given spider.
+    """
+    cls = load_object(d['_class']) if '_class' in d else Request
+    return cls(
+        url=d['url'],
+        callback=_get_method(spider, d['callback']),
+        errback=_get_method(spider, d['errback']),
+        method=d['method'],
+        headers=d['headers'],
+        body=d['body'],
+        cookies=d['cookies'],
+        meta=d['meta'],
+        encoding=d['_encoding'],
+        priority=d['priority'],
+        dont_filter=d['dont_filter'])
+
+
+def _find_method(obj, func):
+    if func is None:
+        return None
+    if obj is not None and getattr(func, 'im_self', None) is obj:
+        name = func.im_func.__name__
+        if getattr(obj, name, None) == func:
+            return name
+    raise ValueError("Function %s is not a method of: %s" % (func, obj))
+
+
+def _get_method(obj, name):
+    if name is None:
+        return None
+    try:
+        return getattr(obj, name)
+    except AttributeError:
+        raise ValueError("Method %r not found in: %s" % (name, obj))
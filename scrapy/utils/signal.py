@@ -16,7 +16,8 @@ def send_catch_log(signal=Any, sender=Anonymous, *arguments, **named):
     dont_log = named.pop('dont_log', None)
     spider = named.get('spider', None)
     responses = []
-    for receiver in liveReceivers(getAllReceivers(sender, signal)):
+    # copy the receivers first, as handlers may disconnect some of them
+    for receiver in list(liveReceivers(getAllReceivers(sender, signal))):
         try:
             response = robustApply(receiver, signal=signal, sender=sender,
                 *arguments, **named)
@@ -48,7 +49,8 @@ def send_catch_log_deferred(signal=Any, sender=Anonymous, *arguments, **named):
     dont_log = named.pop('dont_log', None)
     spider = named.get('spider', None)
     dfds = []
-    for receiver in liveReceivers(getAllReceivers(sender, signal)):
+    # copy the receivers first, as handlers may disconnect some of them
+    for receiver in list(liveReceivers(getAllReceivers(sender, signal))):
         d = maybeDeferred(robustApply, receiver, signal=signal, sender=sender,
                 *arguments, **named)
         d.addErrback(logerror, receiver)
@@ -58,9 +60,17 @@ def send_catch_log_deferred(signal=Any, sender=Anonymous, *arguments, **named):
     d.addCallback(lambda out: [x[1] for x in out])
     return d
 
+def has_receivers(signal=Any, sender=Anonymous):
+    """Return True if any handler is connected to the given signal, so that
+    senders can skip building its arguments when nobody listens"""
+    for _ in liveReceivers(getAllReceivers(sender, signal)):
+        return True
+    return False
+
 def disconnect_all(signal=Any, sender=Any):
     """Disconnect all signal handlers. Useful for cleaning up after running
     tests
     """
-    for receiver in liveReceivers(getAllReceivers(sender, signal)):
+    # copy the receivers first, as disconnecting them alters the list
+    for receiver in list(liveReceivers(getAllReceivers(sender, signal))):
         disconnect(receiver, signal=signal, sender=sender)
@@ -11,6 +11,15 @@ import posixpath
 import cgi
 
 from scrapy.utils.python import unicode_to_str
+from scrapy.utils.datatypes import LruCache
+
+# maximum number of results kept by each of the caches of urljoin_rfc and
+# canonicalize_url, which are called several times for the same urls (for
+# example, the links found in all pages of a site)
+URL_CACHE_SIZE = 10000
+
+_urljoin_cache = LruCache(URL_CACHE_SIZE)
+_canonicalize_cache = LruCache(URL_CACHE_SIZE)
 
 def url_is_from_any_domain(url, domains):
     """Return True if the url belongs to any of the given domains"""
@@ -33,8 +42,34 @@ def urljoin_rfc(base, ref, encoding='utf-8'):
 
     Always returns a str.
     """
-    return urlparse.urljoin(unicode_to_str(base, encoding), \
+    key = (_urljoin_base(base, ref), ref, encoding)
+    url = _urljoin_cache.get(key)
+    if url is not None:
+        return url
+    url = urlparse.urljoin(unicode_to_str(base, encoding), \
         unicode_to_str(ref, encoding))
+    _urljoin_cache[key] = url
+    return url
+
+# the result of joining http(s) urls with some references depends only on a
+# part of the base url: its scheme (for absolute references), its scheme and
+# host (for absolute paths) or its directory, up to the last slash of the
+# path (for relative paths), so the results are cached by that part of the
+# base url, as the pages of a site contain the same links
+_http_base = re.compile(r'^(https?)(://[^/?#]*)(/[^?#]*/)?').match
+_absolute_ref = re.compile(r'^(?:https?:)?//[^/?#]').match
+_relative_path = re.compile(r'^[^/?#;:]+(?:[/?#]|$)').match
+
+def _urljoin_base(base, ref):
+    m = _http_base(base)
+    if m:
+        if _absolute_ref(ref):
+            return m.group(1)
+        elif ref[:1] == '/' and ref[1:2] != '/':
+            return m.group(1) + m.group(2)
+        elif m.group(3) and _relative_path(ref):
+            return m.group(0)
+    return base
 
 _reserved = ';/?:@&=+$|,#' # RFC 3986 (Generic Syntax)
 _unreserved_marks = "-_.!~*'()" # RFC 3986 sec 2.3
@@ -147,14 +182,48 @@ def canonicalize_url(url, keep_blank_values=True, keep_fragments=False, \
     For examples see the tests in scrapy.tests.test_utils_url
     """
 
-    url = unicode_to_str(url, encoding)
-    scheme, netloc, path, params, query, fragment = urlparse.urlparse(url)
-    keyvals = cgi.parse_qsl(query, keep_blank_values)
-    keyvals.sort()
-    query = urllib.urlencode(keyvals)
-    path = urllib.quote(urllib.unquote(path))
-    fragment = '' if not keep_fragments else fragment
-    return urlparse.urlunparse((scheme, netloc.lower(), path, params, query, fragment))
+    key = (url, keep_blank_values, keep_fragments, encoding)
+    canonical = _canonicalize_cache.get(key)
+    if canonical is not None:
+        return canonical
+    canonical = url = unicode_to_str(url, encoding)
+    m = _canonical_url(url)
+    if not m or not _is_canonical_query(m.group(1), keep_blank_values):
+        scheme, netloc, path, params, query, fragment = urlparse.urlparse(url)
+        # when the url matched, only its query needed to be canonicalized
+        if m or not _is_canonical_query(query, keep_blank_values):
+            keyvals = cgi.parse_qsl(query, keep_blank_values)
+            keyvals.sort()
+            query = urllib.urlencode(keyvals)
+        if not _canonical_path(path):
+            path = urllib.quote(urllib.unquote(path))
+        fragment = '' if not keep_fragments else fragment
+        canonical = urlparse.urlunparse((scheme, netloc.lower(), path, \
+            params, query, fragment))
+    _canonicalize_cache[key] = canonical
+    return canonical
+
+# paths and query arguments made only of these characters are left untouched
+# by canonicalize_url, so there's no need to unquote and quote them again.
+# Urls made of them (with a lowercase scheme and host, and without params or
+# fragment) are returned as they are, unless their query needs sorting
+_canonical_path = re.compile(r'^[a-zA-Z0-9_.\-/]*$').match
+_canonical_arg = re.compile(r'^[a-zA-Z0-9_.\-]+=[a-zA-Z0-9_.\-]*$').match
+_canonical_url = re.compile(r'^[a-z][a-z0-9+.\-]*://[a-z0-9.\-]+(?::[0-9]+)?' \
+    r'(?:/[a-zA-Z0-9_.\-/]*)?(?:\?([a-zA-Z0-9_.\-=&]+))?$').match
+
+def _is_canonical_query(query, keep_blank_values):
+    """Return True if canonicalize_url would return the given query unchanged:
+    its arguments are sorted and don't need to be quoted"""
+    if not query:
+        return True
+    args = query.split('&')
+    if not all(_canonical_arg(arg) for arg in args):
+        return False
+    keyvals = [arg.split('=') for arg in args]
+    if not keep_blank_values and not all(value for _, value in keyvals):
+        return False
+    return all(keyvals[i] <= keyvals[i + 1] for i in xrange(len(keyvals) - 1))
 
 def path_to_file_uri(path):
     """Convert local filesystem path to legal File URIs as described in: